@@ -0,0 +1,20 @@
+"""Compare wall time of simulations with and without ``--sim-coverage``.
+
+Run with ``pdm bench -k coverage``.
+"""
+
+import pytest
+
+
+@pytest.mark.parametrize("n,width,cycles", [(8, 8, 5000), (64, 32, 5000)])
+def test_coverage_overhead(counters, timed_run, n, width, cycles):
+    counters(n, width, cycles)
+
+    rows = []
+    for args in ([], ["--sim-coverage"], ["--vcds"]):
+        rows.append((" ".join(args) or "none", timed_run(*args)))
+
+    print(f"\n{n} x {width}-bit counters, {cycles} cycles")
+    print(f"{'options':>16} {'wall (s)':>10} {'overhead':>10}")
+    for (name, elapsed) in rows:
+        print(f"{name:>16} {elapsed:>10.3f} {elapsed / rows[0][1]:>9.2f}x")
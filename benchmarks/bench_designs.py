@@ -0,0 +1,99 @@
+# amaranth: UnusedElaboratable=no
+"""Simulator throughput of the example designs, and scaled-up versions.
+
+Run with ``pdm bench -k designs``. Compare the "simulation benchmarks"
+section of the terminal summary across amaranth/plugin versions.
+"""
+
+import pytest
+from amaranth import Elaboratable, Module, Signal
+
+from test_inject import Adder
+from test_mul import Mul
+from test_multiclk import Clocks
+
+
+CYCLES = 2000
+
+
+class MulArray(Elaboratable):
+    """``n`` registered multipliers fed from a shared counter."""
+
+    def __init__(self, n, width):
+        self.muls = [Mul(width) for _ in range(n)]
+        self.cnt = Signal(width)
+
+    def elaborate(self, plat):
+        m = Module()
+
+        m.d.sync += self.cnt.eq(self.cnt + 1)
+        for i, mul in enumerate(self.muls):
+            m.submodules[f"mul{i}"] = mul
+            m.d.comb += [mul.a.eq(self.cnt), mul.b.eq(self.cnt + i)]
+
+        return m
+
+
+class AdderChain(Elaboratable):
+    """``n`` registered adders, each adding its predecessor's output."""
+
+    def __init__(self, n, width):
+        self.adders = [Adder(width) for _ in range(n)]
+        self.a = Signal(width)
+
+    def elaborate(self, plat):
+        m = Module()
+
+        prev = self.a
+        for i, add in enumerate(self.adders):
+            m.submodules[f"add{i}"] = add
+            m.d.comb += [add.a.eq(prev), add.b.eq(i)]
+            prev = add.o
+
+        return m
+
+
+async def run_cycles(ctx):
+    await ctx.tick().repeat(CYCLES)
+
+
+@pytest.mark.parametrize("mod", [
+    pytest.param(Mul(4), id="mul4"),
+    pytest.param(Mul(32), id="mul32"),
+    pytest.param(MulArray(16, 16), id="mularray16x16"),
+    pytest.param(MulArray(64, 32), id="mularray64x32"),
+])
+@pytest.mark.parametrize("clks", [1.0 / 12e6])
+def test_mul_throughput(sim_benchmark, mod):
+    async def testbench(ctx):
+        for i in range(CYCLES):
+            ctx.set(mod.a, i)
+            ctx.set(mod.b, i + 1)
+            await ctx.tick()
+
+    tb = run_cycles if isinstance(mod, MulArray) else testbench
+    assert sim_benchmark.run(testbenches=[tb]).min > 0
+
+
+@pytest.mark.parametrize("mod", [
+    pytest.param(Adder(8), id="adder8"),
+    pytest.param(AdderChain(16, 16), id="adderchain16x16"),
+    pytest.param(AdderChain(128, 32), id="adderchain128x32"),
+])
+@pytest.mark.parametrize("clks", [1.0 / 12e6])
+def test_adder_throughput(sim_benchmark, mod):
+    assert sim_benchmark.run(testbenches=[run_cycles]).min > 0
+
+
+@pytest.mark.parametrize("mod", [Clocks(registered=False)])
+@pytest.mark.parametrize("clks", [{
+    "fast": 1 / 12.0e6,
+    "slow": 1 / 12.5e6
+}])
+def test_clocks_throughput(sim_benchmark, mod):
+    async def testbench(ctx):
+        for i in range(CYCLES):
+            ctx.set(mod.sel, i & 1)
+            await ctx.tick("fast")
+
+    assert sim_benchmark.run(testbenches=[testbench]).min > 0
@@ -0,0 +1,42 @@
+"""Measure what loading the plugin costs test suites which don't simulate.
+
+Run with ``pdm bench -k import``.
+"""
+
+import statistics
+import subprocess
+import sys
+import time
+
+
+ROUNDS = 10
+
+
+def import_time(*modules):
+    code = "; ".join(f"import {m}" for m in modules)
+    samples = []
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", code], check=True)
+        samples.append(time.perf_counter() - start)
+    return min(samples), statistics.median(samples)
+
+
+def test_import_plugin():
+    rows = [(name, *import_time(*modules)) for (name, modules) in (
+        ("pytest", ["pytest"]),
+        ("pytest+plugin", ["pytest", "pytest_amaranth_sim.plugin"]),
+        ("amaranth.sim", ["amaranth.sim"]),
+    )]
+
+    print(f"\nstartup, {ROUNDS} rounds")
+    print(f"{'import':>14} {'min (s)':>10} {'median (s)':>12}")
+    for (name, best, median) in rows:
+        print(f"{name:>14} {best:>10.3f} {median:>12.3f}")
+
+    # Loading the plugin must not import amaranth.
+    out = subprocess.run(
+        [sys.executable, "-c", "import sys, pytest_amaranth_sim.plugin; "
+                               "print('amaranth' in sys.modules)"],
+        check=True, capture_output=True, text=True).stdout
+    assert out.strip() == "False"
@@ -0,0 +1,76 @@
+"""Compare peak memory of ``sim.run_stream()`` and ``sim.run_mapped()``.
+
+Run with ``pdm bench -k mapped``.
+"""
+
+import importlib.util
+import pytest
+
+
+DESIGN = """
+# amaranth: UnusedElaboratable=no
+import resource
+import numpy as np
+import pytest
+from amaranth import Elaboratable, Module, Signal
+
+
+class Mul(Elaboratable):
+    def __init__(self):
+        self.a = Signal(16)
+        self.b = Signal(16)
+        self.o = Signal(32)
+
+    def elaborate(self, plat):
+        m = Module()
+        m.d.sync += self.o.eq(self.a * self.b)
+        return m
+
+
+def stimulus(sim, mod, path):
+    stim = np.memmap(path, dtype=sim.record_dtype([mod.a, mod.b]),
+                     mode="w+", shape=({cycles},))
+    stim["a"] = np.arange({cycles}) % 65536
+    stim["b"] = np.arange({cycles}) // 7 % 65536
+    stim.flush()
+    return stim
+
+
+@pytest.mark.parametrize("mod,clks", [(Mul(), 1.0 / 12e6)])
+def test_{method}(sim, mod, tmp_path):
+    stim = stimulus(sim, mod, tmp_path / "in.bin")
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if "{method}" == "stream":
+        sim.run_stream([mod.o], inputs=[(mod.a, np.array(stim["a"])),
+                                        (mod.b, np.array(stim["b"]))])
+    else:
+        sim.run_mapped(inputs=[mod.a, mod.b], stimulus=tmp_path / "in.bin",
+                       outputs=[mod.o], response=tmp_path / "out.bin")
+    after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(f"\\npeak rss growth: {{(after - before) / 1024:.1f}} MiB")
+"""
+
+
+@pytest.mark.parametrize("cycles", [50_000, 200_000])
+def test_mapped_memory(pytester, cycles):
+    # Don't import numpy here; pytester would unload it after the first
+    # parameter, and it can't be imported twice.
+    if importlib.util.find_spec("numpy") is None:
+        pytest.skip("numpy is not installed")
+
+    rows = []
+    for method in ("stream", "mapped"):
+        pytester.makepyfile(**{f"test_{method}": DESIGN.format(
+            method=method, cycles=cycles)})
+        # A fresh process per method, so that peak memory isn't shared.
+        result = pytester.runpytest_subprocess(f"test_{method}.py", "-q",
+                                               "-s")
+        result.assert_outcomes(passed=1)
+        line = next(line for line in result.outlines
+                    if line.startswith("peak rss growth"))
+        rows.append((method, line.split(": ")[1]))
+
+    print(f"\n{cycles} cycles")
+    print(f"{'method':>8} {'peak rss growth':>16}")
+    for (method, growth) in rows:
+        print(f"{method:>8} {growth:>16}")
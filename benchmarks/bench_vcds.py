@@ -0,0 +1,26 @@
+"""Compare written bytes and wall time of each ``--vcds`` format.
+
+Run with ``pdm bench -k vcds``.
+"""
+
+import pytest
+
+
+@pytest.mark.parametrize("n,width,cycles", [(8, 8, 5000), (64, 32, 5000)])
+def test_vcds_formats(pytester, counters, timed_run, n, width, cycles):
+    counters(n, width, cycles)
+
+    rows = []
+    for fmt in ("none", "vcd", "gz"):
+        args = [] if fmt == "none" else [f"--vcds-format={fmt}"]
+        for f in pytester.path.glob("*.vcd*"):
+            f.unlink()
+
+        elapsed = timed_run(*args)
+        size = sum(f.stat().st_size for f in pytester.path.glob("*.vcd*"))
+        rows.append((fmt, size, elapsed))
+
+    print(f"\n{n} x {width}-bit counters, {cycles} cycles")
+    print(f"{'format':>8} {'bytes':>12} {'wall (s)':>10}")
+    for (fmt, size, elapsed) in rows:
+        print(f"{fmt:>8} {size:>12} {elapsed:>10.3f}")
@@ -0,0 +1,77 @@
+"""Conftest file for benchmarks.
+
+Benchmarks are not part of the main test suite; run them with ``pdm bench``.
+"""
+
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+# Benchmarks drive pytest via pytester, or use the designs in examples/.
+pytest_plugins = "pytester"
+sys.path.insert(0, str(Path(__file__).parent.parent / "examples"))
+
+
+COUNTERS = """
+# amaranth: UnusedElaboratable=no
+import pytest
+from amaranth import Elaboratable, Module, Signal
+
+
+class Counters(Elaboratable):
+    def __init__(self, n, width):
+        self.cnts = [Signal(width, name=f"cnt{{i}}") for i in range(n)]
+
+    def elaborate(self, plat):
+        m = Module()
+        for i, c in enumerate(self.cnts):
+            m.d.sync += c.eq(c + i + 1)
+        return m
+
+
+@pytest.mark.parametrize("mod,clks", [(Counters({n}, {width}), 1.0 / 12e6)])
+def test_counters(sim):
+    async def testbench(ctx):
+        await ctx.tick().repeat({cycles})
+
+    sim.run(testbenches=[testbench])
+"""
+
+
+@pytest.fixture
+def counters(pytester):
+    """Write a test simulating ``n`` free-running counters.
+
+    Returns
+    -------
+    Callable[[int, int, int], None]
+        Takes the number of counters, their width, and the number of cycles
+        to simulate.
+    """
+    def make(n, width, cycles):
+        pytester.makepyfile(test_counters=COUNTERS.format(n=n, width=width,
+                                                          cycles=cycles))
+
+    return make
+
+
+@pytest.fixture
+def timed_run(pytester):
+    """Run the pytester tests in-process and time them.
+
+    Returns
+    -------
+    Callable[..., float]
+        Takes pytest's arguments, checks that exactly one test passed, and
+        returns the wall time in seconds.
+    """
+    def run(*args):
+        start = time.perf_counter()
+        result = pytester.runpytest_inprocess("-q", *args)
+        elapsed = time.perf_counter() - start
+        result.assert_outcomes(passed=1)
+        return elapsed
+
+    return run
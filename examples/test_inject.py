@@ -40,3 +40,21 @@ def testbench(mod, a, b, o):
 @pytest.mark.parametrize("clks", [1.0 / 12e6])
 def test_inject_direct(sim, testbench):
     sim.run(testbenches=[testbench], processes=[])
+
+
+async def adder_vector(sim, mod, a, b, o):
+    sim.set(mod.a, a)
+    sim.set(mod.b, b)
+    await sim.tick()
+    assert sim.get(mod.o) == o
+
+
+@pytest.mark.parametrize("mod", [Adder(4), Adder(8)])
+@pytest.mark.parametrize("clks", [1.0 / 12e6])
+def test_inject_vectors(sim, mod):
+    vectors = [(a, b, a + b) for a in range(16) for b in range(16)]
+
+    async def testbench(sim, a, b, o):
+        await adder_vector(sim, mod, a, b, o)
+
+    sim.run_vectors("a,b,o", vectors, testbench)
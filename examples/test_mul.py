@@ -120,8 +120,11 @@ def test_alternate_width_and_inputs(sim, mul_tb):
 
 @pytest.mark.parametrize(
     "mod,expectation", [
-        pytest.param(Mul(registered=True), does_not_raise(),
-                     marks=pytest.mark.skip(reason="infinitely loops"),
+        # Without a clock, awaiting a tick never returns. The deadline turns
+        # what would be an infinite loop into a test failure.
+        pytest.param(Mul(registered=True),
+                     pytest.raises(pytest.fail.Exception, match="stalled"),
+                     marks=pytest.mark.sim_deadline(wall=10),
                      id="reg-mul"),
         (Mul(registered=False), does_not_raise())
     ], ids=case_ids)
@@ -1,7 +1,10 @@
 """Amaranth simulator pytest plugin."""
 
-from ._marker import Testbench
+from ._marker import Design, Testbench
+from ._metrics import BenchmarkResult, SimMetrics
+from ._vcd import VCDIndex
 
-__all__ = ["Testbench"]
+__all__ = ["Testbench", "Design", "SimMetrics", "BenchmarkResult",
+           "VCDIndex"]
 __doc__ = ""  # Hide from Sphinx docs while making pydocstyle happy... I
 # don't think it looks nice in the docs.
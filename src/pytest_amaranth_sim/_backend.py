@@ -0,0 +1,107 @@
+"""Selection of the simulation engine for the ``sim_backend`` option."""
+
+import importlib
+import sys
+import warnings
+
+import pytest
+
+
+#: Entry point group third-party packages use to provide engines by name.
+ENTRY_POINT_GROUP = "pytest_amaranth_sim.engines"
+
+
+def _entry_points():
+    from importlib import metadata
+
+    eps = metadata.entry_points()
+    if sys.version_info >= (3, 10):
+        return eps.select(group=ENTRY_POINT_GROUP)
+    return eps.get(ENTRY_POINT_GROUP, [])
+
+
+def _load(spec):
+    module, _, attr = spec.partition(":")
+    try:
+        engine = importlib.import_module(module)
+        for part in attr.split("."):
+            engine = getattr(engine, part)
+    except (ImportError, AttributeError) as e:
+        raise pytest.UsageError(f"can't load sim_backend {spec!r}: {e}")
+    return engine
+
+
+def resolve(name):
+    """Find the engine to pass to :class:`~amaranth.sim.Simulator`.
+
+    Parameters
+    ----------
+    name: str
+        ``"pysim"``, the name of an engine registered in the
+        ``pytest_amaranth_sim.engines`` entry point group (such as
+        ``"cxxrtl"``), or ``"module:Class"``.
+
+    Returns
+    -------
+    type
+        A :class:`~amaranth.sim._base.BaseEngine` subclass.
+
+    Raises
+    ------
+    :exception:`pytest.UsageError`
+        If no engine with the given name is installed, or a
+        ``"module:Class"`` engine can't be imported, or isn't an engine.
+    """  # noqa: DOC501, DOC502
+    from amaranth.sim._base import BaseEngine
+    from amaranth.sim.pysim import PySimEngine
+
+    name = name.strip()
+    if name == "pysim":
+        return PySimEngine
+
+    if ":" in name:
+        engine = _load(name)
+    else:
+        for ep in _entry_points():
+            if ep.name == name:
+                engine = ep.load()
+                break
+        else:
+            # Running everything on pysim instead would hide a typo.
+            raise pytest.UsageError(
+                f"no simulation engine named {name!r} is installed; use "
+                f"pysim, an engine registered in the {ENTRY_POINT_GROUP} "
+                "entry point group, or module:Class")
+
+    if not (isinstance(engine, type) and issubclass(engine, BaseEngine)):
+        raise pytest.UsageError(f"sim_backend {name!r} is not an amaranth "
+                                "simulation engine")
+    return engine
+
+
+def fallback(engine, name, features):
+    """Fall back to pysim if features that need pysim are in use.
+
+    Parameters
+    ----------
+    engine: type
+        Engine returned by :func:`resolve`.
+    name: str
+        Name the engine was selected by, for the warning.
+    features: list of str
+        Features in use which rely on internals of pysim.
+
+    Returns
+    -------
+    type
+        ``engine``, or :class:`~amaranth.sim.pysim.PySimEngine`.
+    """
+    from amaranth.sim.pysim import PySimEngine
+
+    if issubclass(engine, PySimEngine) or not features:
+        return engine
+
+    warnings.warn(pytest.PytestWarning(
+        f"{', '.join(features)} require(s) pysim; falling back from "
+        f"sim_backend {name!r}"))
+    return PySimEngine
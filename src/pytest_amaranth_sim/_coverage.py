@@ -0,0 +1,317 @@
+"""Toggle and FSM state coverage for ``--sim-coverage``."""
+
+import json
+import os
+import tempfile
+
+
+#: Version of the coverage report file format.
+FORMAT_VERSION = 1
+
+
+def _design_name(mod):
+    cls = type(mod)
+    return f"{cls.__module__}.{cls.__qualname__}"
+
+
+def _fsm_states(signal):
+    # m.FSM() state signals decode state numbers as "NAME/number", looking
+    # the name up in a dict of the FSM's encoded states. Take the states from
+    # that dict instead of decoding every value of the signal, which may be
+    # wide.
+    decoder = signal._decoder
+    if decoder is None or not signal.name.endswith("_state"):
+        return None
+
+    decoding = None
+    for cell in getattr(decoder, "__closure__", None) or ():
+        try:
+            contents = cell.cell_contents
+        except ValueError:
+            continue
+        if isinstance(contents, dict):
+            decoding = contents
+    if not decoding or sorted(decoding) != list(range(len(decoding))):
+        return None
+
+    states = [decoding[n] for n in range(len(decoding))]
+    for (n, state) in enumerate(states):
+        if decoder(n) != f"{state}/{n}":
+            return None
+    return states
+
+
+class CoverageObserver:
+    """Record which bits of every signal toggled, and which FSM states ran.
+
+    The observer poses as a VCD writer of a pysim engine, so it's told about
+    every signal that changed in each delta cycle, without pysim evaluating
+    anything extra. Each signal's coverage is kept as integer bitsets of bits
+    which rose and which fell.
+
+    Parameters
+    ----------
+    sim: ~amaranth.sim.Simulator
+        The simulator.
+    mod: Elaboratable
+        The simulated design, which names the coverage data.
+    """
+
+    # Read by pysim for each "VCD writer".
+    fs_per_delta = 0
+
+    def __init__(self, sim, mod):
+        self.engine = sim._engine
+        self.design = _design_name(mod)
+        state = self.engine._state
+
+        names = []
+        for fragment_info in self.engine._design.fragments.values():
+            for (signal, name) in fragment_info.signal_names.items():
+                names.append((".".join((*fragment_info.name, name)), signal))
+
+        # Signals are unhashable, so index them by id(). A signal with several
+        # names (e.g. a port) is recorded under its shortest name. Each entry
+        # is [slot, mask, previous value, rose, fell, visited FSM states or
+        # None], updated in place to keep update_signal() cheap.
+        self.index = {}
+        self.names = []
+        self.fsm_states = []
+        for (name, signal) in sorted(names, key=lambda n: (len(n[0]), n[0])):
+            if id(signal) in self.index:
+                continue
+            slot = state.slots[state.get_signal(signal)]
+            mask = (1 << len(signal)) - 1
+            value = slot.curr & mask
+            states = _fsm_states(signal)
+            self.index[id(signal)] = [slot, mask, value, 0, 0,
+                                      None if states is None else 1 << value]
+            self.names.append(name)
+            self.fsm_states.append(states)
+
+    def attach(self):
+        """Start recording."""
+        self.engine._vcd_writers.insert(0, self)
+
+    def detach(self):
+        """Stop recording."""
+        self.engine._vcd_writers.remove(self)
+
+    def update_signal(self, timestamp, signal):
+        """Record a change of ``signal``; called by pysim.
+
+        Parameters
+        ----------
+        timestamp: int
+            Simulated time in femtoseconds.
+        signal: ~amaranth.hdl.Signal
+            Signal which changed.
+        """
+        entry = self.index.get(id(signal))
+        if entry is None:
+            return
+
+        prev = entry[2]
+        value = entry[0].curr & entry[1]
+        entry[2] = value
+        entry[3] |= value & ~prev
+        entry[4] |= prev & ~value
+        if entry[5] is not None:
+            entry[5] |= 1 << value
+
+    def update_memory(self, timestamp, memory, addr):
+        """Ignore memory writes; called by pysim.
+
+        Parameters
+        ----------
+        timestamp: int
+            Simulated time in femtoseconds.
+        memory: ~amaranth.hdl.MemoryData
+            Memory written to.
+        addr: int
+            Address written to.
+        """
+
+    def to_json(self):
+        """Convert to the JSON-compatible format of the report file.
+
+        Returns
+        -------
+        dict
+        """
+        toggle = {}
+        fsm = {}
+        for (name, states, (_, mask, _, rose, fell, visited)) in zip(
+                self.names, self.fsm_states, self.index.values()):
+            toggle[name] = {"width": mask.bit_length(), "rose": hex(rose),
+                            "fell": hex(fell)}
+            if states is not None:
+                fsm[name] = {"states": states, "visited": hex(visited)}
+        return {self.design: {"toggle": toggle, "fsm": fsm}}
+
+
+def merge(into, data):
+    """Merge coverage ``data`` into ``into``, both in report format.
+
+    Bitsets are OR-ed together. If a signal's width differs between the two,
+    e.g. for differently parameterized instances of the same design, the
+    wider width is kept.
+
+    Parameters
+    ----------
+    into: dict
+        Coverage to update.
+    data: dict
+        Coverage to merge.
+
+    Returns
+    -------
+    dict
+        ``into``.
+    """
+    for (design, cov) in data.items():
+        merged = into.setdefault(design, {"toggle": {}, "fsm": {}})
+        for (name, sig) in cov["toggle"].items():
+            old = merged["toggle"].get(name)
+            if old is None:
+                merged["toggle"][name] = dict(sig)
+                continue
+            old["width"] = max(old["width"], sig["width"])
+            for key in ("rose", "fell"):
+                old[key] = hex(int(old[key], 16) | int(sig[key], 16))
+        for (name, fsm) in cov["fsm"].items():
+            old = merged["fsm"].get(name)
+            if old is None:
+                merged["fsm"][name] = dict(fsm)
+                continue
+            if len(fsm["states"]) > len(old["states"]):
+                old["states"] = fsm["states"]
+            old["visited"] = hex(int(old["visited"], 16) |
+                                 int(fsm["visited"], 16))
+    return into
+
+
+def load(path):
+    """Load a report file, if it exists.
+
+    Parameters
+    ----------
+    path: str
+        Report file.
+
+    Returns
+    -------
+    dict
+        Coverage by design; empty if there's no file, or its format is from
+        another version.
+    """
+    try:
+        with open(path) as fp:
+            report = json.load(fp)
+    except FileNotFoundError:
+        return {}
+    if report.get("version") != FORMAT_VERSION:
+        return {}
+    return report["designs"]
+
+
+def dump(path, designs):
+    """Atomically write a report file.
+
+    Parameters
+    ----------
+    path: str
+        Report file.
+    designs: dict
+        Coverage by design.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    with os.fdopen(fd, "w") as fp:
+        json.dump({"version": FORMAT_VERSION, "designs": designs}, fp,
+                  indent=1, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def totals(designs):
+    """Count covered and total toggle bits and FSM states.
+
+    A bit counts as toggled once it both rose and fell.
+
+    Parameters
+    ----------
+    designs: dict
+        Coverage by design.
+
+    Returns
+    -------
+    tuple of int
+        Toggled bits, total bits, visited states, total states.
+    """
+    toggled = bits = visited = states = 0
+    for cov in designs.values():
+        for sig in cov["toggle"].values():
+            both = int(sig["rose"], 16) & int(sig["fell"], 16)
+            toggled += bin(both).count("1")
+            bits += sig["width"]
+        for fsm in cov["fsm"].values():
+            visited += bin(int(fsm["visited"], 16)).count("1")
+            states += len(fsm["states"])
+    return (toggled, bits, visited, states)
+
+
+def summarize(terminalreporter, designs, path):
+    """Write the ``--sim-coverage`` section of the terminal summary.
+
+    Parameters
+    ----------
+    terminalreporter: ~_pytest.terminal.TerminalReporter
+        The terminal reporter passed to ``pytest_terminal_summary``.
+    designs: dict
+        Coverage by design, merged with earlier sessions.
+    path: str
+        Report file.
+    """
+    terminalreporter.write_sep("=", "simulation coverage")
+    for (design, cov) in sorted(designs.items()):
+        (toggled, bits, visited, states) = totals({design: cov})
+        line = f"{design}: {toggled}/{bits} bits toggled"
+        if states:
+            line += f", {visited}/{states} FSM states"
+        terminalreporter.write_line(line)
+    terminalreporter.write_line(f"coverage written to {path}")
+
+
+class CoverageReport:
+    """Plugin merging the coverage of every test into the report file.
+
+    Under pytest-xdist, coverage arrives with each test's report from the
+    workers, and only the controller writes the file.
+
+    Parameters
+    ----------
+    config: ~_pytest.config.Config
+        The :mod:`pytest` config.
+    path: str
+        Report file. Coverage already in it is kept.
+    """
+
+    def __init__(self, config, path):
+        self.config = config
+        self.path = path
+        self.designs = {}
+
+    def pytest_runtest_logreport(self, report):
+        cov = getattr(report, "sim_coverage", None)
+        if cov is not None:
+            merge(self.designs, cov)
+
+    def pytest_sessionfinish(self, session):
+        if hasattr(self.config, "workerinput") or not self.designs:
+            return
+        self.designs = merge(load(self.path), self.designs)
+        dump(self.path, self.designs)
+
+    def pytest_terminal_summary(self, terminalreporter):
+        if self.designs and not hasattr(self.config, "workerinput"):
+            summarize(terminalreporter, self.designs, self.path)
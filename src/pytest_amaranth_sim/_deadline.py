@@ -0,0 +1,108 @@
+"""Simulated-time and wall-clock limits for ``SimulatorFixture.run``."""
+
+from time import perf_counter
+
+import pytest
+
+from ._profile import in_amaranth
+
+
+def _waiting_frame(coro):
+    # Follow the chain of awaited coroutines/generators down to the innermost
+    # frame that isn't part of amaranth itself.
+    frame = None
+    while coro is not None:
+        f = (getattr(coro, "cr_frame", None) or
+             getattr(coro, "gi_frame", None) or
+             getattr(coro, "ag_frame", None))
+        if f is not None and not in_amaranth(f.f_code.co_filename):
+            frame = f
+        coro = (getattr(coro, "cr_await", None) or
+                getattr(coro, "gi_yieldfrom", None) or
+                getattr(coro, "ag_await", None))
+    return frame
+
+
+def _stalled(engine, timeline):
+    # Time can't advance, no trigger is about to wake anything up, and
+    # nothing (e.g. a clock) is ready to run in the next step.
+    return not (timeline.wakers or engine._active_triggers or
+                any(p.runnable for p in engine._processes) or
+                any(t.runnable for t in engine._testbenches))
+
+
+def describe_waiting(sim):
+    """Describe where each unfinished testbench and process is waiting.
+
+    Parameters
+    ----------
+    sim: ~amaranth.sim.Simulator
+        The simulator.
+
+    Returns
+    -------
+    list of str
+    """
+    engine = sim._engine
+    lines = []
+    for (kind, procs) in (("testbench", engine._testbenches),
+                          ("process", engine._processes)):
+        for proc in procs:
+            coro = getattr(proc, "coroutine", None)
+            if coro is None:
+                continue
+
+            frame = _waiting_frame(coro)
+            if frame is None:
+                where = getattr(proc.constructor, "__qualname__", "?")
+            else:
+                where = (f"{frame.f_code.co_name} "
+                         f"({frame.f_code.co_filename}:{frame.f_lineno})")
+            status = "critical" if proc.critical else "background"
+            lines.append(f"  {kind} {where} [{status}]")
+    return lines
+
+
+def run_with_deadline(sim, time_fs=None, wall=None):
+    """Run a simulation like :meth:`~amaranth.sim.Simulator.run`, with limits.
+
+    The test fails if simulated time passes ``time_fs`` femtoseconds, if more
+    than ``wall`` seconds pass, or if the simulation can't make progress
+    because nothing is scheduled while critical testbenches/processes are
+    still waiting (e.g. awaiting the clock of a module without clocks).
+
+    Limits are checked between simulation steps, so a testbench which never
+    awaits anything (e.g. an endless loop of plain Python code) can't be
+    stopped.
+
+    Parameters
+    ----------
+    sim: ~amaranth.sim.Simulator
+        The simulator.
+    time_fs: None or int
+        Simulated time limit in femtoseconds.
+    wall: None or float
+        Wall-clock limit in seconds.
+    """
+    engine = sim._engine
+    timeline = engine._state.timeline
+    wall_end = None if wall is None else perf_counter() + wall
+
+    # Reading the clock costs far less than a step, and a single step can
+    # take arbitrarily long, so the wall clock is checked after every step.
+    while sim.advance():
+        reason = None
+        if time_fs is not None and engine.now > time_fs:
+            reason = (f"simulated time {engine.now} fs exceeds deadline of "
+                      f"{time_fs} fs")
+        elif _stalled(engine, timeline):
+            reason = (f"simulation stalled at {engine.now} fs; nothing is "
+                      "scheduled")
+        elif wall_end is not None and perf_counter() > wall_end:
+            reason = (f"wall-clock deadline of {wall} s exceeded at "
+                      f"{engine.now} fs")
+
+        if reason is not None:
+            pytest.fail("\n".join([reason, "waiting:",
+                                   *describe_waiting(sim)]),
+                        pytrace=False)
@@ -0,0 +1,140 @@
+"""On-disk cache of the Python code that pysim compiles designs into."""
+
+import hashlib
+import importlib.util
+import marshal
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+
+
+class CompileCache:
+    """Content-addressed cache of bytecode for pysim's generated code.
+
+    :class:`~amaranth.sim.Simulator` translates each clock domain of each
+    fragment into Python source and compiles it. Entries are keyed on a hash
+    of that source, the Amaranth version, and the bytecode format, so a stale
+    entry can never be used for a different design. Least recently used
+    entries are evicted by :meth:`evict` once the cache exceeds ``max_bytes``.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _key(self, source, filename):
+        import amaranth
+
+        h = hashlib.sha256()
+        for part in (amaranth.__version__, filename, source):
+            h.update(part.encode())
+            h.update(b"\0")
+        h.update(importlib.util.MAGIC_NUMBER)
+        return h.hexdigest()
+
+    def compile(self, source, filename, mode, *args, **kwargs):
+        """Drop-in replacement for :func:`compile` which consults the cache.
+
+        Parameters
+        ----------
+        source: str
+            Python source.
+        filename: str
+            Filename for tracebacks.
+        mode: str
+            Compilation mode.
+        *args
+            Passed to :func:`compile`.
+        **kwargs
+            Passed to :func:`compile`.
+
+        Returns
+        -------
+        code
+        """
+        if not isinstance(source, str) or args or kwargs:
+            return compile(source, filename, mode, *args, **kwargs)
+
+        path = os.path.join(self.directory,
+                            self._key(source, filename) + ".bin")
+        try:
+            with open(path, "rb") as fp:
+                code = marshal.load(fp)
+        except (OSError, EOFError, ValueError, TypeError):
+            pass
+        else:
+            self.hits += 1
+            # Mark as recently used.
+            os.utime(path)
+            return code
+
+        self.misses += 1
+        code = compile(source, filename, mode)
+        # Write and rename, so that concurrent pytest-xdist workers never see
+        # a partial entry.
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as fp:
+            marshal.dump(code, fp)
+        os.replace(tmp, path)
+        return code
+
+    def evict(self):
+        """Delete least recently used entries until under ``max_bytes``."""
+        entries = []
+        for entry in os.scandir(self.directory):
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total = sum(size for (_, size, _) in entries)
+        for (_, size, path) in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+
+@contextmanager
+def compiling_with(cache):
+    """Use ``cache`` when pysim compiles designs inside this context.
+
+    Parameters
+    ----------
+    cache: None or CompileCache
+        The cache; if ``None``, this context manager does nothing.
+
+    Yields
+    ------
+    None
+    """
+    if cache is None:
+        yield
+        return
+
+    from amaranth.sim import _pyrtl
+
+    _pyrtl.compile = cache.compile
+    try:
+        yield
+    finally:
+        del _pyrtl.compile
+
+
+def clear(directory):
+    """Delete the cache directory.
+
+    Parameters
+    ----------
+    directory: str
+        The cache directory.
+    """
+    shutil.rmtree(directory, ignore_errors=True)
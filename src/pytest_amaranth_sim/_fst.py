@@ -0,0 +1,194 @@
+"""FST waveforms for ``--vcds-format=fst``, written with pylibfst."""
+
+from contextlib import contextmanager
+
+import pytest
+
+
+def import_pylibfst():
+    """Import :mod:`pylibfst`, which is an optional dependency.
+
+    Returns
+    -------
+    module
+
+    Raises
+    ------
+    :exception:`pytest.UsageError`
+        If :mod:`pylibfst` is not installed.
+    """  # noqa: DOC501, DOC502
+    try:
+        import pylibfst
+    except ImportError:
+        raise pytest.UsageError("--vcds-format=fst requires pylibfst; "
+                                "install pytest-amaranth-sim[fst]") from None
+    return pylibfst
+
+
+class FSTWriter:
+    """Write every named signal of a pysim simulation to an FST file.
+
+    Like the observer of ``--sim-coverage``, the writer poses as a VCD
+    writer of the engine, and is told about each changed signal. Values are
+    written straight into libfst's compressed blocks, without going through
+    VCD text. Signals are grouped in scopes like in Amaranth's VCD files;
+    decoded values (e.g. FSM state names) are written as plain numbers.
+
+    Parameters
+    ----------
+    sim: ~amaranth.sim.Simulator
+        The simulator.
+    fst_name: str
+        FST file to write.
+    gtkw_name: str
+        GTKWave savefile to write when closing, referencing ``fst_name``.
+    """
+
+    # Read by pysim for each "VCD writer".
+    fs_per_delta = 0
+
+    def __init__(self, sim, fst_name, gtkw_name):
+        pylibfst = import_pylibfst()
+        self.lib = pylibfst.lib
+        self.ffi = pylibfst.ffi
+        self.engine = sim._engine
+        self.fst_name = fst_name
+        self.gtkw_name = gtkw_name
+
+        self.ctx = self.lib.fstWriterCreate(fst_name.encode(), 1)
+        if self.ctx == self.ffi.NULL:
+            raise OSError(f"can't create {fst_name}")
+        self.lib.fstWriterSetTimescale(self.ctx, -15)
+
+        state = self.engine._state
+        scopes = {}
+        for fragment_info in self.engine._design.fragments.values():
+            signals = scopes.setdefault(("bench", *fragment_info.name), [])
+            signals.extend((name, signal) for (signal, name) in
+                           fragment_info.signal_names.items())
+
+        # Signals are unhashable, so index them by id(). A signal with several
+        # names (e.g. a port) gets aliases of the first variable.
+        self.vars = {}
+        opened = ()
+        for path in sorted(scopes):
+            common = 0
+            while common < min(len(opened), len(path)) and \
+                    opened[common] == path[common]:
+                common += 1
+            for _ in opened[common:]:
+                self.lib.fstWriterSetUpscope(self.ctx)
+            for name in path[common:]:
+                self.lib.fstWriterSetScope(self.ctx,
+                                           self.lib.FST_ST_VCD_MODULE,
+                                           name.encode(), self.ffi.NULL)
+            opened = path
+
+            for (name, signal) in sorted(scopes[path], key=lambda s: s[0]):
+                entry = self.vars.get(id(signal))
+                handle = self.lib.fstWriterCreateVar(
+                    self.ctx, self.lib.FST_VT_VCD_WIRE,
+                    self.lib.FST_VD_IMPLICIT, len(signal), name.encode(),
+                    0 if entry is None else entry[0])
+                if entry is None:
+                    slot = state.slots[state.get_signal(signal)]
+                    self.vars[id(signal)] = (handle, slot, len(signal))
+        for _ in opened:
+            self.lib.fstWriterSetUpscope(self.ctx)
+
+        self.time = self.engine.now
+        self.lib.fstWriterEmitTimeChange(self.ctx, self.time)
+        for (handle, slot, width) in self.vars.values():
+            self._emit(handle, slot.curr, width)
+
+    def _emit(self, handle, value, width):
+        bits = format(value & ((1 << width) - 1), f"0{width}b").encode()
+        self.lib.fstWriterEmitValueChange(self.ctx, handle,
+                                          self.ffi.from_buffer(bits))
+
+    def update_signal(self, timestamp, signal):
+        """Write a change of ``signal``; called by pysim.
+
+        Parameters
+        ----------
+        timestamp: int
+            Simulated time in femtoseconds.
+        signal: ~amaranth.hdl.Signal
+            Signal which changed.
+        """
+        entry = self.vars.get(id(signal))
+        if entry is None:
+            return
+
+        if timestamp != self.time:
+            self.lib.fstWriterEmitTimeChange(self.ctx, timestamp)
+            self.time = timestamp
+        (handle, slot, width) = entry
+        self._emit(handle, slot.curr, width)
+
+    def update_memory(self, timestamp, memory, addr):
+        """Ignore memory writes; called by pysim.
+
+        Parameters
+        ----------
+        timestamp: int
+            Simulated time in femtoseconds.
+        memory: ~amaranth.hdl.MemoryData
+            Memory written to.
+        addr: int
+            Address written to.
+        """
+
+    def close(self, timestamp):
+        """Finish the FST file at ``timestamp``, and write the savefile.
+
+        Parameters
+        ----------
+        timestamp: int
+            Simulated time in femtoseconds to end the waveform at.
+        """
+        from vcd.gtkw import GTKWSave
+
+        if timestamp > self.time:
+            self.lib.fstWriterEmitTimeChange(self.ctx, timestamp)
+        self.lib.fstWriterClose(self.ctx)
+
+        with open(self.gtkw_name, "w") as fp:
+            save = GTKWSave(fp)
+            save.dumpfile(self.fst_name)
+            save.treeopen("bench.top")
+
+
+@contextmanager
+def write_fst(sim, fst_name, gtkw_name, extend=0):
+    """Trace ``sim`` into an FST file, like :meth:`~amaranth.sim.Simulator.write_vcd`.
+
+    Parameters
+    ----------
+    sim: ~amaranth.sim.Simulator
+        The simulator.
+    fst_name: str
+        FST file to write.
+    gtkw_name: str
+        GTKWave savefile to write.
+    extend: int
+        If the simulation raises, end the waveform this many femtoseconds
+        after the current simulation time.
+
+    Yields
+    ------
+    None
+    """  # noqa: E501
+    writer = FSTWriter(sim, fst_name, gtkw_name)
+    engine = sim._engine
+    engine._vcd_writers.append(writer)
+    try:
+        yield
+    except BaseException:
+        end = engine.now + extend
+        raise
+    else:
+        end = engine.now
+    finally:
+        engine._vcd_writers.remove(writer)
+        writer.close(end)
@@ -0,0 +1,320 @@
+"""Golden waveform traces for the ``sim_golden`` marker."""
+
+import gzip
+import json
+import os
+import tempfile
+
+import pytest
+
+#: Version of the golden trace file format.
+FORMAT_VERSION = 1
+
+
+def _named_signals(engine):
+    # Every name of every signal, relative to the toplevel (e.g. "a" or
+    # "sub.b"), shortest names first.
+    names = []
+    for fragment_info in engine._design.fragments.values():
+        for (signal, name) in fragment_info.signal_names.items():
+            names.append((".".join((*fragment_info.name[1:], name)), signal))
+    return sorted(names, key=lambda n: (len(n[0]), n[0]))
+
+
+def _put_varint(out, n):
+    while n >= 0x80:
+        out.append(n & 0x7f | 0x80)
+        n >>= 7
+    out.append(n)
+
+
+class _VarintReader:
+    # Decode LEB128 numbers from a binary stream, a chunk at a time.
+    def __init__(self, fp):
+        self.fp = fp
+        self.buf = b""
+        self.pos = 0
+
+    def read(self):
+        # Returns None at the end of the stream.
+        result = shift = 0
+        while True:
+            if self.pos == len(self.buf):
+                self.buf = self.fp.read(1 << 16)
+                self.pos = 0
+                if not self.buf:
+                    if shift:
+                        raise ValueError("truncated golden trace")
+                    return None
+            byte = self.buf[self.pos]
+            self.pos += 1
+            result |= (byte & 0x7f) << shift
+            if byte < 0x80:
+                return result
+            shift += 7
+
+
+class GoldenTrace:
+    """Record signals into a golden trace, or compare them against one.
+
+    Like the observer of ``--sim-coverage``, the trace poses as a VCD writer
+    of a pysim engine. Changes are grouped by timestamp, keeping the last
+    value of each signal, so the order in which pysim reports signals (and
+    glitches within a timestamp) don't matter. When comparing, each
+    timestamp's changes are checked against the golden trace as soon as the
+    simulation moves past it, and the first divergence raises
+    :exc:`AssertionError` from inside the simulation.
+
+    A golden trace is a gzipped JSON header line, with the signals and their
+    initial values, followed by one record of LEB128 numbers per timestamp:
+    the time since the previous record, the number of changes, and the
+    index and value of each changed signal.
+
+    Parameters
+    ----------
+    sim: ~amaranth.sim.Simulator
+        The simulator.
+    names: tuple of str
+        Names of the signals to trace, relative to the toplevel. Every
+        signal is traced if empty.
+    path: str
+        Golden trace file.
+    update: bool
+        If ``True``, record ``path`` instead of comparing against it.
+
+    Raises
+    ------
+    :exception:`pytest.UsageError`
+        If a name isn't the name of a signal of the design.
+    """
+
+    # Read by pysim for each "VCD writer".
+    fs_per_delta = 0
+
+    def __init__(self, sim, names, path, update):
+        self.engine = sim._engine
+        self.path = path
+        self.update = update
+
+        named = _named_signals(self.engine)
+        if names:
+            by_name = dict(reversed(named))
+            unknown = [n for n in names if n not in by_name]
+            if unknown:
+                raise pytest.UsageError(
+                    f"sim_golden: no signal named {', '.join(unknown)}")
+            named = [(n, by_name[n]) for n in names]
+
+        # Signals are unhashable, so index them by id(). Each entry is
+        # [index, slot, mask].
+        state = self.engine._state
+        self.index = {}
+        self.names = []
+        self.widths = []
+        for (name, signal) in named:
+            if id(signal) in self.index:
+                continue
+            slot = state.slots[state.get_signal(signal)]
+            self.index[id(signal)] = [len(self.names), slot,
+                                      (1 << len(signal)) - 1]
+            self.names.append(name)
+            self.widths.append(len(signal))
+
+        self.values = [slot.curr & mask for (_, slot, mask)
+                       in self.index.values()]
+        self.time = self.start = self.engine.now
+        # Final value of each signal which changed at self.time, by index.
+        self.block = {}
+        # Time of the last record read or written, and the next record of
+        # the golden trace, once read.
+        self.prev = self.start
+        self.expected = None
+        self.fp = None
+        self.tmp = None
+
+    def attach(self):
+        """Open the golden trace, and start recording or comparing.
+
+        Raises
+        ------
+        :exception:`AssertionError`
+            If the golden trace is missing, or traces other signals, or starts
+            at another time or from other values.
+        """  # noqa: DOC501, DOC502
+        if self.update:
+            directory = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(directory, exist_ok=True)
+            fd, self.tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+            os.close(fd)
+            # mkstemp() makes files only readable by their owner.
+            os.chmod(self.tmp, 0o644)
+            self.fp = gzip.open(self.tmp, "wb")
+            self.fp.write(json.dumps({
+                "version": FORMAT_VERSION,
+                "signals": [list(s) for s in zip(self.names, self.widths)],
+                "start": self.start,
+                "init": self.values,
+            }).encode() + b"\n")
+            self.out = bytearray()
+        else:
+            try:
+                self.fp = gzip.open(self.path, "rb")
+            except FileNotFoundError:
+                raise AssertionError(
+                    f"no golden trace at {self.path}; run with "
+                    "--sim-update-golden to record it") from None
+            header = json.loads(self.fp.readline())
+            signals = [list(s) for s in zip(self.names, self.widths)]
+            if header.get("version") != FORMAT_VERSION or \
+                    header["signals"] != signals:
+                raise AssertionError(
+                    f"golden trace {self.path} records other signals; rerun "
+                    "with --sim-update-golden to re-bless it")
+            if header["start"] != self.start:
+                raise AssertionError(
+                    f"golden trace {self.path} starts at {header['start']} "
+                    f"fs, not {self.start} fs; rerun with "
+                    "--sim-update-golden to re-bless it")
+            self.reader = _VarintReader(self.fp)
+            if header["init"] != self.values:
+                self._diverged(self.start, dict(enumerate(self.values)),
+                               dict(enumerate(header["init"])))
+
+        self.engine._vcd_writers.insert(0, self)
+
+    def detach(self):
+        """Stop recording or comparing, and close the golden trace.
+
+        A golden trace being recorded is discarded unless :meth:`finish` was
+        called.
+        """
+        if self in self.engine._vcd_writers:
+            self.engine._vcd_writers.remove(self)
+        if self.fp is not None:
+            self.fp.close()
+            self.fp = None
+        if self.tmp is not None:
+            os.remove(self.tmp)
+            self.tmp = None
+
+    def update_signal(self, timestamp, signal):
+        """Record a change of ``signal``; called by pysim.
+
+        Parameters
+        ----------
+        timestamp: int
+            Simulated time in femtoseconds.
+        signal: ~amaranth.hdl.Signal
+            Signal which changed.
+        """
+        entry = self.index.get(id(signal))
+        if entry is None:
+            return
+
+        if timestamp != self.time:
+            self._flush()
+            self.time = timestamp
+        self.block[entry[0]] = entry[1].curr & entry[2]
+
+    def update_memory(self, timestamp, memory, addr):
+        """Ignore memory writes; called by pysim.
+
+        Parameters
+        ----------
+        timestamp: int
+            Simulated time in femtoseconds.
+        memory: ~amaranth.hdl.MemoryData
+            Memory written to.
+        addr: int
+            Address written to.
+        """
+
+    def finish(self):
+        """Write the recorded golden trace, or check that none of it is left.
+
+        Raises
+        ------
+        :exception:`AssertionError`
+            If the golden trace has changes after the end of the simulation.
+        """  # noqa: DOC501, DOC502
+        self._flush()
+        if self.update:
+            self.fp.write(self.out)
+            self.fp.close()
+            self.fp = None
+            os.replace(self.tmp, self.path)
+            self.tmp = None
+            return
+
+        if self.expected is None:
+            self.expected = self._read()
+        if self.expected is not None:
+            (time, changes) = self.expected
+            (i, value) = next(iter(changes.items()))
+            raise AssertionError(
+                f"golden trace {self.path} diverged at {time} fs: simulation "
+                f"ended at {self.engine.now} fs, but golden trace has "
+                f"{self.names[i]} change to {value}")
+
+    def _flush(self):
+        values = self.values
+        changes = {i: v for (i, v) in sorted(self.block.items())
+                   if v != values[i]}
+        self.block.clear()
+        if not changes:
+            return
+
+        if self.update:
+            out = self.out
+            _put_varint(out, self.time - self.prev)
+            _put_varint(out, len(changes))
+            for (i, v) in changes.items():
+                _put_varint(out, i)
+                _put_varint(out, v)
+            if len(out) >= 1 << 16:
+                self.fp.write(out)
+                out.clear()
+            self.prev = self.time
+        else:
+            if self.expected is None:
+                self.expected = self._read()
+            if self.expected != (self.time, changes):
+                self._diverged(self.time, changes, {})
+            self.expected = None
+
+        for (i, v) in changes.items():
+            values[i] = v
+
+    def _read(self):
+        reader = self.reader
+        delta = reader.read()
+        if delta is None:
+            return None
+        self.prev += delta
+        count = reader.read()
+        changes = {}
+        for _ in range(count):
+            i = reader.read()
+            changes[i] = reader.read()
+        return (self.prev, changes)
+
+    def _diverged(self, time, actual, golden):
+        # Report the first signal (in trace order) whose value differs at
+        # the earliest time the traces disagree.
+        if self.expected is not None and self.expected[0] != time:
+            (golden_time, changes) = self.expected
+            if golden_time < time:
+                (time, actual, golden) = (golden_time, {}, changes)
+            else:
+                golden = {}
+        elif self.expected is not None:
+            golden = self.expected[1]
+
+        for i in sorted(actual.keys() | golden.keys()):
+            ours = actual.get(i, self.values[i])
+            theirs = golden.get(i, self.values[i])
+            if ours != theirs:
+                break
+        raise AssertionError(
+            f"golden trace {self.path} diverged at {time} fs: "
+            f"{self.names[i]} is {ours}, golden trace has {theirs}")
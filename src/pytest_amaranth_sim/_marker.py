@@ -1,8 +1,10 @@
 """Useful marker classes that aren't part of pytest hooks."""
 
 from dataclasses import dataclass
-from amaranth.sim import SimulatorContext
-from typing import Callable, Coroutine
+from typing import TYPE_CHECKING, Callable, Coroutine
+
+if TYPE_CHECKING:
+    from amaranth.sim import SimulatorContext
 
 
 @dataclass
@@ -33,7 +35,85 @@ class Testbench:
 
     #: Testbench constructor- i.e. the first argument to
     #: :meth:`~amaranth.sim.Simulator.add_testbench`.
-    constructor: Callable[[SimulatorContext], Coroutine]
+    constructor: Callable[["SimulatorContext"], Coroutine]
     #: If ``True``, mark :attr:`constructor` as background when passed to
     #: :meth:`~amaranth.sim.Simulator.add_testbench`.
     background: bool = False
+
+
+class Design:
+    """Construct the :fixture:`mod` of a test only when the test is set up.
+
+    Parametrizing ``mod`` with ``Design(MyMod, 4)`` instead of ``MyMod(4)``
+    defers calling the factory until a test using it is set up, so that
+    designs of deselected tests are never constructed. Designs with the same
+    factory and arguments share one instance, which is released after the
+    last test using it.
+
+    Tests and the :fixture:`sim` fixture receive the constructed instance.
+    Other fixtures receive the :class:`Design` itself, which forwards
+    attribute access to the instance that :meth:`build` returns.
+
+    .. doctest::
+
+       >>> from amaranth import Signal
+       >>> from pytest_amaranth_sim import Design
+
+       >>> d = Design(Signal, 4, name="a")
+       >>> d.name
+       'a'
+
+    Parameters
+    ----------
+    factory: Callable[..., Elaboratable]
+        Class or other callable returning the design.
+    *args
+        Positional arguments for ``factory``.
+    **kwargs
+        Keyword arguments for ``factory``.
+    """
+
+    def __init__(self, factory, *args, **kwargs):
+        self.factory = factory
+        self.args = args
+        self.kwargs = kwargs
+        self._instance = None
+        # Shared with equal designs by the plugin at collection time.
+        self._shared = None
+
+    @property
+    def key(self):
+        """Hashable identity of the factory and its arguments.
+
+        Designs whose arguments aren't hashable are only equal to themselves.
+        """
+        key = (self.factory, self.args, tuple(sorted(self.kwargs.items())))
+        try:
+            hash(key)
+        except TypeError:
+            return ("id", id(self))
+        return key
+
+    def build(self):
+        """Construct the design, or return the already constructed instance.
+
+        Returns
+        -------
+        Elaboratable
+        """
+        holder = self if self._shared is None else self._shared
+        if holder._instance is None:
+            holder._instance = self.factory(*self.args, **self.kwargs)
+        return holder._instance
+
+    def __getattr__(self, name):
+        # Don't construct the design for protocol lookups like copy's.
+        if name.startswith("__") or name in ("_instance", "_shared"):
+            raise AttributeError(name)
+        return getattr(self.build(), name)
+
+    def __repr__(self):
+        args = [repr(a) for a in self.args]
+        args += [f"{k}={v!r}" for (k, v) in self.kwargs.items()]
+        name = getattr(self.factory, "__qualname__", repr(self.factory))
+        return f"Design({', '.join([name, *args])})"
@@ -0,0 +1,225 @@
+"""Per-test simulation performance metrics."""
+
+import statistics
+from dataclasses import dataclass, field
+from time import perf_counter
+
+
+@dataclass
+class SimMetrics:
+    """Wall time and simulated time of a single :class:`SimulatorFixture`.
+
+    All wall times are in seconds. Times and edges add up over every run of
+    the test.
+    """
+
+    #: Time spent elaborating ``mod`` and creating the simulator (or
+    #: resetting a cached simulator).
+    elaborate: float = 0.0
+    #: Time spent inside :meth:`~amaranth.sim.Simulator.run`, including
+    #: recording VCD value changes.
+    run: float = 0.0
+    #: Part of :attr:`run` spent recording VCD value changes. Only measured
+    #: when ``--sim-durations`` is given.
+    vcd_update: float = 0.0
+    #: Time spent opening, closing, and patching VCD files.
+    vcd_files: float = 0.0
+    #: Simulated time in femtoseconds when the simulation stopped.
+    sim_time: int = 0
+    #: Number of rising clock edges per clock domain.
+    edges: dict = field(default_factory=dict)
+
+    @property
+    def kernel(self):
+        """Time spent in the simulator proper, excluding VCD recording."""
+        return self.run - self.vcd_update
+
+    @property
+    def vcd(self):
+        """Total time attributable to writing VCDs."""
+        return self.vcd_update + self.vcd_files
+
+    @property
+    def cycles(self):
+        """Number of rising edges of the fastest clock."""
+        return max(self.edges.values(), default=0)
+
+    @property
+    def cycles_per_sec(self):
+        """Simulated cycles of the fastest clock per wall-clock second."""
+        return self.cycles / self.run if self.run else 0.0
+
+    def count_edges(self, clks, start=0):
+        """Add the edges from ``start`` to :attr:`sim_time` to :attr:`edges`.
+
+        Parameters
+        ----------
+        clks: None or float or dict of str: float
+            The :fixture:`clock periods <clks>` fixture.
+        start: int
+            Simulated time in femtoseconds at which the simulation started,
+            e.g. when restored from a ``sim_init`` snapshot.
+        """
+        if isinstance(clks, float):
+            clks = {"sync": clks}
+        elif not isinstance(clks, dict):
+            clks = {}
+
+        def edges_until(t, period_fs, phase_fs):
+            if t < phase_fs:
+                return 0
+            return (t - phase_fs) // period_fs + 1
+
+        for domain, period in clks.items():
+            # Same rounding as amaranth.sim.Simulator.add_clock. The first
+            # rising edge is at half a period.
+            period_fs = int(period * 1e15)
+            phase_fs = int(period / 2 * 1e15)
+            self.edges[domain] = self.edges.get(domain, 0) + \
+                edges_until(self.sim_time, period_fs, phase_fs) - \
+                edges_until(start, period_fs, phase_fs)
+
+    def to_json(self):
+        """Convert to a JSON-compatible :class:`dict` for test reports.
+
+        Returns
+        -------
+        dict
+        """
+        return {
+            "elaborate": self.elaborate,
+            "kernel": self.kernel,
+            "vcd": self.vcd,
+            "sim_time": self.sim_time,
+            "edges": self.edges,
+            "cycles": self.cycles,
+            "cycles_per_sec": self.cycles_per_sec,
+        }
+
+
+@dataclass
+class BenchmarkResult:
+    """Throughput of repeated simulations from the :fixture:`sim_benchmark` fixture."""  # noqa: E501
+
+    #: Time spent elaborating ``mod`` and creating the simulator, in seconds.
+    setup: float
+    #: Simulated cycles of the fastest clock per wall-clock second, one
+    #: entry per round.
+    cycles_per_sec: list
+
+    @property
+    def min(self):
+        """Slowest round's cycles per second."""
+        return min(self.cycles_per_sec)
+
+    @property
+    def median(self):
+        """Median cycles per second over all rounds."""
+        return statistics.median(self.cycles_per_sec)
+
+    @property
+    def stddev(self):
+        """Sample standard deviation of cycles per second over all rounds."""
+        if len(self.cycles_per_sec) < 2:
+            return 0.0
+        return statistics.stdev(self.cycles_per_sec)
+
+    def to_json(self):
+        """Convert to a JSON-compatible :class:`dict` for test reports.
+
+        Returns
+        -------
+        dict
+        """
+        return {
+            "setup": self.setup,
+            "rounds": len(self.cycles_per_sec),
+            "min": self.min,
+            "median": self.median,
+            "stddev": self.stddev,
+        }
+
+
+def time_vcd_updates(vcd_writer, metrics):
+    """Accumulate time spent in an Amaranth VCD writer's change callbacks.
+
+    Parameters
+    ----------
+    vcd_writer
+        Object from the simulator engine's list of VCD writers.
+    metrics: SimMetrics
+        Metrics to update.
+    """
+    def timed(update):
+        def inner(*args):
+            start = perf_counter()
+            update(*args)
+            metrics.vcd_update += perf_counter() - start
+
+        return inner
+
+    vcd_writer.update_signal = timed(vcd_writer.update_signal)
+    vcd_writer.update_memory = timed(vcd_writer.update_memory)
+
+
+def summarize(terminalreporter, count):
+    """Write the ``--sim-durations`` section of the terminal summary.
+
+    Parameters
+    ----------
+    terminalreporter: ~_pytest.terminal.TerminalReporter
+        The terminal reporter passed to ``pytest_terminal_summary``.
+    count: int
+        Number of simulations to show, slowest first; ``0`` shows all.
+    """
+    reports = [rep for reps in terminalreporter.stats.values()
+               for rep in reps
+               if getattr(rep, "when", None) == "call"
+               and hasattr(rep, "sim_metrics")]
+
+    def total(rep):
+        m = rep.sim_metrics
+        return m["elaborate"] + m["kernel"] + m["vcd"]
+
+    reports.sort(key=total, reverse=True)
+    if count:
+        terminalreporter.write_sep("=", f"slowest {count} simulations")
+        reports = reports[:count]
+    else:
+        terminalreporter.write_sep("=", "simulation durations")
+
+    terminalreporter.write_line(
+        f"{'elab(s)':>9} {'kernel(s)':>9} {'vcd(s)':>9} {'sim(us)':>12} "
+        f"{'cycles':>10} {'cycles/s':>10}  test")
+    for rep in reports:
+        m = rep.sim_metrics
+        terminalreporter.write_line(
+            f"{m['elaborate']:9.3f} {m['kernel']:9.3f} {m['vcd']:9.3f} "
+            f"{m['sim_time'] / 1e9:12.3f} {m['cycles']:10} "
+            f"{m['cycles_per_sec']:10.0f}  {rep.nodeid}")
+
+
+def summarize_benchmarks(terminalreporter):
+    """Write the :fixture:`sim_benchmark` section of the terminal summary.
+
+    Parameters
+    ----------
+    terminalreporter: ~_pytest.terminal.TerminalReporter
+        The terminal reporter passed to ``pytest_terminal_summary``.
+    """
+    reports = [rep for reps in terminalreporter.stats.values()
+               for rep in reps
+               if getattr(rep, "when", None) == "call"
+               and hasattr(rep, "sim_benchmark")]
+    if not reports:
+        return
+
+    terminalreporter.write_sep("=", "simulation benchmarks (cycles/s)")
+    terminalreporter.write_line(
+        f"{'setup(s)':>9} {'rounds':>6} {'min':>10} {'median':>10} "
+        f"{'stddev':>10}  test")
+    for rep in reports:
+        b = rep.sim_benchmark
+        terminalreporter.write_line(
+            f"{b['setup']:9.3f} {b['rounds']:6} {b['min']:10.0f} "
+            f"{b['median']:10.0f} {b['stddev']:10.0f}  {rep.nodeid}")
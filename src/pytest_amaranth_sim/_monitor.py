@@ -0,0 +1,196 @@
+"""Clocked assertions checked by one monitor process per clock domain."""
+
+from abc import ABC, abstractmethod
+from collections import deque
+
+
+def _signals(expr):
+    # Signals of an expression, to show their values when a check fails.
+    return sorted(expr._rhs_signals(), key=lambda s: s.name)
+
+
+class Property(ABC):
+    """A clocked assertion over values sampled at each active clock edge.
+
+    Subclasses implement :meth:`check`, and :meth:`reset` if they keep
+    history across clock edges.
+
+    Parameters
+    ----------
+    name: str
+        Name used in failure messages.
+    exprs: list of ~amaranth.hdl.Value
+        Expressions the property checks.
+    """
+
+    def __init__(self, name, exprs):
+        from amaranth.hdl import Value
+
+        self.name = name
+        self.exprs = [Value.cast(e) for e in exprs]
+        self.signals = []
+        for expr in self.exprs:
+            for signal in _signals(expr):
+                if not any(s is signal for s in self.signals):
+                    self.signals.append(signal)
+
+    def describe(self, values):
+        """Format the sampled values of the signals of the property.
+
+        Parameters
+        ----------
+        values: list of int
+            Values of :attr:`signals`.
+
+        Returns
+        -------
+        str
+        """
+        return ", ".join(f"{s.name}={v}" for (s, v) in zip(self.signals,
+                                                             values))
+
+    def reset(self):
+        """Forget history, e.g. while the domain is in reset."""
+
+    @abstractmethod
+    def check(self, cycle, exprs, signals):
+        """Check the values sampled at one clock edge.
+
+        Called once per active clock edge outside of reset, with increasing
+        ``cycle``. Values are sampled just before the edge, so registers
+        still hold their values from the previous cycle.
+
+        Parameters
+        ----------
+        cycle: int
+            Number of the clock edge, counted from 0.
+        exprs: list of int
+            Values of :attr:`exprs`.
+        signals: list of int
+            Values of :attr:`signals`.
+
+        Returns
+        -------
+        None or str
+            Why the property failed, or ``None`` if it holds.
+        """
+
+
+class Always(Property):
+    """``cond`` is true at every clock edge."""
+
+    def __init__(self, cond, name):
+        super().__init__(name or repr(cond), [cond])
+
+    def check(self, cycle, exprs, signals):
+        if not exprs[0]:
+            return self.describe(signals)
+        return None
+
+
+class Delayed(Property):
+    """``actual`` equals ``expected`` from ``cycles`` clock edges earlier."""
+
+    def __init__(self, actual, expected, cycles, name):
+        super().__init__(
+            name or f"{actual!r} == {expected!r} after {cycles} cycles",
+            [actual, expected])
+        self.cycles = cycles
+        self.history = deque()
+
+    def reset(self):
+        self.history.clear()
+
+    def check(self, cycle, exprs, signals):
+        (actual, expected) = exprs
+        self.history.append((expected, cycle, signals))
+        if len(self.history) <= self.cycles:
+            return None
+
+        (want, then, before) = self.history.popleft()
+        if actual != want:
+            return (f"got {actual}, expected {want} from cycle {then} "
+                    f"({self.describe(before)}); now "
+                    f"{self.describe(signals)}")
+        return None
+
+
+class Within(Property):
+    """Whenever ``trigger`` is true, ``response`` follows within ``cycles``."""
+
+    def __init__(self, trigger, response, cycles, name):
+        super().__init__(
+            name or f"{trigger!r} implies {response!r} within {cycles} "
+                    "cycles",
+            [trigger, response])
+        self.cycles = cycles
+        self.pending = None
+
+    def reset(self):
+        self.pending = None
+
+    def check(self, cycle, exprs, signals):
+        (trigger, response) = exprs
+        if response:
+            self.pending = None
+        elif trigger and self.pending is None:
+            self.pending = (cycle, signals)
+
+        if self.pending is not None and cycle - self.pending[0] >= \
+                self.cycles:
+            (then, before) = self.pending
+            return (f"no response since cycle {then} "
+                    f"({self.describe(before)}); now "
+                    f"{self.describe(signals)}")
+        return None
+
+
+def monitor(engine, domain, properties):
+    """Make a process which checks ``properties`` at each edge of ``domain``.
+
+    All expressions and signals of all properties are sampled by a single
+    trigger. Properties are not checked while the domain is in reset.
+
+    Parameters
+    ----------
+    engine
+        The simulator engine, for the simulated time in failure messages.
+    domain: str
+        Clock domain.
+    properties: list of Property
+        Properties of the domain.
+
+    Returns
+    -------
+    Callable[[SimulatorContext], Coroutine]
+    """
+    sampled = []
+    slices = []
+    for prop in properties:
+        start = len(sampled)
+        sampled.extend(prop.exprs)
+        middle = len(sampled)
+        sampled.extend(prop.signals)
+        slices.append((prop, start, middle, len(sampled)))
+
+    async def process(ctx):
+        for prop in properties:
+            prop.reset()
+        cycle = 0
+        async for (_, rst, *values) in ctx.tick(domain).sample(*sampled):
+            if rst:
+                for prop in properties:
+                    prop.reset()
+                cycle += 1
+                continue
+
+            for (prop, start, middle, end) in slices:
+                reason = prop.check(cycle, values[start:middle],
+                                    values[middle:end])
+                if reason is not None:
+                    raise AssertionError(
+                        f"monitor {prop.name!r} failed at cycle {cycle} of "
+                        f"domain {domain!r} ({engine.now} fs): {reason}")
+            cycle += 1
+
+    return process
@@ -0,0 +1,129 @@
+"""Process fan-out of independent scenarios for ``run_parallel``."""
+
+import multiprocessing
+import multiprocessing.connection
+import os
+import threading
+import traceback
+import warnings
+
+import pytest
+
+
+def fork_context():
+    """Get the ``fork`` :mod:`multiprocessing` context.
+
+    Forked children inherit the simulator and testbenches as they are, so
+    testbenches don't have to be picklable.
+
+    Returns
+    -------
+    multiprocessing.context.BaseContext
+
+    Raises
+    ------
+    :exception:`pytest.UsageError`
+        If the platform can't fork.
+    """  # noqa: DOC501, DOC502
+    if "fork" not in multiprocessing.get_all_start_methods():
+        raise pytest.UsageError("sim.run_parallel() requires the fork start "
+                                "method, which this platform lacks")
+    return multiprocessing.get_context("fork")
+
+
+def _child(conn, target, job):
+    try:
+        result = (target(job), None)
+    except BaseException:
+        result = (None, traceback.format_exc())
+    conn.send(result)
+    conn.close()
+
+
+def _in_turn(target, jobs, reset):
+    results = []
+    for (idx, job) in enumerate(jobs):
+        if idx:
+            reset()
+        try:
+            results.append((target(job), None))
+        except Exception:
+            results.append((None, traceback.format_exc()))
+    return results
+
+
+def fan_out(target, jobs, workers=None, reset=None):
+    """Call ``target(job)`` for each job, each in a forked process.
+
+    At most ``workers`` children run at once. Children are only ever forked
+    from the calling thread, and each runs exactly one job, so every job
+    starts from the caller's state at the time of the call.
+
+    Forking a process with other threads, e.g. a pytest-xdist worker, can
+    deadlock the children. If other threads are running, the jobs run one
+    after another in this process instead, with a warning, and ``reset()``
+    is called before every job but the first to restore the caller's state.
+
+    Parameters
+    ----------
+    target: Callable[[object], object]
+        Function to call in each child. Its return value must be picklable.
+    jobs: list
+        Argument for each call.
+    workers: None or int
+        Maximum number of concurrent children; defaults to the number of
+        CPUs.
+    reset: Callable[[], None]
+        Restore the caller's state between jobs run in this process.
+
+    Returns
+    -------
+    list of (object, None or str)
+        For each job, in order, the return value of ``target``, and the
+        formatted traceback if it raised instead.
+
+    Raises
+    ------
+    :exception:`pytest.UsageError`
+        If the platform can't fork.
+    """  # noqa: DOC502
+    ctx = fork_context()
+    if threading.active_count() > 1:
+        warnings.warn(pytest.PytestWarning(
+            "sim.run_parallel() can't fork while other threads are running; "
+            "running scenarios one after another"))
+        return _in_turn(target, jobs, reset)
+
+    workers = max(1, workers or os.cpu_count() or 1)
+    pending = list(enumerate(jobs))
+    running = {}
+    results = [None] * len(jobs)
+
+    try:
+        while pending or running:
+            while pending and len(running) < workers:
+                (idx, job) = pending.pop(0)
+                (recv, send) = ctx.Pipe(duplex=False)
+                proc = ctx.Process(target=_child, args=(send, target, job))
+                proc.start()
+                send.close()
+                running[recv] = (idx, proc)
+
+            for conn in multiprocessing.connection.wait(list(running)):
+                (idx, proc) = running.pop(conn)
+                try:
+                    results[idx] = conn.recv()
+                except EOFError:
+                    proc.join()
+                    results[idx] = (None, "worker process exited with code "
+                                          f"{proc.exitcode}\n")
+                conn.close()
+                proc.join()
+    finally:
+        # E.g. on KeyboardInterrupt.
+        for (conn, (_, proc)) in running.items():
+            proc.terminate()
+            proc.join()
+            conn.close()
+
+    return results
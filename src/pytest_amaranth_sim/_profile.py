@@ -0,0 +1,108 @@
+"""Profiling of :meth:`~amaranth.sim.Simulator.run` for ``--sim-profile``."""
+
+import os
+import pstats
+import sysconfig
+from importlib.util import find_spec
+
+
+# Locate amaranth without importing it, which is slow.
+_AMARANTH_DIR = os.path.dirname(find_spec("amaranth").origin)
+_STDLIB_DIR = sysconfig.get_paths()["stdlib"]
+_SITE_DIRS = (sysconfig.get_paths()["purelib"],
+              sysconfig.get_paths()["platlib"])
+
+
+def _in_dir(filename, directory):
+    # A bare prefix would also match siblings, e.g. amaranth_boards.
+    return filename.startswith(os.path.join(directory, ""))
+
+
+def in_amaranth(filename):
+    """Check whether ``filename`` is part of the installed amaranth package.
+
+    Parameters
+    ----------
+    filename: str
+        Path of a source file, e.g. from a code object.
+
+    Returns
+    -------
+    bool
+    """
+    return _in_dir(filename, _AMARANTH_DIR)
+
+
+def _is_kernel(filename):
+    # pysim compiles the design into Python code without a source file.
+    return filename == "<string>" or in_amaranth(filename)
+
+
+def _is_stdlib(filename):
+    # Builtins are "~". site-packages may live inside the stdlib directory.
+    return (filename == "~" or filename.startswith("<frozen") or
+            (_in_dir(filename, _STDLIB_DIR) and
+             not any(_in_dir(filename, d) for d in _SITE_DIRS)))
+
+
+def hotspots(profile, count=5):
+    """Find the functions with the most time spent in their own code.
+
+    Parameters
+    ----------
+    profile: cProfile.Profile
+        Profile of a single :meth:`~amaranth.sim.Simulator.run` call.
+    count: int
+        Number of functions to return per category.
+
+    Returns
+    -------
+    dict of str: list
+        ``"kernel"`` (amaranth and the compiled design) and ``"testbench"``
+        (everything else written in Python) hotspots, as lists of
+        ``(location, total time, cumulative time)``, sorted by total time.
+    """
+    kernel, testbench = [], []
+    for ((filename, line, func), (_, _, tt, ct, _)) in \
+            pstats.Stats(profile).stats.items():
+        if _is_kernel(filename):
+            where = kernel
+        elif _is_stdlib(filename):
+            # Can't be attributed to either side.
+            continue
+        else:
+            where = testbench
+
+        where.append((f"{func} ({os.path.basename(filename)}:{line})",
+                      tt, ct))
+
+    def top(entries):
+        return sorted(entries, key=lambda e: e[1], reverse=True)[:count]
+
+    return {"kernel": top(kernel), "testbench": top(testbench)}
+
+
+def summarize(terminalreporter):
+    """Write the ``--sim-profile`` section of the terminal summary.
+
+    Parameters
+    ----------
+    terminalreporter: ~_pytest.terminal.TerminalReporter
+        The terminal reporter passed to ``pytest_terminal_summary``.
+    """
+    reports = [rep for reps in terminalreporter.stats.values()
+               for rep in reps
+               if getattr(rep, "when", None) == "call"
+               and hasattr(rep, "sim_profile")]
+    if not reports:
+        return
+
+    terminalreporter.write_sep("=", "simulation hotspots")
+    for rep in reports:
+        terminalreporter.write_line(rep.nodeid)
+        for category in ("testbench", "kernel"):
+            terminalreporter.write_line(
+                f"  {category:<10} {'tottime':>9} {'cumtime':>9}")
+            for (where, tt, ct) in rep.sim_profile[category]:
+                terminalreporter.write_line(
+                    f"  {'':<10} {tt:9.3f} {ct:9.3f}  {where}")
@@ -0,0 +1,209 @@
+"""Test durations recorded in ``.pytest_cache``, for ordering and sharding."""
+
+import os
+import statistics
+
+import pytest
+
+
+#: Key of the recorded durations in ``.pytest_cache``.
+CACHE_KEY = "amaranth-sim/durations"
+
+
+def estimate(durations, items):
+    """Estimate the duration of each of ``items`` from earlier sessions.
+
+    Tests without a recorded duration are assumed to take as long as the
+    median recorded test, or 1 second if nothing was recorded.
+
+    Parameters
+    ----------
+    durations: dict
+        Recorded durations, by test node ID.
+    items: list of ~_pytest.nodes.Item
+        Collected tests.
+
+    Returns
+    -------
+    list of float
+        Duration of each test in seconds.
+    """
+    known = [durations[item.nodeid]["duration"] for item in items
+             if item.nodeid in durations]
+    default = statistics.median(known) if known else 1.0
+    return [durations[item.nodeid]["duration"] if item.nodeid in durations
+            else default for item in items]
+
+
+def longest_first(costs):
+    """Order indices by decreasing cost, keeping ties in collection order.
+
+    Parameters
+    ----------
+    costs: list of float
+        Cost of each test.
+
+    Returns
+    -------
+    list of int
+    """
+    return sorted(range(len(costs)), key=lambda i: -costs[i])
+
+
+def shard(costs, count):
+    """Split tests into ``count`` shards of balanced total cost.
+
+    Uses the longest processing time first rule: tests are assigned in
+    order of decreasing cost, each to the shard with the lowest total so
+    far. The longest shard is at most 4/3 as long as the best possible
+    split. The result only depends on ``costs``, so every CI job computes
+    the same shards from the same recorded durations.
+
+    Parameters
+    ----------
+    costs: list of float
+        Cost of each test.
+    count: int
+        Number of shards.
+
+    Returns
+    -------
+    list of int
+        Shard of each test, counted from 0.
+    """
+    totals = [0.0] * count
+    shards = [0] * len(costs)
+    for i in longest_first(costs):
+        # The first shard with the lowest total breaks ties.
+        s = min(range(count), key=lambda s: totals[s])
+        shards[i] = s
+        totals[s] += costs[i]
+    return shards
+
+
+def stale(durations, collected, rootpath):
+    """Find recorded durations of tests that no longer exist.
+
+    A test is gone if its file is gone, or if its file was collected but
+    the test wasn't.
+
+    Parameters
+    ----------
+    durations: dict
+        Recorded durations, by test node ID.
+    collected: set of str
+        Node IDs of the collected tests, before deselection.
+    rootpath: pathlib.Path
+        Directory which node IDs are relative to.
+
+    Returns
+    -------
+    list of str
+        Node IDs of the tests that are gone.
+    """
+    files = {nodeid.split("::")[0] for nodeid in collected}
+    gone = []
+    for nodeid in durations:
+        path = nodeid.split("::")[0]
+        if nodeid not in collected and (
+                path in files or not os.path.exists(rootpath / path)):
+            gone.append(nodeid)
+    return gone
+
+
+class Schedule:
+    """Plugin recording test durations, and ordering or sharding tests.
+
+    Only registered by ``--sim-longest-first`` and ``--sim-shard``, so other
+    sessions don't touch the cache. Every test's setup, call, and teardown
+    time is recorded in ``.pytest_cache`` at the end of the session, along
+    with elaboration and simulation time for tests using the :fixture:`sim`
+    fixture. Only tests that passed are recorded, since failures often stop
+    early, and skipped tests take no time. Under pytest-xdist, durations
+    arrive with each test's reports from the workers, and only the
+    controller writes the cache.
+
+    Durations of tests that no longer exist are dropped: those of files
+    that are gone, and those of files collected in this session which no
+    longer have the test. The controller of pytest-xdist doesn't collect
+    tests, so only the former are dropped there.
+
+    Parameters
+    ----------
+    config: ~_pytest.config.Config
+        The :mod:`pytest` config.
+    longest_first: bool
+        Whether to run tests in order of decreasing recorded duration.
+    shard: None or (int, int)
+        Shard to run, counted from 1, and number of shards.
+    """
+
+    def __init__(self, config, longest_first, shard):
+        self.config = config
+        self.longest_first = longest_first
+        self.shard = shard
+        self.durations = config.cache.get(CACHE_KEY, {})
+        # Node IDs mapped to recorded times of this session's tests.
+        self.recorded = {}
+        # Node IDs of this session's tests, before -k and -m.
+        self.collected = set()
+        self.failed = set()
+        self.summary = None
+
+    def pytest_itemcollected(self, item):
+        self.collected.add(item.nodeid)
+
+    # After -k and -m, so that only selected tests are sharded.
+    @pytest.hookimpl(trylast=True)
+    def pytest_collection_modifyitems(self, config, items):
+        costs = estimate(self.durations, items)
+        if self.shard is not None:
+            (index, count) = self.shard
+            shards = shard(costs, count)
+            keep = [i for i in range(len(items)) if shards[i] == index - 1]
+            estimated = sum(costs[i] for i in keep)
+            self.summary = (
+                f"amaranth-sim: shard {index}/{count}: {len(keep)} of "
+                f"{len(items)} tests, estimated {estimated:.1f}s of "
+                f"{sum(costs):.1f}s")
+
+            deselected = [item for (item, s) in zip(items, shards)
+                          if s != index - 1]
+            if deselected:
+                config.hook.pytest_deselected(items=deselected)
+            items[:] = [items[i] for i in keep]
+            costs = [costs[i] for i in keep]
+
+        if self.longest_first:
+            items[:] = [items[i] for i in longest_first(costs)]
+
+    def pytest_report_collectionfinish(self):
+        return self.summary
+
+    def pytest_runtest_logreport(self, report):
+        if report.outcome != "passed":
+            self.failed.add(report.nodeid)
+            return
+
+        entry = self.recorded.setdefault(report.nodeid, {"duration": 0.0})
+        entry["duration"] += report.duration
+        metrics = getattr(report, "sim_metrics", None)
+        if metrics is not None:
+            # Time in sim.run(), including writing VCDs.
+            entry["elaborate"] = metrics["elaborate"]
+            entry["run"] = metrics["kernel"] + metrics["vcd"]
+
+    def pytest_sessionfinish(self, session):
+        if hasattr(self.config, "workerinput"):
+            return
+
+        recorded = {nodeid: entry for (nodeid, entry) in self.recorded.items()
+                    if nodeid not in self.failed}
+        # Re-read in case another session finished meanwhile.
+        durations = self.config.cache.get(CACHE_KEY, {})
+        gone = stale(durations, self.collected, self.config.rootpath)
+        if recorded or gone:
+            for nodeid in gone:
+                del durations[nodeid]
+            durations.update(recorded)
+            self.config.cache.set(CACHE_KEY, durations)
@@ -0,0 +1,134 @@
+"""Capture and restore pysim's state for the ``sim_init`` marker."""
+
+from contextlib import ExitStack, contextmanager
+from dataclasses import dataclass
+
+
+@dataclass
+class Snapshot:
+    """State of a pysim simulator between two time steps."""
+
+    #: Simulated time in femtoseconds.
+    now: int
+    #: Per slot, the current value of a signal or the contents of a memory.
+    slots: list
+    #: Per clock signal slot, ``(initial, runnable, next wakeup or None)``.
+    clocks: dict
+
+
+def _clock_processes(engine):
+    from amaranth.sim._pyclock import PyClockProcess
+
+    return [p for p in engine._processes if isinstance(p, PyClockProcess)]
+
+
+def take(sim):
+    """Capture the state of a simulator whose testbenches all finished.
+
+    Parameters
+    ----------
+    sim: ~amaranth.sim.Simulator
+        The simulator.
+
+    Returns
+    -------
+    Snapshot
+    """
+    engine = sim._engine
+    state = engine._state
+
+    slots = []
+    for slot in state.slots:
+        if hasattr(slot, "data"):
+            slots.append(list(slot.data))
+        else:
+            slots.append(slot.curr)
+
+    # A clock's only state besides its signal is when it wakes up next,
+    # which lives in a closure on the timeline.
+    from amaranth.sim._pyclock import PyClockProcess
+
+    wakeups = {}
+    for (waker, deadline) in state.timeline.wakers.items():
+        for cell in waker.__closure__ or ():
+            if isinstance(cell.cell_contents, PyClockProcess):
+                wakeups[cell.cell_contents] = deadline
+
+    clocks = {p.slot: (p.initial, p.runnable, wakeups.get(p))
+              for p in _clock_processes(engine)}
+    return Snapshot(state.timeline.now, slots, clocks)
+
+
+def restore(sim, snapshot):
+    """Restore a freshly reset simulator to ``snapshot``.
+
+    Parameters
+    ----------
+    sim: ~amaranth.sim.Simulator
+        The simulator which ``snapshot`` was taken from, after
+        :meth:`~amaranth.sim.Simulator.reset`.
+    snapshot: Snapshot
+        The snapshot.
+    """
+    engine = sim._engine
+    state = engine._state
+    state.timeline.now = snapshot.now
+
+    for (slot, value) in zip(state.slots, snapshot.slots):
+        if hasattr(slot, "data"):
+            slot.data = list(value)
+        else:
+            slot.curr = slot.next = value
+
+    for proc in _clock_processes(engine):
+        (proc.initial, proc.runnable, wakeup) = snapshot.clocks[proc.slot]
+        if wakeup is not None:
+            def waker(proc=proc):
+                proc.runnable = True
+
+            state.timeline.wakers[waker] = wakeup
+
+
+@contextmanager
+def write_vcd(sim, vcd_file, gtkw_file):
+    """Like :meth:`~amaranth.sim.Simulator.write_vcd`, after :func:`restore`.
+
+    Amaranth refuses to start writing waveforms once simulated time has
+    advanced. The trace starts with the restored values at time 0, and
+    continues from the time of the snapshot.
+
+    Parameters
+    ----------
+    sim: ~amaranth.sim.Simulator
+        The simulator, right after :func:`restore`.
+    vcd_file: file
+        Same as for :meth:`~amaranth.sim.Simulator.write_vcd`.
+    gtkw_file: str
+        Same as for :meth:`~amaranth.sim.Simulator.write_vcd`.
+
+    Yields
+    ------
+    None
+    """
+    engine = sim._engine
+    timeline = engine._state.timeline
+    now = timeline.now
+    with ExitStack() as stack:
+        timeline.now = 0
+        try:
+            stack.enter_context(sim.write_vcd(vcd_file, gtkw_file))
+        finally:
+            timeline.now = now
+        _trace(engine, engine._vcd_writers[-1])
+        yield
+
+
+def _trace(engine, vcd_writer):
+    # VCD writers take their initial values from the restored state, except
+    # for signals with a decoder, which start from their init value.
+    state = engine._state
+    for slot in state.slots:
+        signal = getattr(slot, "signal", None)
+        if signal is not None and signal._decoder is not None and \
+                slot.curr != signal.init:
+            vcd_writer.update_signal(state.timeline.now, signal)
@@ -0,0 +1,132 @@
+"""NumPy stimulus and responses for ``run_stream`` and ``run_mapped``."""
+
+import pytest
+
+
+def import_numpy(method):
+    """Import :mod:`numpy`, which is an optional dependency.
+
+    Parameters
+    ----------
+    method: str
+        Name of the method requiring :mod:`numpy`, for the error message.
+
+    Returns
+    -------
+    module
+
+    Raises
+    ------
+    :exception:`pytest.UsageError`
+        If :mod:`numpy` is not installed.
+    """  # noqa: DOC501, DOC502
+    try:
+        import numpy
+    except ImportError:
+        raise pytest.UsageError(f"{method} requires numpy; install "
+                                "pytest-amaranth-sim[numpy]") from None
+    return numpy
+
+
+def output_array(np, signal, count):
+    """Preallocate an array to record ``count`` samples of ``signal``.
+
+    Parameters
+    ----------
+    np: module
+        The :mod:`numpy` module.
+    signal: ~amaranth.hdl.Signal
+        Signal to record.
+    count: int
+        Number of samples.
+
+    Returns
+    -------
+    numpy.ndarray
+        Unsigned or signed 64-bit integers, or Python :class:`int` objects
+        for signals wider than 64 bits.
+    """
+    shape = signal.shape()
+    if shape.width > 64:
+        dtype = object
+    elif shape.signed:
+        dtype = np.int64
+    else:
+        dtype = np.uint64
+    return np.zeros(count, dtype=dtype)
+
+
+def record_dtype(np, signals):
+    """Make the record layout of binary files for ``run_mapped``.
+
+    Each signal is a field named after it, in order and without padding:
+    the smallest of 1, 2, 4, or 8 bytes that fits the signal, little-endian,
+    and signed if the signal is.
+
+    Parameters
+    ----------
+    np: module
+        The :mod:`numpy` module.
+    signals: list of ~amaranth.hdl.Signal
+        Signals of each record.
+
+    Returns
+    -------
+    numpy.dtype
+        Structured data type of a record.
+
+    Raises
+    ------
+    :exception:`ValueError`
+        If a signal is wider than 64 bits, or two signals have the same name.
+    """  # noqa: DOC501, DOC502
+    fields = []
+    for signal in signals:
+        shape = signal.shape()
+        if shape.width > 64:
+            raise ValueError(f"{signal.name} is wider than 64 bits")
+        size = next(n for n in (1, 2, 4, 8) if shape.width <= 8 * n)
+        fields.append((signal.name, f"<{'i' if shape.signed else 'u'}{size}"))
+    return np.dtype(fields)
+
+
+def mismatch_report(np, inputs, outputs, actual, expected, count):
+    """Compare recorded outputs to a golden model's outputs in bulk.
+
+    Parameters
+    ----------
+    np: module
+        The :mod:`numpy` module.
+    inputs: list of (~amaranth.hdl.Signal, numpy.ndarray)
+        Input signals and the values they were driven with.
+    outputs: list of ~amaranth.hdl.Signal
+        Output signals.
+    actual: list of numpy.ndarray
+        Recorded values of each output.
+    expected: list of numpy.ndarray
+        Golden model values of each output.
+    count: int
+        Maximum number of mismatches to describe per output.
+
+    Returns
+    -------
+    None or str
+        Description of the first ``count`` mismatches of each output, or
+        ``None`` if all outputs match.
+    """
+    lines = []
+    for (signal, got, want) in zip(outputs, actual, expected):
+        bad = np.flatnonzero(got != want)
+        if not len(bad):
+            continue
+
+        lines.append(f"{len(bad)} of {len(got)} cycles mismatched for "
+                     f"{signal.name}:")
+        for cycle in bad[:count].tolist():
+            stimulus = ", ".join(f"{s.name}={values[cycle]}"
+                                 for (s, values) in inputs)
+            lines.append(f"  cycle {cycle}: got {got[cycle]}, expected "
+                         f"{want[cycle]}" +
+                         (f" ({stimulus})" if stimulus else ""))
+
+    return "\n".join(lines) or None
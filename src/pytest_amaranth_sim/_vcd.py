@@ -0,0 +1,391 @@
+"""Helpers for post-processing the VCD text stream written by the simulator."""
+
+import json
+import os
+from bisect import bisect_right
+from collections import deque
+
+
+#: Version of the ``.vcd.idx`` file format.
+INDEX_VERSION = 1
+
+
+def _var_id(line):
+    # Scalar changes are "<value><id>"; vector, real and string changes are
+    # "<type><value> <id>".
+    if line[0] in "bBrRsS":
+        return line[line.index(" ") + 1:]
+    return line[1:]
+
+
+class WindowedVCD:
+    """File-like object which keeps only the tail of a VCD stream.
+
+    Pass an instance to :meth:`~amaranth.sim.Simulator.write_vcd` in place of
+    a file. Value changes older than ``window`` femtoseconds before the most
+    recent timestamp are folded into a single ``$dumpvars`` section, so
+    memory use is bounded by the number of changes inside the window. The
+    shortened dump is written to ``fp`` when this object is closed; ``fp`` is
+    closed afterwards.
+    """
+
+    def __init__(self, fp, window):
+        self.fp = fp
+        self.window = window
+
+        self._partial = ""
+        self._header = []
+        self._in_header = True
+        # Value change line for each variable id, as of self._base_ts.
+        self._base = {}
+        self._base_ts = 0
+        # (timestamp, [value change lines]) for each timestamp in the window.
+        self._blocks = deque()
+
+    @property
+    def name(self):
+        return self.fp.name
+
+    def tell(self):
+        return self.fp.tell()
+
+    def flush(self):
+        pass
+
+    def write(self, s):
+        *lines, self._partial = (self._partial + s).split("\n")
+        for line in lines:
+            self._feed(line)
+        return len(s)
+
+    def _feed(self, line):
+        if self._in_header:
+            self._header.append(line)
+            if line.startswith("$enddefinitions"):
+                self._in_header = False
+        elif line.startswith("#"):
+            ts = int(line[1:])
+            self._blocks.append((ts, []))
+            self._fold(ts - self.window)
+        elif line and line[0] != "$":
+            # $dumpvars/$end only bracket the initial values at #0, which are
+            # treated like any other change.
+            self._blocks[-1][1].append(line)
+
+    def _fold(self, start):
+        # Never fold the most recent block; it may still grow.
+        blocks = self._blocks
+        base = self._base
+        while len(blocks) > 1 and blocks[0][0] <= start:
+            ts, changes = blocks.popleft()
+            for line in changes:
+                base[_var_id(line)] = line
+            self._base_ts = ts
+
+    def close(self):
+        if self._blocks:
+            self._fold(self._blocks[-1][0] - self.window)
+
+        out = self.fp
+        out.write("\n".join(self._header) + "\n")
+        out.write(f"#{self._base_ts}\n$dumpvars\n")
+        out.writelines(line + "\n" for line in self._base.values())
+        out.write("$end\n")
+        for (ts, changes) in self._blocks:
+            if ts != self._base_ts:
+                out.write(f"#{ts}\n")
+            out.writelines(line + "\n" for line in changes)
+        out.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class IndexedVCD:
+    """File-like object which writes a VCD stream and its ``.vcd.idx`` index.
+
+    Pass an instance to :meth:`~amaranth.sim.Simulator.write_vcd` (directly,
+    or wrapped by :class:`WindowedVCD`) in place of a file. Text is encoded
+    and written to the binary file ``fp``. About every ``interval`` bytes, at
+    the start of a timestamp, the byte offset of the timestamp and the value
+    of every variable just before it are appended to the index ``idx_name``.
+
+    The index is a JSON object per line: the format version and size of the
+    VCD header first, then the checkpoints, and finally the last timestamp
+    and size of the VCD. Later lines with a last timestamp (e.g. after the
+    VCD is extended) override earlier ones.
+    """
+
+    def __init__(self, fp, idx_name, interval):
+        self.fp = fp
+        self.interval = interval
+
+        self._idx = open(idx_name, "w")
+        self._offset = 0
+        self._checkpoint = None
+        self._time = 0
+        self._in_header = True
+        # Value change line for each variable id, as of self._time, and
+        # writes not parsed yet.
+        self._values = {}
+        self._pending = []
+
+    @property
+    def name(self):
+        return self.fp.name
+
+    def tell(self):
+        return self._offset
+
+    def flush(self):
+        pass
+
+    def _dump(self, entry):
+        self._idx.write(json.dumps(entry, separators=(",", ":")) + "\n")
+
+    def write(self, s):
+        data = s.encode()
+        self.fp.write(data)
+
+        # pyvcd starts a write with each timestamp it dumps, so checkpoints
+        # are only taken there.
+        if s.startswith("#"):
+            if self._in_header:
+                self._in_header = False
+                self._dump({"version": INDEX_VERSION,
+                            "header": self._offset})
+            if self._checkpoint is None or \
+                    self._offset - self._checkpoint >= self.interval:
+                self._fold()
+                self._checkpoint = self._offset
+                self._dump({"time": int(s[1:s.index("\n")]),
+                            "offset": self._offset,
+                            "values": list(self._values.values())})
+
+        if not self._in_header:
+            # Parsing changes in batches is much cheaper than one at a time.
+            self._pending.append(s)
+            if len(self._pending) >= 4096:
+                self._fold()
+
+        self._offset += len(data)
+        return len(s)
+
+    def _fold(self):
+        # Same as _var_id(), inlined since this runs for every change.
+        values = self._values
+        for line in "".join(self._pending).split("\n"):
+            if not line:
+                continue
+            kind = line[0]
+            if kind in "bBrRsS":
+                values[line[line.index(" ") + 1:]] = line
+            elif kind == "#":
+                self._time = int(line[1:])
+            elif kind != "$":
+                values[line[1:]] = line
+        self._pending.clear()
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+    def close(self):
+        if self._idx.closed:
+            return
+        self._fold()
+        self._dump({"end": self._time, "size": self._offset})
+        self._idx.close()
+        self.fp.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def extend_index(vcd_name, end):
+    """Record that ``vcd_name`` was extended to timestamp ``end``.
+
+    Parameters
+    ----------
+    vcd_name: str
+        VCD file, which must have an index.
+    end: int
+        New last timestamp.
+    """
+    with open(vcd_name + ".idx", "a") as fp:
+        fp.write(json.dumps({"end": end,
+                             "size": os.path.getsize(vcd_name)},
+                            separators=(",", ":")) + "\n")
+
+
+def index_end(vcd_name):
+    """Read the last timestamp of ``vcd_name`` from its index.
+
+    Only the end of the index is read.
+
+    Parameters
+    ----------
+    vcd_name: str
+        VCD file, which must have an index.
+
+    Returns
+    -------
+    int
+    """
+    with open(vcd_name + ".idx", "rb") as fp:
+        pos = fp.seek(0, os.SEEK_END)
+        fp.seek(max(0, pos - 4096))
+        last = fp.read().rstrip(b"\n").rsplit(b"\n", 1)[-1]
+    return json.loads(last)["end"]
+
+
+class VCDIndex:
+    """Seek to any time of a VCD file without parsing what comes before.
+
+    ``--vcds`` writes an index named like the VCD file with ``.idx`` appended
+    next to plain-text VCD files when the ``vcd_index`` ini option is set to
+    a nonzero value. The index holds the value of every variable at periodic
+    checkpoints, so reading the values at a time only parses the VCD from
+    the closest checkpoint before it. For example, to cut the last 100 ns
+    before a failure out of a huge trace::
+
+       idx = VCDIndex("test_basic[mul].vcd")
+       with open("failure.vcd", "w") as fp:
+           idx.write_window(fp, idx.end - 100_000_000, idx.end)
+
+    Parameters
+    ----------
+    vcd_name: str
+        VCD file. Its index is ``vcd_name + ".idx"``.
+
+    Raises
+    ------
+    :exception:`ValueError`
+        If the index is from another version, or the VCD file changed after
+        the index was written.
+
+    Attributes
+    ----------
+    vcd_name: str
+        VCD file.
+    header_size: int
+        Size of the VCD header, up to the first timestamp, in bytes.
+    checkpoints: list of (int, int, list of str)
+        Timestamp, byte offset of the timestamp, and value change line of
+        every variable before the timestamp, for each checkpoint.
+    end: int
+        Last timestamp of the VCD.
+    """
+
+    def __init__(self, vcd_name):
+        self.vcd_name = vcd_name
+        with open(vcd_name + ".idx") as fp:
+            entries = [json.loads(line) for line in fp]
+
+        if not entries or entries[0].get("version") != INDEX_VERSION:
+            raise ValueError(f"{vcd_name}.idx isn't a version "
+                             f"{INDEX_VERSION} index")
+        self.header_size = entries[0]["header"]
+        self.checkpoints = [(e["time"], e["offset"], e["values"])
+                            for e in entries if "values" in e]
+        last = [e for e in entries if "end" in e][-1]
+        self.end = last["end"]
+        if os.path.getsize(vcd_name) != last["size"]:
+            raise ValueError(f"{vcd_name} changed after it was indexed")
+
+    def checkpoint(self, time):
+        """Find the last checkpoint at or before ``time``.
+
+        Parameters
+        ----------
+        time: int
+            Timestamp.
+
+        Returns
+        -------
+        (int, int, list of str)
+            The first checkpoint if ``time`` is before all of them.
+        """
+        times = [c[0] for c in self.checkpoints]
+        return self.checkpoints[max(0, bisect_right(times, time) - 1)]
+
+    def changes(self, start, end=None):
+        """Iterate over the value changes from ``start`` to ``end``.
+
+        Parameters
+        ----------
+        start: int
+            First timestamp.
+        end: None or int
+            Last timestamp, or ``None`` for the end of the VCD.
+
+        Yields
+        ------
+        (int, list of str)
+            Timestamp and value change lines. The first item is ``start``
+            with the value of every variable at ``start``.
+        """
+        (_, offset, lines) = self.checkpoint(start)
+        values = {_var_id(line): line for line in lines}
+        block = None
+        with open(self.vcd_name, "rb") as fp:
+            fp.seek(offset)
+            for line in fp:
+                line = line.decode().rstrip("\n")
+                if not line or line[0] == "$":
+                    continue
+                if line[0] != "#":
+                    if block is None:
+                        values[_var_id(line)] = line
+                    else:
+                        block[1].append(line)
+                    continue
+
+                ts = int(line[1:])
+                if ts <= start:
+                    continue
+                if block is None:
+                    yield (start, list(values.values()))
+                else:
+                    yield block
+                if end is not None and ts > end:
+                    return
+                block = (ts, [])
+
+        if block is None:
+            yield (start, list(values.values()))
+        else:
+            yield block
+
+    def write_window(self, fp, start, end=None):
+        """Write a VCD with only the value changes from ``start`` to ``end``.
+
+        Values at ``start`` become the initial values of the VCD.
+
+        Parameters
+        ----------
+        fp: file
+            Text file to write to.
+        start: int
+            First timestamp.
+        end: None or int
+            Last timestamp, or ``None`` for the end of the VCD.
+        """
+        with open(self.vcd_name, "rb") as vcd:
+            fp.write(vcd.read(self.header_size).decode())
+
+        first = True
+        for (ts, changes) in self.changes(start, end):
+            fp.write(f"#{ts}\n")
+            if first:
+                fp.write("$dumpvars\n")
+            fp.writelines(line + "\n" for line in changes)
+            if first:
+                fp.write("$end\n")
+                first = False
@@ -3,12 +3,27 @@
 __doc__ = ""  # Hide from Sphinx docs while making pydocstyle happy... I
 # don't think it looks nice in the docs.
 
+import argparse
+import cProfile
+import functools
+import gzip
+import os
 import pytest
-import in_place
-from amaranth import Elaboratable
-from amaranth.sim import Simulator
+import sys
+import tempfile
+import time
 
-from ._marker import Testbench
+from ._marker import Design, Testbench
+from ._metrics import (BenchmarkResult, SimMetrics, summarize,
+                       summarize_benchmarks, time_vcd_updates)
+from . import (_backend, _coverage, _diskcache, _fst, _golden, _monitor,
+               _parallel, _profile, _schedule, _snapshot, _stream)
+from ._deadline import run_with_deadline
+from ._vcd import IndexedVCD, WindowedVCD, extend_index, index_end
+
+
+# Subdirectory of .pytest_cache/d for the sim_disk_cache ini option.
+_DISK_CACHE_DIR = "amaranth-sim-compiled"
 
 
 def pytest_addoption(parser):  # noqa: D103
@@ -18,6 +33,79 @@ def pytest_addoption(parser):  # noqa: D103
         action="store_true",
         help="generate Value Change Dump (vcds) from simulations",
     )
+    group.addoption(
+        "--vcds-format",
+        choices=("vcd", "gz", "fst"),
+        default=None,
+        help="format of vcds: 'vcd' (default) for plain text, 'gz' to gzip "
+             "vcds while simulating, or 'fst' for compressed binary FST "
+             "files (requires pylibfst). Implies --vcds",
+    )
+    group.addoption(
+        "--vcds-on-failure",
+        action="store_true",
+        help="only keep vcds of tests whose simulation failed. Implies "
+             "--vcds",
+    )
+    group.addoption(
+        "--sim-durations",
+        type=int,
+        default=None,
+        metavar="N",
+        help="show N slowest simulations, split into elaboration, "
+             "simulator, and vcd time (N=0 for all)",
+    )
+    group.addoption(
+        "--sim-profile",
+        action="store_true",
+        help="profile simulations with cProfile, writing a .prof file per "
+             "test and showing testbench and simulator hotspots",
+    )
+    group.addoption(
+        "--sim-group-by-design",
+        action="store_true",
+        help="with pytest-xdist, run tests sharing the same mod and clks "
+             "parameters on the same worker (implies --dist=loadgroup)",
+    )
+    group.addoption(
+        "--sim-coverage",
+        nargs="?",
+        const="sim-coverage.json",
+        default=None,
+        metavar="PATH",
+        help="record toggle coverage of every signal and state coverage of "
+             "every FSM, merged into the JSON file PATH (default: "
+             "sim-coverage.json) across tests, workers, and sessions",
+    )
+    group.addoption(
+        "--sim-longest-first",
+        action="store_true",
+        help="run tests in order of decreasing duration, as recorded in "
+             ".pytest_cache by earlier sessions with this option or "
+             "--sim-shard",
+    )
+    group.addoption(
+        "--sim-shard",
+        type=_shard_option,
+        default=None,
+        metavar="I/N",
+        help="only run shard I of N (counted from 1), splitting tests into "
+             "N shards of balanced total duration, as recorded in "
+             ".pytest_cache by earlier sessions with this option or "
+             "--sim-longest-first",
+    )
+    group.addoption(
+        "--sim-update-golden",
+        action="store_true",
+        help="record the golden traces of tests marked with sim_golden, "
+             "instead of comparing simulations against them",
+    )
+    group.addoption(
+        "--sim-cache-clear",
+        action="store_true",
+        help="remove the on-disk cache of compiled designs at the start of "
+             "the session",
+    )
     parser.addini(
         "long_vcd_filenames",
         type="bool",
@@ -31,6 +119,285 @@ def pytest_addoption(parser):  # noqa: D103
         help="extend simulation time in failing vcds by the supplied number "
              "of femtoseconds"
     )
+    parser.addini(
+        "vcd_window",
+        type="string",
+        default="0",
+        help="only keep the last N femtoseconds of vcds, or the last N "
+             "cycles of the fastest clock if given as 'N cycles'. 0 keeps "
+             "everything"
+    )
+    parser.addini(
+        "vcd_index",
+        type="string",
+        default="0",
+        help="next to plain-text vcds, write a .vcd.idx index with the value "
+             "of every signal about every N megabytes of vcd, to seek to a "
+             "time without parsing the vcd up to it. 0 (default) writes no "
+             "index"
+    )
+    parser.addini(
+        "cache_simulators",
+        type="bool",
+        default=False,
+        help="if set, reuse simulators between tests which share the same "
+             "mod and clks"
+    )
+    parser.addini(
+        "sim_disk_cache",
+        type="bool",
+        default=False,
+        help="if set, cache the simulator's compiled designs in "
+             ".pytest_cache between sessions"
+    )
+    parser.addini(
+        "sim_disk_cache_size",
+        type="string",
+        default="256",
+        help="evict least recently used compiled designs when the on-disk "
+             "cache grows past N megabytes"
+    )
+    parser.addini(
+        "sim_backend",
+        type="string",
+        default="pysim",
+        help="simulation engine: 'pysim', the name of an installed engine "
+             "(e.g. 'cxxrtl'), or 'module:Class'. Falls back to pysim if the "
+             "engine isn't installed or a test needs pysim-only features"
+    )
+    parser.addini(
+        "sim_deadline",
+        type="string",
+        default="0",
+        help="fail simulations that run past N femtoseconds of simulated "
+             "time, or N cycles of the fastest clock if given as 'N "
+             "cycles'. 0 means no limit"
+    )
+    parser.addini(
+        "sim_deadline_wall",
+        type="string",
+        default="0",
+        help="fail simulations that take longer than N seconds of wall-clock "
+             "time. 0 means no limit"
+    )
+
+
+@pytest.hookimpl(trylast=True)
+def pytest_configure(config):  # noqa: D103
+    config.addinivalue_line(
+        "markers",
+        "sim_deadline(time=None, cycles=None, wall=None): fail the "
+        "simulation after 'time' femtoseconds or 'cycles' cycles of the "
+        "fastest clock of simulated time, or 'wall' seconds of wall-clock "
+        "time; overrides the sim_deadline and sim_deadline_wall ini options"
+    )
+    config.addinivalue_line(
+        "markers",
+        "sim_backend(name): simulation engine to use for this test; "
+        "overrides the sim_backend ini option"
+    )
+    config.addinivalue_line(
+        "markers",
+        "sim_init(testbench=tb): run tb once per mod and clks, and start "
+        "this test from the resulting simulator state"
+    )
+    config.addinivalue_line(
+        "markers",
+        "sim_golden(*names): compare the named signals (every signal if none "
+        "are named) with the test's golden trace while simulating; record "
+        "the trace with --sim-update-golden"
+    )
+
+    # Groups are only honored by pytest-xdist's loadgroup scheduler. -n
+    # implies --dist=load by the time this runs.
+    dist = getattr(config.option, "dist", "no")
+    if config.getoption("sim_group_by_design"):
+        if dist == "load":
+            config.option.dist = "loadgroup"
+        elif dist not in ("no", "loadgroup"):
+            raise pytest.UsageError("--sim-group-by-design needs "
+                                    f"--dist=loadgroup, not {dist}")
+
+    # Workers parse the original command line, so they need to be told that
+    # the controller switched to loadgroup.
+    workerinput = getattr(config, "workerinput", {})
+    if workerinput.get("amaranth_sim_loadgroup"):
+        config.option.loadgroup = True
+
+    # Design keys mapped to [shared Design, number of tests left to run], and
+    # session-wide caches which may hold on to constructed designs.
+    config._sim_designs = {}
+    config._sim_caches = []
+
+    longest_first = config.getoption("sim_longest_first")
+    shard = config.getoption("sim_shard")
+    if longest_first or shard is not None:
+        if getattr(config, "cache", None) is None:
+            raise pytest.UsageError("--sim-longest-first and --sim-shard need "
+                                    "the cacheprovider plugin")
+        config.pluginmanager.register(
+            _schedule.Schedule(config, longest_first, shard),
+            "amaranth-sim-schedule")
+
+    path = config.getoption("sim_coverage")
+    if path is not None:
+        config.pluginmanager.register(
+            _coverage.CoverageReport(config, path), "amaranth-sim-coverage")
+
+
+def pytest_sessionstart(session):  # noqa: D103
+    config = session.config
+    # Only the pytest-xdist controller (or a non-distributed session) clears
+    # the cache, before any worker starts using it.
+    if config.getoption("sim_cache_clear") and \
+            not hasattr(config, "workerinput") and \
+            getattr(config, "cache", None) is not None:
+        _diskcache.clear(_disk_cache_dir(config.cache))
+
+
+@pytest.hookimpl(optionalhook=True)
+def pytest_configure_node(node):  # noqa: D103
+    if node.config.option.dist == "loadgroup":
+        node.workerinput["amaranth_sim_loadgroup"] = True
+
+
+@pytest.hookimpl(tryfirst=True)
+def pytest_collection_modifyitems(config, items):  # noqa: D103
+    # Must run before pytest-xdist's worker hook, which reads xdist_group
+    # marks.
+    if not (config.getoption("sim_group_by_design") and
+            config.pluginmanager.hasplugin("xdist")):
+        return
+
+    # Every worker collects the same items in the same order, so numbering
+    # distinct mod objects in order of appearance gives the same group names
+    # in every worker. A mod object shared by several test files is one
+    # group, so it is still elaborated once.
+    ordinals = {}
+    for item in items:
+        params = getattr(getattr(item, "callspec", None), "params", {})
+        if "mod" not in params:
+            continue
+
+        mod = params["mod"]
+        mod_key = mod.key if isinstance(mod, Design) else id(mod)
+        ids = [_param_id(config, params.get(name), name)
+               for name in ("mod", "clks")]
+        seen = ordinals.setdefault(ids[0], {})
+        n = seen.setdefault(mod_key, len(seen))
+        name = f"{ids[0]}{n if n else ''}-{ids[1]}"
+        item.add_marker(pytest.mark.xdist_group(name))
+
+
+def pytest_collection_finish(session):  # noqa: D103
+    # Equal designs share one instance, which is released once the last
+    # selected test using it is torn down. pytest-xdist workers collect every
+    # test but only run some, so they keep designs until the session ends.
+    designs = session.config._sim_designs
+    for item in session.items:
+        params = getattr(getattr(item, "callspec", None), "params", {})
+        mod = params.get("mod")
+        if not isinstance(mod, Design):
+            continue
+
+        entry = designs.setdefault(mod.key, [mod, 0])
+        entry[1] += 1
+        if entry[0] is not mod:
+            mod._shared = entry[0]
+
+
+@pytest.hookimpl(tryfirst=True)
+def pytest_runtest_call(item):  # noqa: D103
+    # Fixtures see the Design, which forwards attribute access; the test
+    # itself gets the constructed design.
+    funcargs = getattr(item, "funcargs", {})
+    if isinstance(funcargs.get("mod"), Design):
+        funcargs["mod"] = funcargs["mod"].build()
+
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtest_teardown(item):  # noqa: D103
+    yield
+    params = getattr(getattr(item, "callspec", None), "params", {})
+    mod = params.get("mod")
+    if not isinstance(mod, Design):
+        return
+    entry = item.config._sim_designs.get(mod.key)
+    if entry is None:
+        return
+
+    entry[1] -= 1
+    if entry[1] > 0:
+        return
+
+    (shared, _) = item.config._sim_designs.pop(mod.key)
+    instance = shared._instance
+    shared._instance = None
+    if instance is None:
+        return
+    for cache in item.config._sim_caches:
+        for (key, value) in list(cache.items()):
+            if value[0] is instance:
+                del cache[key]
+
+
+def _param_id(config, val, argname):
+    pid = config.hook.pytest_make_parametrize_id(config=config, val=val,
+                                                 argname=argname)
+    return str(val) if pid is None else pid
+
+
+def _shard_option(value):
+    try:
+        (index, count) = (int(n) for n in value.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            f"invalid shard {value!r} (use I/N, e.g. 1/4)") from None
+    if not 1 <= index <= count:
+        raise argparse.ArgumentTypeError(
+            f"invalid shard {value!r} (I must be between 1 and N)")
+    return (index, count)
+
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtest_makereport(item, call):  # noqa: D103
+    outcome = yield
+    if call.when != "call":
+        return
+
+    # Attach to the report, not the item, so that results survive the trip
+    # from pytest-xdist workers.
+    metrics = getattr(item, "_sim_metrics", None)
+    if metrics is not None:
+        outcome.get_result().sim_metrics = metrics.to_json()
+
+    bench = getattr(item, "_sim_benchmark", None)
+    if bench is not None and bench.result is not None:
+        outcome.get_result().sim_benchmark = bench.result.to_json()
+
+    profile = getattr(item, "_sim_profile", None)
+    if profile is not None:
+        outcome.get_result().sim_profile = profile
+
+    coverage = getattr(item, "_sim_coverage", None)
+    if coverage is not None:
+        outcome.get_result().sim_coverage = coverage
+
+
+def pytest_terminal_summary(terminalreporter):  # noqa: D103
+    count = terminalreporter.config.getoption("sim_durations")
+    if count is not None:
+        summarize(terminalreporter, count)
+    summarize_benchmarks(terminalreporter)
+    if terminalreporter.config.getoption("sim_profile"):
+        _profile.summarize(terminalreporter)
+
+
+def _is_elaboratable(val):
+    # Amaranth is slow to import, and this hook runs for every parameter of
+    # every test. If amaranth isn't imported yet, val can't be elaboratable.
+    hdl = sys.modules.get("amaranth.hdl")
+    return hdl is not None and isinstance(val, hdl.Elaboratable)
 
 
 def pytest_make_parametrize_id(config, val, argname):  # noqa: D103
@@ -43,7 +410,10 @@ def pytest_make_parametrize_id(config, val, argname):  # noqa: D103
                              for (k, v) in val.items()])
         else:
             return "comb"
-    elif isinstance(val, Elaboratable) and argname in ("mod"):
+    elif argname in ("mod") and isinstance(val, Design):
+        return getattr(val.factory, "__name__",
+                       val.factory.__class__.__name__).lower()
+    elif argname in ("mod") and _is_elaboratable(val):
         return val.__class__.__name__.lower()
     else:
         return None
@@ -65,17 +435,44 @@ class SimulatorFixture:
         The :mod:`pytest` ``request`` fixture.
     cfg: ~_pytest.config.Config
         The :mod:`pytest` :func:`~_pytest.fixtures.pytestconfig` fixture.
+    cache: None or dict
+        Session-wide cache of simulators, or ``None`` if the
+        ``cache_simulators`` ini option is not set.
+    compile_cache: None or CompileCache
+        On-disk cache of compiled designs, or ``None`` if the
+        ``sim_disk_cache`` ini option is not set.
+    snapshots: None or dict
+        Session-wide cache of simulators and their state after ``sim_init``
+        testbenches, used if ``cache`` is ``None``.
 
     Raises
     ------
     :exception:`Valuerror`
         If clocks aren't ``None``, :class:`float`, or :class:`dict` of
         :class:`str`: :class:`float`.
+    :exception:`pytest.UsageError`
+        If the ``sim_deadline`` marker is given in cycles, but there are no
+        clocks.
+    :exception:`pytest.UsageError`
+        If the ``sim_backend`` ini option or marker names an engine which
+        isn't installed, or a ``module:Class`` which isn't a simulation
+        engine.
+    :exception:`pytest.UsageError`
+        If ``--vcds-format=fst`` is given, but :mod:`pylibfst` isn't
+        installed, or the ``vcd_window`` ini option is set.
+
+    Attributes
+    ----------
+    metrics: ~pytest_amaranth_sim.SimMetrics
+        Wall-clock and simulated time of this fixture's simulation. Shown in
+        the terminal summary with ``--sim-durations``.
     """  # noqa: E501
 
-    def __init__(self, mod, clks, req, cfg):
-        self.mod = mod
+    def __init__(self, mod, clks, req, cfg, cache=None, compile_cache=None,
+                 snapshots=None):
+        self.mod = mod.build() if isinstance(mod, Design) else mod
         self.clks = clks
+        self.compile_cache = compile_cache
 
         if cfg.getini("long_vcd_filenames"):
             self.name = req.node.name + "-" + req.module.__name__
@@ -83,20 +480,211 @@ class SimulatorFixture:
             self.name = req.node.name
 
         self.extend = int(cfg.getini("extend_vcd_time"))
+        self._init_deadline(req, cfg)
+
+        vcds_format = cfg.getoption("vcds_format")
+        self.vcds_on_failure = cfg.getoption("vcds_on_failure")
+        self.vcds = cfg.getoption("vcds") or vcds_format is not None or \
+            self.vcds_on_failure
+        self.window = 0
+        if self.vcds:
+            self.window = self._ini_fs(cfg, "vcd_window")
+            if vcds_format == "fst":
+                _fst.import_pylibfst()
+                if self.window:
+                    raise pytest.UsageError("vcd_window is not supported "
+                                            "with --vcds-format=fst")
+                self.vcd_ext = ".fst"
+            elif vcds_format == "gz":
+                self.vcd_ext = ".vcd.gz"
+            else:
+                self.vcd_ext = ".vcd"
+            # gzip streams can't be seeked into, and FST has its own index.
+            self.vcd_index = 0
+            if self.vcd_ext == ".vcd":
+                self.vcd_index = int(float(cfg.getini("vcd_index")) *
+                                     2**20)
+
+        self.metrics = SimMetrics()
+        self.time_vcd_updates = cfg.getoption("sim_durations") is not None
+        self.profile = cfg.getoption("sim_profile")
+        self.coverage = cfg.getoption("sim_coverage") is not None
+        self.node = req.node
+        marker = req.node.get_closest_marker("sim_init")
+        self.init = None
+        if marker is not None:
+            # A lone callable argument would make pytest apply the marker to
+            # it, so the testbench is normally passed by keyword.
+            self.init = marker.kwargs.get(
+                "testbench", marker.args[0] if marker.args else None)
+        self.snapshot = None
+        self.monitors = {}
+        marker = req.node.get_closest_marker("sim_golden")
+        self.golden = None if marker is None else marker.args
+        self.update_golden = cfg.getoption("sim_update_golden")
+        self.golden_name = req.node.name
+        self.golden_dir = None
+        if marker is not None:
+            # Node.path needs pytest 7.
+            path = str(req.node.fspath)
+            self.golden_dir = os.path.join(
+                os.path.dirname(path), "golden",
+                os.path.splitext(os.path.basename(path))[0])
+        self._golden_runs = 0
+        self.engine = self._select_engine(req, cfg, cache)
+
+        start = time.perf_counter()
+        if cache is None and self.init is None:
+            self.sim = self._make_simulator()
+        else:
+            # Snapshots can only be restored into the simulator they were
+            # taken from, so sim_init always shares simulators.
+            self._cached_simulator(cache if cache is not None else snapshots)
+        self.metrics.elaborate = time.perf_counter() - start
+
+    def _cached_simulator(self, cache):
+        # Key on identity; the cache holds a reference to mod so that its id
+        # can't be reused by another object during the session.
+        key = (id(self.mod), _clks_key(self.clks), self.engine)
+        try:
+            _, self.sim, processes, snapshots = cache[key]
+        except KeyError:
+            self.sim = self._make_simulator()
+            processes = frozenset(self.sim._engine._processes)
+            snapshots = {}
+            cache[key] = (self.mod, self.sim, processes, snapshots)
+        else:
+            self._rewind(processes)
+
+        if self.init is None:
+            return
+
+        # Hold a reference to init for the same reason as mod.
+        try:
+            _, self.snapshot = snapshots[id(self.init)]
+        except KeyError:
+            self.sim.add_testbench(self.init)
+            self.sim.run()
+            self.snapshot = _snapshot.take(self.sim)
+            snapshots[id(self.init)] = (self.init, self.snapshot)
+            self._rewind(processes)
+        _snapshot.restore(self.sim, self.snapshot)
+
+    def _select_engine(self, req, cfg, cache):
+        marker = req.node.get_closest_marker("sim_backend")
+        name = marker.args[0] if marker else cfg.getini("sim_backend")
+        engine = _backend.resolve(name)
+
+        # These reach into pysim's internals.
+        features = [feature for (feature, used) in (
+            ("cache_simulators", cache is not None),
+            ("sim_disk_cache", self.compile_cache is not None),
+            ("sim_deadline", self.deadline or self.deadline_wall),
+            ("--sim-durations", self.time_vcd_updates),
+            ("sim_init", self.init is not None),
+            ("--sim-coverage", self.coverage),
+            ("sim_golden", self.golden is not None),
+            ("--vcds-format=fst", self.vcds and self.vcd_ext == ".fst"),
+        ) if used]
+        return _backend.fallback(engine, name, features)
 
-        self.sim = Simulator(self.mod)
-        self.vcds = cfg.getoption("vcds")
+    def _fastest_period(self, option):
+        if isinstance(self.clks, float):
+            return self.clks
+        elif isinstance(self.clks, dict) and self.clks:
+            return min(self.clks.values())
+        else:
+            raise pytest.UsageError(f"{option} can only be given in cycles "
+                                    "for clocked modules")
+
+    def _cycles_to_fs(self, cycles, option):
+        # Same rounding as the simulator.
+        return int(cycles * self._fastest_period(option) * 1e15)
+
+    def _ini_fs(self, cfg, option):
+        value = cfg.getini(option).strip()
+        if not value.endswith("cycles"):
+            return int(value)
+
+        # Ini options apply to every test, so cycles don't fail tests of
+        # modules without clocks; the option just doesn't apply to them.
+        if not self.clks:
+            return 0
+        return self._cycles_to_fs(int(value[:-len("cycles")]), option)
+
+    def _init_deadline(self, req, cfg):
+        self.deadline = self._ini_fs(cfg, "sim_deadline") or None
+        self.deadline_wall = float(cfg.getini("sim_deadline_wall")) or None
+
+        marker = req.node.get_closest_marker("sim_deadline")
+        if marker is None:
+            return
+
+        time_fs = marker.kwargs.get("time")
+        cycles = marker.kwargs.get("cycles")
+        wall = marker.kwargs.get("wall")
+        if time_fs is not None:
+            self.deadline = time_fs or None
+        elif cycles is not None:
+            self.deadline = self._cycles_to_fs(cycles, "sim_deadline") or None
+        if wall is not None:
+            self.deadline_wall = wall or None
+
+    def _make_simulator(self):
+        # Only import amaranth once a simulator is needed, so that merely
+        # loading this plugin doesn't.
+        from amaranth.sim import Simulator
+
+        with _diskcache.compiling_with(self.compile_cache):
+            sim = Simulator(self.mod, engine=self.engine)
 
         if self.clks:
             if isinstance(self.clks, float):
-                self.sim.add_clock(self.clks)
+                sim.add_clock(self.clks)
             elif isinstance(self.clks, dict):
                 for domain, per in self.clks.items():
-                    self.sim.add_clock(per, domain=domain)
+                    sim.add_clock(per, domain=domain)
             else:
                 raise ValueError("clks should be a float or dict of floats, "
                                  f"not {type(self.clks)}")
 
+        return sim
+
+    def _rewind(self, processes):
+        # Simulator.reset() restarts every testbench and process that was ever
+        # added. Drop the ones a previous test added, leaving only the design
+        # and its clocks, before resetting signals/memories/time.
+        engine = self.sim._engine
+        stale = [*engine._testbenches, *(engine._processes - processes)]
+        for proc in stale:
+            # Stale triggers see that their process no longer waits on them
+            # and unregister themselves.
+            proc.waits_on = None
+        _close_coroutines(stale)
+        engine._testbenches.clear()
+        engine._processes.intersection_update(processes)
+        engine._active_triggers.clear()
+        self.sim.reset()
+
+    def _base_processes(self):
+        # The design's own processes, for _restart(). Only pysim exposes them.
+        from amaranth.sim.pysim import PySimEngine
+
+        if issubclass(self.engine, PySimEngine):
+            return frozenset(self.sim._engine._processes)
+        return None
+
+    def _restart(self, base):
+        # Back to the state the test started from.
+        if base is not None:
+            self._rewind(base)
+        else:
+            # Other engines don't expose their testbenches to drop, so get a
+            # new simulator instead.
+            self.sim = self._make_simulator()
+        if self.snapshot is not None:
+            _snapshot.restore(self.sim, self.snapshot)
+
     def run(self, *, testbenches=[], processes=[]):
         r"""Run a simulation using Amaranth's :class:`amaranth.sim.Simulator`.
 
@@ -113,6 +701,15 @@ class SimulatorFixture:
         testbenches and processes should raise :exc:`AssertionError` to
         indicate test failure of a given ``mod``.
 
+        If a simulated-time or wall-clock deadline is set, using the
+        ``sim_deadline`` or ``sim_deadline_wall`` ini options or the
+        ``sim_deadline`` marker, :meth:`run` fails the test once the deadline
+        passes, or as soon as the simulation can no longer make progress.
+
+        If the test is marked with ``sim_golden``, :meth:`run` compares the
+        marked signals with the test's golden trace while simulating, and
+        fails the test at the first divergence.
+
         Parameters
         ----------
         testbenches: list of Callable[[SimulatorContext], Coroutine] or :class:`.Testbench`
@@ -146,27 +743,805 @@ class SimulatorFixture:
 
         for p in processes:
             self.sim.add_process(p)
+        for (domain, properties) in self.monitors.items():
+            self.sim.add_process(_monitor.monitor(self.sim._engine, domain,
+                                                  properties))
 
-        if self.vcds:
+        observer = None
+        if self.coverage:
+            observer = _coverage.CoverageObserver(self.sim, self.mod)
+            observer.attach()
+        golden = None
+        if self.golden is not None:
+            golden = _golden.GoldenTrace(self.sim, self.golden,
+                                         self._golden_path(),
+                                         self.update_golden)
+
+        # Where this run starts, e.g. after a sim_init snapshot, or after
+        # an earlier run if the simulator was reset since.
+        now = self.sim._engine.now
+        try:
+            if golden is not None:
+                golden.attach()
+            self._run_traced()
+            if golden is not None:
+                golden.finish()
+        except BaseException:
+            # Don't leave testbenches suspended for the garbage collector to
+            # close at some random point, possibly during another test. Only
+            # pysim exposes them.
+            engine = self.sim._engine
+            _close_coroutines([*getattr(engine, "_testbenches", ()),
+                               *getattr(engine, "_processes", ())])
+            raise
+        finally:
+            if golden is not None:
+                golden.detach()
+            if observer is not None:
+                observer.detach()
+                self.node._sim_coverage = _coverage.merge(
+                    getattr(self.node, "_sim_coverage", {}),
+                    observer.to_json())
+            self.metrics.sim_time = self.sim._engine.now
+            self.metrics.count_edges(self.clks, now)
+
+    def _golden_path(self):
+        # Later runs in the same test get their own golden traces.
+        runs = self._golden_runs
+        self._golden_runs += 1
+        suffix = f".{runs}" if runs else ""
+        return os.path.join(self.golden_dir,
+                            f"{self.golden_name}{suffix}.golden.gz")
+
+    def assert_always(self, cond, *, domain="sync", name=None):
+        """Check that ``cond`` is true at every edge of ``domain``'s clock.
+
+        Like the other ``assert_*`` methods, this registers a clocked
+        assertion which is checked during every later call to :meth:`run`
+        (and the other ``run_*`` methods). All assertions of a clock domain
+        are checked by a single process, using values sampled just before
+        each active clock edge, so they are much cheaper than a testbench per
+        check. Assertions are not checked while the domain is in reset.
+
+        The test fails with an :exc:`AssertionError` naming the assertion,
+        the cycle (counted from the start of the simulation), and the values
+        of the signals in the assertion's expressions.
+
+        Parameters
+        ----------
+        cond: ~amaranth.hdl.Value
+            Condition.
+        domain: str
+            Clock domain.
+        name: None or str
+            Name in failure messages. Defaults to a representation of the
+            expressions.
+        """
+        self._add_property(domain, _monitor.Always(cond, name))
+
+    def assert_delayed(self, actual, expected, *, cycles=1, domain="sync",
+                       name=None):
+        """Check that ``actual`` equals ``expected`` ``cycles`` cycles earlier.
+
+        For example, ``sim.assert_delayed(mod.o, mod.a * mod.b)`` checks a
+        registered multiplier. See :meth:`assert_always`.
+
+        Parameters
+        ----------
+        actual: ~amaranth.hdl.Value
+            Delayed result.
+        expected: ~amaranth.hdl.Value
+            Expected result, ``cycles`` clock edges before ``actual``.
+        cycles: int
+            Latency in cycles of ``domain``.
+        domain: str
+            Clock domain.
+        name: None or str
+            Same as :meth:`assert_always`.
+        """
+        self._add_property(domain, _monitor.Delayed(actual, expected, cycles,
+                                                    name))
+
+    def assert_within(self, trigger, response, cycles, *, domain="sync",
+                      name=None):
+        """Check that ``response`` follows ``trigger`` within ``cycles``.
+
+        Whenever ``trigger`` is true, ``response`` must be true in the same
+        cycle or one of the next ``cycles`` cycles, e.g. ``valid`` implies
+        ``ready`` within 4 cycles. A single ``response`` satisfies every
+        ``trigger`` before it. See :meth:`assert_always`.
+
+        Parameters
+        ----------
+        trigger: ~amaranth.hdl.Value
+            Condition which must be followed by ``response``.
+        response: ~amaranth.hdl.Value
+            Expected condition.
+        cycles: int
+            Maximum number of cycles of ``domain`` until ``response``.
+        domain: str
+            Clock domain.
+        name: None or str
+            Same as :meth:`assert_always`.
+        """
+        self._add_property(domain, _monitor.Within(trigger, response, cycles,
+                                                   name))
+
+    def _add_property(self, domain, prop):
+        self.monitors.setdefault(domain, []).append(prop)
+
+    def run_vectors(self, argnames, argvalues, testbench, *, ids=None,
+                    processes=[]):
+        """Run many stimulus vectors back to back in a single simulation.
+
+        ``argnames`` and ``argvalues`` are interpreted like the arguments of
+        :func:`pytest.mark.parametrize`. A single testbench awaits
+        ``testbench(ctx, **vector)`` for each vector in order, so the
+        simulator is only built and started once, however many vectors
+        there are. Vectors start from whatever state the previous vector left
+        the design in.
+
+        An :exc:`AssertionError` raised while checking a vector doesn't stop
+        the remaining vectors. Once all vectors ran, the test fails with a
+        single :exc:`AssertionError` listing every failing vector by its
+        parametrize-style ID. Other exceptions propagate immediately, like in
+        :meth:`run`.
+
+        Parameters
+        ----------
+        argnames: str or list of str
+            Comma-separated string or list of argument names.
+        argvalues: list
+            List of vectors. A vector is a tuple of values if there are
+            several ``argnames``, or a single value otherwise.
+        testbench: Callable[..., Coroutine]
+            Async function taking a :class:`~amaranth.sim.SimulatorContext`
+            and one keyword argument per name in ``argnames``.
+        ids: None or list of str or Callable
+            Vector IDs, as for :func:`pytest.mark.parametrize`. By default,
+            IDs come from ``pytest_make_parametrize_id`` hooks (including
+            this plugin's) or the values themselves.
+        processes: list of Callable[[SimulatorContext], Coroutine]
+            Same as :meth:`run`.
+
+        Raises
+        ------
+        :exception:`ValueError`
+            If ``ids`` is a list whose length doesn't match ``argvalues``.
+        """  # noqa: DOC502
+        if isinstance(argnames, str):
+            argnames = [n.strip() for n in argnames.split(",") if n.strip()]
+        if len(argnames) == 1:
+            argvalues = [(v,) for v in argvalues]
+        vector_ids = self._vector_ids(argnames, argvalues, ids)
+
+        async def vectors(ctx):
+            failures = []
+            for (vid, values) in zip(vector_ids, argvalues):
+                try:
+                    await testbench(ctx, **dict(zip(argnames, values)))
+                except AssertionError as e:
+                    failures.append((vid, e))
+
+            # Fail inside the simulation, so that VCDs are handled like any
+            # other failure.
+            if failures:
+                lines = [f"{len(failures)} of {len(argvalues)} vectors "
+                         "failed:"]
+                for (vid, e) in failures:
+                    msg = str(e) or "AssertionError"
+                    lines.append(f"[{vid}] " +
+                                 msg.replace("\n", "\n" + " " * 4))
+                raise AssertionError("\n".join(lines))
+
+        self.run(testbenches=[vectors], processes=processes)
+
+    def _vector_ids(self, argnames, argvalues, ids):
+        if isinstance(ids, (list, tuple)):
+            if len(ids) != len(argvalues):
+                raise ValueError(f"got {len(ids)} ids for {len(argvalues)} "
+                                 "vectors")
+            return [str(i) for i in ids]
+
+        config = self.node.config
+        vector_ids = []
+        for (idx, values) in enumerate(argvalues):
+            parts = []
+            for (name, val) in zip(argnames, values):
+                part = ids(val) if callable(ids) else None
+                if part is None:
+                    part = config.hook.pytest_make_parametrize_id(
+                        config=config, val=val, argname=name)
+                if part is None:
+                    if val is None or isinstance(val,
+                                                 (str, int, float, complex)):
+                        part = str(val)
+                    else:
+                        part = f"{name}{idx}"
+                parts.append(str(part))
+            vector_ids.append("-".join(parts))
+        return vector_ids
+
+    def run_stream(self, outputs, *, inputs=[], golden=None, cycles=None,
+                   domain="sync", mismatches=10, processes=[]):
+        """Stream NumPy arrays through the design, one element per clock cycle.
+
+        For each cycle, every input signal is set to the next element of its
+        array, and after the next active edge of ``domain``'s clock, every
+        output signal is stored into a preallocated array. Once all cycles
+        ran, the recorded outputs are compared in bulk against ``golden``.
+
+        Requires :mod:`numpy`.
+
+        Parameters
+        ----------
+        outputs: list of ~amaranth.hdl.Signal
+            Signals to record.
+        inputs: list of (~amaranth.hdl.Signal, numpy.ndarray)
+            Signals to drive, and the value for each cycle. All arrays must
+            be the same length.
+        golden: None or Callable[..., numpy.ndarray or tuple of numpy.ndarray]
+            Vectorized reference model. Called with the input arrays, in the
+            order of ``inputs``, it returns the expected array of each output
+            (a single array if there is one output). If ``None``, outputs are
+            only recorded.
+        cycles: None or int
+            Number of cycles to run. Defaults to the length of the input
+            arrays; required if there are no ``inputs``.
+        domain: str
+            Clock domain to step.
+        mismatches: int
+            Maximum number of mismatching cycles to report per output.
+        processes: list of Callable[[SimulatorContext], Coroutine]
+            Same as :meth:`run`.
+
+        Returns
+        -------
+        list of numpy.ndarray
+            Recorded values of each output.
+
+        Raises
+        ------
+        :exception:`pytest.UsageError`
+            If :mod:`numpy` is not installed.
+        :exception:`ValueError`
+            If the input arrays have different lengths, are shorter than
+            ``cycles``, or the number of cycles can't be determined.
+        """  # noqa: DOC501, DOC502
+        np = _stream.import_numpy("sim.run_stream()")
+
+        lengths = {len(values) for (_, values) in inputs}
+        if len(lengths) > 1:
+            raise ValueError("input arrays must have the same length, not "
+                             f"{sorted(lengths)}")
+        if cycles is None:
+            if not lengths:
+                raise ValueError("cycles is required without inputs")
+            (cycles,) = lengths
+        elif lengths and cycles > min(lengths):
+            raise ValueError(f"input arrays have {min(lengths)} elements, "
+                             f"not {cycles}")
+
+        inputs = [(sig, np.asarray(values)[:cycles])
+                  for (sig, values) in inputs]
+        actual = [_stream.output_array(np, o, cycles) for o in outputs]
+        # Python ints are much cheaper to set than NumPy scalars.
+        columns = [(sig, values.tolist()) for (sig, values) in inputs]
+
+        async def stream(ctx):
+            tick = ctx.tick(domain)
+            for i in range(cycles):
+                for (sig, values) in columns:
+                    ctx.set(sig, values[i])
+                await tick
+                for (sig, arr) in zip(outputs, actual):
+                    arr[i] = ctx.get(sig)
+
+            if golden is None:
+                return
+
+            # Fail inside the simulation, so that VCDs are handled like any
+            # other failure.
+            expected = golden(*(values for (_, values) in inputs))
+            if len(outputs) == 1:
+                expected = (expected,)
+            report = _stream.mismatch_report(
+                np, inputs, outputs, actual,
+                [np.asarray(e) for e in expected], mismatches)
+            if report is not None:
+                raise AssertionError(report)
+
+        self.run(testbenches=[stream], processes=processes)
+        return actual
+
+    def run_mapped(self, *, inputs=[], stimulus=None, outputs=[],
+                   response=None, cycles=None, domain="sync", chunk=1 << 16,
+                   processes=[]):
+        """Replay records of a binary file into the design, one per clock cycle.
+
+        Like :meth:`run_stream`, but for stimulus too large to hold in
+        memory. ``stimulus`` is memory-mapped, and for each cycle, every
+        input signal is set to its field of the next record. After the next
+        active edge of ``domain``'s clock, every output signal is stored into
+        its field of the next record of the memory-mapped ``response`` file.
+        Records are converted ``chunk`` at a time, so memory use doesn't
+        depend on the length of the files.
+
+        The layout of the records is given by :meth:`record_dtype`.
+
+        Requires :mod:`numpy`.
+
+        Parameters
+        ----------
+        inputs: list of ~amaranth.hdl.Signal
+            Signals to drive, i.e. the fields of each record of
+            ``stimulus``.
+        stimulus: None or str or os.PathLike
+            Binary file of input records.
+        outputs: list of ~amaranth.hdl.Signal
+            Signals to record, i.e. the fields of each record of
+            ``response``.
+        response: None or str or os.PathLike
+            Binary file of output records, overwritten with one record per
+            cycle.
+        cycles: None or int
+            Number of cycles to run. Defaults to the number of records in
+            ``stimulus``; required without ``stimulus``.
+        domain: str
+            Clock domain to step.
+        chunk: int
+            Number of records converted at once.
+        processes: list of Callable[[SimulatorContext], Coroutine]
+            Same as :meth:`run`.
+
+        Returns
+        -------
+        None or numpy.memmap
+            The records of ``response``, if given.
+
+        Raises
+        ------
+        :exception:`pytest.UsageError`
+            If :mod:`numpy` is not installed.
+        :exception:`ValueError`
+            If only one of ``inputs`` and ``stimulus``, or of ``outputs`` and
+            ``response``, is given, if ``stimulus`` has fewer than ``cycles``
+            records, if the number of cycles can't be determined, or if it
+            is 0.
+        """  # noqa: DOC501, DOC502, E501
+        np = _stream.import_numpy("sim.run_mapped()")
+
+        if bool(inputs) != (stimulus is not None):
+            raise ValueError("inputs and stimulus must be given together")
+        if bool(outputs) != (response is not None):
+            raise ValueError("outputs and response must be given together")
+
+        if cycles is not None and cycles < 1:
+            raise ValueError(f"cycles must be at least 1, not {cycles}")
+
+        stim = None
+        if stimulus is not None:
+            # numpy can't map an empty file.
+            if not os.path.getsize(stimulus):
+                raise ValueError(f"{stimulus} has no records")
+            stim = np.memmap(stimulus, mode="r",
+                             dtype=_stream.record_dtype(np, inputs))
+            if cycles is None:
+                cycles = len(stim)
+            elif cycles > len(stim):
+                raise ValueError(f"{stimulus} has {len(stim)} records, not "
+                                 f"{cycles}")
+        elif cycles is None:
+            raise ValueError("cycles is required without stimulus")
+
+        resp = None
+        if response is not None:
+            resp = np.memmap(response, mode="w+", shape=(cycles,),
+                             dtype=_stream.record_dtype(np, outputs))
+
+        async def replay(ctx):
+            tick = ctx.tick(domain)
+            for start in range(0, cycles, chunk):
+                end = min(start + chunk, cycles)
+                # Python ints are much cheaper to set than NumPy scalars.
+                columns = [] if stim is None else [
+                    (sig, stim[name][start:end].tolist())
+                    for (sig, name) in zip(inputs, stim.dtype.names)]
+                recorded = [[] for _ in outputs]
+                for i in range(end - start):
+                    for (sig, values) in columns:
+                        ctx.set(sig, values[i])
+                    await tick
+                    for (sig, values) in zip(outputs, recorded):
+                        values.append(ctx.get(sig))
+
+                if resp is not None:
+                    for (name, values) in zip(resp.dtype.names, recorded):
+                        resp[name][start:end] = values
+
+        self.run(testbenches=[replay], processes=processes)
+        if resp is not None:
+            resp.flush()
+        return resp
+
+    def record_dtype(self, signals):
+        """Make the record layout of :meth:`run_mapped`'s binary files.
+
+        Each signal is a field named after it, in order and without padding:
+        the smallest of 1, 2, 4, or 8 bytes that fits the signal,
+        little-endian, and signed if the signal is. Use it to write stimulus
+        files, e.g. with :class:`numpy.memmap`.
+
+        Requires :mod:`numpy`.
+
+        Parameters
+        ----------
+        signals: list of ~amaranth.hdl.Signal
+            Signals of each record.
+
+        Returns
+        -------
+        numpy.dtype
+            Structured data type of a record.
+
+        Raises
+        ------
+        :exception:`pytest.UsageError`
+            If :mod:`numpy` is not installed.
+        :exception:`ValueError`
+            If a signal is wider than 64 bits, or two signals have the same
+            name.
+        """  # noqa: DOC502
+        np = _stream.import_numpy("sim.record_dtype()")
+        return _stream.record_dtype(np, signals)
+
+    def run_parallel(self, scenarios, *, workers=None, ids=None,
+                     processes=[]):
+        """Run independent sets of testbenches, each in its own process.
+
+        Each scenario is a list of testbenches, as for :meth:`run`. Every
+        scenario runs in a child process forked from the test, with its own
+        copy of the simulator, so scenarios neither share state nor wait for
+        each other. VCDs of a scenario are named after the test and the
+        scenario's ID.
+
+        An exception raised in a scenario doesn't stop the other scenarios.
+        Once all scenarios ran, the test fails with a single
+        :exc:`AssertionError` listing the traceback of every failing
+        scenario by its ID. :attr:`metrics` are summed across scenarios,
+        except for :attr:`~pytest_amaranth_sim.SimMetrics.run`, which grows by the wall-clock time of
+        running all scenarios.
+
+        Requires a platform which supports :func:`os.fork`. Forking while
+        other threads run can deadlock, so if the test process has other
+        threads, e.g. under pytest-xdist, scenarios run one after another
+        in the test process instead, each from the state the test started
+        from, with a warning.
+
+        Parameters
+        ----------
+        scenarios: list of list of Callable[[SimulatorContext], Coroutine] or :class:`.Testbench`
+            Testbenches of each scenario.
+        workers: None or int
+            Maximum number of scenarios running at once. Defaults to the
+            number of CPUs.
+        ids: None or list of str
+            Scenario IDs. Defaults to the index of each scenario.
+        processes: list of Callable[[SimulatorContext], Coroutine]
+            Processes added to every scenario, as for :meth:`run`.
+
+        Raises
+        ------
+        :exception:`pytest.UsageError`
+            If the platform can't fork.
+        :exception:`ValueError`
+            If ``ids`` has a different length than ``scenarios``.
+        """  # noqa: DOC501, DOC502, E501
+        if ids is None:
+            ids = [str(i) for i in range(len(scenarios))]
+        elif len(ids) != len(scenarios):
+            raise ValueError(f"got {len(ids)} ids for {len(scenarios)} "
+                             "scenarios")
+
+        (name, golden_name) = (self.name, self.golden_name)
+
+        def scenario(job):
+            (sid, testbenches) = job
+            # Scenarios may run in this process too, so leave the fixture as
+            # it was, and only return what this scenario adds to the metrics
+            # and coverage.
+            saved = (self.metrics, self._golden_runs)
+            coverage = getattr(self.node, "_sim_coverage", None)
+            if coverage is not None:
+                del self.node._sim_coverage
+            self.name = f"{name}-{sid}"
+            self.golden_name = f"{golden_name}-{sid}"
+            self.metrics = SimMetrics()
+            try:
+                self.run(testbenches=testbenches, processes=processes)
+                return (self.metrics,
+                        getattr(self.node, "_sim_coverage", None))
+            finally:
+                (self.name, self.golden_name) = (name, golden_name)
+                (self.metrics, self._golden_runs) = saved
+                if coverage is not None:
+                    self.node._sim_coverage = coverage
+                elif hasattr(self.node, "_sim_coverage"):
+                    del self.node._sim_coverage
+
+        start = time.perf_counter()
+        base = self._base_processes()
+        results = _parallel.fan_out(scenario, list(zip(ids, scenarios)),
+                                    workers, lambda: self._restart(base))
+        run = time.perf_counter() - start
+
+        for (result, _) in results:
+            if result is None:
+                continue
+            (metrics, coverage) = result
+            if coverage is not None:
+                self.node._sim_coverage = _coverage.merge(
+                    getattr(self.node, "_sim_coverage", {}), coverage)
+            self.metrics.vcd_update += metrics.vcd_update
+            self.metrics.vcd_files += metrics.vcd_files
+            self.metrics.sim_time += metrics.sim_time
+            for (domain, edges) in metrics.edges.items():
+                self.metrics.edges[domain] = \
+                    self.metrics.edges.get(domain, 0) + edges
+        self.metrics.run += run
+
+        failures = [(sid, tb) for (sid, (_, tb)) in zip(ids, results)
+                    if tb is not None]
+        if failures:
+            lines = [f"{len(failures)} of {len(scenarios)} scenarios "
+                     "failed:"]
+            for (sid, tb) in failures:
+                lines.append(f"[{sid}] " +
+                             tb.rstrip().replace("\n", "\n" + " " * 4))
+            raise AssertionError("\n".join(lines))
+
+    def _run_sim(self):
+        if self.profile:
+            profile = cProfile.Profile()
             try:
-                with self.sim.write_vcd(self.name + ".vcd",
-                                        self.name + ".gtkw"):
-                    self.sim.run()
-            except:
-                self._patch_vcds()
-                raise
+                self._run_sim_timed(profile.runcall)
+            finally:
+                profile.dump_stats(self.name + ".prof")
+                self.node._sim_profile = _profile.hotspots(profile)
         else:
-            self.sim.run()
+            self._run_sim_timed()
+
+    def _run_sim_timed(self, call=lambda f: f()):
+        start = time.perf_counter()
+        try:
+            if self.deadline is None and self.deadline_wall is None:
+                call(self.sim.run)
+            else:
+                call(lambda: run_with_deadline(self.sim, self.deadline,
+                                               self.deadline_wall))
+        finally:
+            self.metrics.run += time.perf_counter() - start
+
+    def _run_traced(self):
+        if not self.vcds:
+            self._run_sim()
+            return
 
-    def _patch_vcds(self):
-        with in_place.InPlace(self.name + ".vcd") as fp:
-            ts = 0
-            for line in fp:
-                if line[0] in "#":
-                    ts = int(line[1:-1])
-                fp.write(line)
+        start = time.perf_counter()
+        run = self.metrics.run
+        try:
+            self._run_traced_vcds()
+        finally:
+            # Opening, closing, patching, and moving the VCD files; time in
+            # Simulator.run() is counted separately.
+            self.metrics.vcd_files += time.perf_counter() - start - \
+                (self.metrics.run - run)
+
+    def _run_traced_vcds(self):
+        if self.vcds_on_failure:
+            # Trace into a scratch directory next to the final location, so
+            # that keeping the files of a failing test is only a rename.
+            with tempfile.TemporaryDirectory(prefix=".amaranth-sim-",
+                                             dir=".") as tmp:
+                prefix = os.path.join(tmp, "trace")
+                try:
+                    self._run_vcds(prefix)
+                except:
+                    os.replace(prefix + self.vcd_ext,
+                               self.name + self.vcd_ext)
+                    os.replace(prefix + ".gtkw", self.name + ".gtkw")
+                    if self.vcd_index:
+                        os.replace(prefix + self.vcd_ext + ".idx",
+                                   self.name + self.vcd_ext + ".idx")
+                    self._patch_gtkw_dumpfile()
+                    raise
+        else:
+            self._run_vcds(self.name)
+
+    def _run_fst(self, prefix):
+        # libfst writes the extension of failing waveforms itself, so there's
+        # nothing to patch afterwards.
+        with _fst.write_fst(self.sim, prefix + self.vcd_ext,
+                            prefix + ".gtkw", self.extend):
+            if self.time_vcd_updates:
+                time_vcd_updates(self.sim._engine._vcd_writers[-1],
+                                 self.metrics)
+            self._run_sim()
+
+    def _run_vcds(self, prefix):
+        if self.vcd_ext == ".fst":
+            self._run_fst(prefix)
+            return
+
+        vcd_name = prefix + self.vcd_ext
+        if self.vcd_ext == ".vcd.gz":
+            # compresslevel=9 (gzip.open's default) more than triples the
+            # runtime for a negligible size win; 6 is zlib's default.
+            vcd_file = gzip.open(vcd_name, "wt", compresslevel=6)
+        elif self.vcd_index:
+            vcd_file = IndexedVCD(open(vcd_name, "wb"), vcd_name + ".idx",
+                                  self.vcd_index)
+        else:
+            vcd_file = open(vcd_name, "w")
+
+        if self.window:
+            vcd_file = WindowedVCD(vcd_file, self.window)
+
+        try:
+            if self.snapshot is None:
+                write_vcd = self.sim.write_vcd
             else:
-                fp.write(f"#{ts + self.extend}\n")
+                write_vcd = functools.partial(_snapshot.write_vcd, self.sim)
+
+            with vcd_file, write_vcd(vcd_file, prefix + ".gtkw"):
+                if self.time_vcd_updates:
+                    time_vcd_updates(self.sim._engine._vcd_writers[-1],
+                                     self.metrics)
+                self._run_sim()
+        except:
+            self._patch_vcds(vcd_name)
+            raise
+
+    def _patch_vcds(self, vcd_name):
+        if self.vcd_ext == ".vcd.gz":
+            # Can't seek backwards through a gzip stream. But the VCD writer
+            # always finishes with a timestamp for the current simulation
+            # time, so use that. Concatenated gzip members form a valid gzip
+            # file.
+            ts = self.sim._engine.now
+            with gzip.open(vcd_name, "ab") as fp:
+                fp.write(f"#{ts + self.extend}\n".encode())
+            return
+
+        with open(vcd_name, "rb+") as fp:
+            if self.vcd_index:
+                ts = index_end(vcd_name)
+            else:
+                ts = _last_vcd_timestamp(fp)
+            fp.seek(0, os.SEEK_END)
+            fp.write(f"#{ts + self.extend}\n".encode())
+        if self.vcd_index:
+            extend_index(vcd_name, ts + self.extend)
+
+    def _patch_gtkw_dumpfile(self):
+        # The savefile still names the scratch file it was written next to.
+        with open(self.name + ".gtkw", "r+") as fp:
+            lines = [f'[dumpfile] "{self.name + self.vcd_ext}"\n'
+                     if line.startswith("[dumpfile]") else line
+                     for line in fp]
+            fp.seek(0)
+            fp.writelines(lines)
+            fp.truncate()
+
+
+class SimulatorBenchmark(SimulatorFixture):
+    """Fixture class which measures simulator throughput.
+
+    ``SimulatorBenchmark`` is a :class:`SimulatorFixture` that never writes
+    VCDs, and whose :meth:`run` method simulates the same testbenches for
+    several rounds, resetting the simulator in between. Its constructor is
+    private, and takes the same arguments as :class:`SimulatorFixture`.
+
+    Attributes
+    ----------
+    result: None or ~pytest_amaranth_sim.BenchmarkResult
+        Result of the last call to :meth:`run`.
+    """
+
+    def __init__(self, mod, clks, req, cfg, cache=None, compile_cache=None,
+                 snapshots=None):
+        super().__init__(mod, clks, req, cfg, cache, compile_cache,
+                         snapshots)
+        self.vcds = False
+        self.result = None
+
+    def run(self, *, testbenches=[], processes=[], rounds=5):
+        r"""Run a simulation for multiple rounds and measure its throughput.
+
+        Parameters
+        ----------
+        testbenches: list of Callable[[SimulatorContext], Coroutine] or :class:`.Testbench`
+            Same as :meth:`SimulatorFixture.run`.
+        processes: list of Callable[[SimulatorContext], Coroutine]
+            Same as :meth:`SimulatorFixture.run`.
+        rounds: int
+            Number of times to run the simulation.
+
+        Returns
+        -------
+        ~pytest_amaranth_sim.BenchmarkResult
+        """  # noqa: E501
+        base = self._base_processes()
+        setup = self.metrics.elaborate
+        samples = []
+
+        for i in range(rounds):
+            if i:
+                self._restart(base)
+                self.metrics = SimMetrics()
+            super().run(testbenches=testbenches, processes=processes)
+            samples.append(self.metrics.cycles_per_sec)
+
+        self.result = BenchmarkResult(setup, samples)
+        return self.result
+
+
+def _last_vcd_timestamp(fp, chunk_size=4096):
+    # Scan backwards from the end of a binary VCD file for the last line
+    # starting with "#". Only the tail of the file is read, so this is cheap
+    # even for multi-gigabyte dumps. Returns 0 if there's no timestamp.
+    pos = fp.seek(0, os.SEEK_END)
+    # Start of the earliest line read so far, which may begin in an earlier
+    # chunk. Only this is carried over, so each chunk is searched once.
+    partial = b""
+    while pos > 0:
+        step = min(chunk_size, pos)
+        pos -= step
+        fp.seek(pos)
+        lines = fp.read(step) + partial
+
+        # Unless the chunk reaches the start of the file, its first line may
+        # be in the middle of a line.
+        if pos > 0:
+            cut = lines.find(b"\n")
+            if cut < 0:
+                partial = lines
+                continue
+            (partial, lines) = (lines[:cut], lines[cut:])
+
+        start = lines.rfind(b"\n#") + 1
+        if start == 0 and not lines.startswith(b"#"):
+            continue
+
+        line = lines[start + 1:].split(b"\n", 1)[0]
+        return int(line)
+
+    return 0
+
+
+def _close_coroutines(procs):
+    for proc in procs:
+        coroutine = getattr(proc, "coroutine", None)
+        if coroutine is None:
+            continue
+        try:
+            coroutine.close()
+        except RuntimeError:
+            # A testbench suspended in tick().repeat() or .until() can't close
+            # the async generator it's awaiting. It's closed all the same.
+            pass
+
+
+def _disk_cache_dir(cache):
+    # Cache.mkdir() was called makedir() before pytest 7.
+    mkdir = getattr(cache, "mkdir", None) or cache.makedir
+    return str(mkdir(_DISK_CACHE_DIR))
+
+
+def _clks_key(clks):
+    if isinstance(clks, dict):
+        return tuple(clks.items())
+    return clks
 
 
 @pytest.fixture
@@ -186,8 +1561,40 @@ def mod():
     raise pytest.UsageError("User must override `mod` fixture in test- see: https://docs.pytest.org/en/stable/how-to/fixtures.html#overriding-fixtures-on-various-levels")
 
 
+@pytest.fixture(scope="session")
+def _sim_cache(pytestconfig):
+    if pytestconfig.getini("cache_simulators"):
+        cache = {}
+        pytestconfig._sim_caches.append(cache)
+        return cache
+    return None
+
+
+@pytest.fixture(scope="session")
+def _sim_snapshots(pytestconfig):
+    snapshots = {}
+    pytestconfig._sim_caches.append(snapshots)
+    return snapshots
+
+
+@pytest.fixture(scope="session")
+def _sim_compile_cache(pytestconfig):
+    cache = getattr(pytestconfig, "cache", None)
+    if not pytestconfig.getini("sim_disk_cache") or cache is None:
+        yield None
+        return
+
+    max_bytes = int(float(pytestconfig.getini("sim_disk_cache_size")) *
+                    1024 * 1024)
+    compile_cache = _diskcache.CompileCache(
+        _disk_cache_dir(cache), max_bytes)
+    yield compile_cache
+    compile_cache.evict()
+
+
 @pytest.fixture
-def sim(mod, clks, request, pytestconfig):
+def sim(mod, clks, request, pytestconfig, _sim_cache, _sim_compile_cache,
+        _sim_snapshots):
     """Fixture representing an Amaranth :class:`pysim <amaranth.sim.Simulator>` context.
 
     Parameters
@@ -200,15 +1607,62 @@ def sim(mod, clks, request, pytestconfig):
         The :mod:`pytest` ``request`` fixture.
     pytestconfig: ~_pytest.config.Config
         The :mod:`pytest` :fixture:`~_pytest.fixtures.pytestconfig` fixture.
+    _sim_cache: None or dict
+        Private session-scoped fixture holding reusable simulators when the
+        ``cache_simulators`` ini option is set.
+    _sim_compile_cache: None or CompileCache
+        Private session-scoped fixture holding the on-disk cache of compiled
+        designs when the ``sim_disk_cache`` ini option is set.
+    _sim_snapshots: dict
+        Private session-scoped fixture holding simulators and their state
+        after ``sim_init`` testbenches.
 
     Returns
     -------
     :class:`SimulatorFixture`
     """  # noqa: E501
-    simfix = SimulatorFixture(mod, clks, request, pytestconfig)
+    simfix = SimulatorFixture(mod, clks, request, pytestconfig, _sim_cache,
+                              _sim_compile_cache, _sim_snapshots)
+    request.node._sim_metrics = simfix.metrics
     return simfix
 
 
+@pytest.fixture
+def sim_benchmark(mod, clks, request, pytestconfig, _sim_compile_cache,
+                  _sim_snapshots):
+    """Fixture which benchmarks an Amaranth simulation.
+
+    Use like the :fixture:`sim` fixture; :meth:`SimulatorBenchmark.run` runs
+    the testbenches several times and returns min, median, and standard
+    deviation of simulated cycles per second. Results are also shown in the
+    terminal summary.
+
+    Parameters
+    ----------
+    mod: Module
+        The :fixture:`module <mod>` fixture.
+    clks: float or dict of str: float
+        The :fixture:`clock periods <clks>` fixture.
+    request: ~_pytest.fixtures.FixtureRequest
+        The :mod:`pytest` ``request`` fixture.
+    pytestconfig: ~_pytest.config.Config
+        The :mod:`pytest` :fixture:`~_pytest.fixtures.pytestconfig` fixture.
+    _sim_compile_cache: None or CompileCache
+        Same as for :fixture:`sim`.
+    _sim_snapshots: dict
+        Same as for :fixture:`sim`.
+
+    Returns
+    -------
+    :class:`SimulatorBenchmark`
+    """
+    bench = SimulatorBenchmark(mod, clks, request, pytestconfig,
+                               compile_cache=_sim_compile_cache,
+                               snapshots=_sim_snapshots)
+    request.node._sim_benchmark = bench
+    return bench
+
+
 @pytest.fixture()
 def clks():
     """Fixture representing the clocks used by the :fixture:`mod` fixture.
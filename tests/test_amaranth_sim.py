@@ -1,8 +1,23 @@
 """amaranth-sim tests module."""
 
+import gzip
+import importlib.util
+import io
+import os
+import pstats
+import json
+import re
+import sys
+import time
+import pytest
 from itertools import zip_longest
 from vcd.reader import tokenize, TokenKind
 
+from pytest_amaranth_sim import VCDIndex
+from pytest_amaranth_sim._coverage import _fsm_states
+from pytest_amaranth_sim._profile import _AMARANTH_DIR, in_amaranth
+from pytest_amaranth_sim.plugin import _last_vcd_timestamp
+
 
 def test_inject_sim_args(pytester, file_exists):
     """Test various ways to inject a testbench with arguments."""
@@ -28,6 +43,701 @@ def test_inject_sim_args(pytester, file_exists):
     assert not file_exists("*.gtkw")
 
 
+def test_run_vectors(pytester, file_exists):
+    """Test that failing vectors of run_vectors are reported by ID."""
+    pytester.copy_example("test_inject.py")
+    pytester.makepyfile(
+        """
+        # amaranth: UnusedElaboratable=no
+        import pytest
+        from test_inject import Adder, adder_vector
+
+        @pytest.mark.parametrize("mod,clks", [(Adder(4), 1.0 / 12e6)])
+        def test_vectors(sim, mod):
+            async def testbench(ctx, a, b, o):
+                await adder_vector(ctx, mod, a, b, o)
+
+            sim.run_vectors("a,b,o", [(1, 1, 2), (15, 15, 30), (7, 8, 16),
+                                      (2, 2, 4)], testbench)
+
+        @pytest.mark.parametrize("mod,clks", [(Adder(4), 1.0 / 12e6)])
+        def test_single(sim, mod):
+            seen = []
+
+            async def testbench(ctx, mod):
+                seen.append(mod)
+
+            sim.run_vectors("mod", [Adder(2)], testbench)
+            assert [type(m) for m in seen] == [Adder]
+
+        @pytest.mark.parametrize("mod,clks", [(Adder(4), 1.0 / 12e6)])
+        def test_ids(sim, mod):
+            async def testbench(ctx, a):
+                assert a != 2
+
+            sim.run_vectors(["a"], [1, 2], testbench, ids=["one", "two"])
+    """
+    )
+
+    result = pytester.runpytest("-v", "--vcds-on-failure")
+
+    assert result.ret == 1
+    result.stdout.fnmatch_lines_random([
+        "*::test_vectors[[]*[]] FAILED*",
+        "*::test_single[[]*[]] PASSED*",
+        "*::test_ids[[]*[]] FAILED*",
+        "E*AssertionError: 1 of 4 vectors failed:",
+        "E*[[]7-8-16[]] assert 15 == 16",
+        "E*AssertionError: 1 of 2 vectors failed:",
+        "E*[[]two[]] assert 2 != 2",
+    ])
+    result.stdout.no_fnmatch_line("*[[]15-15-30[]]*")
+
+    # One simulation, kept because it failed.
+    assert file_exists("test_vectors[[]*[]].vcd")
+    assert not file_exists("test_single[[]*[]].vcd")
+
+
+def test_run_parallel(pytester, file_exists):
+    """Test that scenarios run in separate processes with their own VCDs."""
+    pytester.copy_example("test_inject.py")
+    pytester.makepyfile(
+        """
+        # amaranth: UnusedElaboratable=no
+        import os
+        import pytest
+        from test_inject import Adder, adder_vector
+
+        def scenario(mod, a, b, o):
+            async def testbench(ctx):
+                await adder_vector(ctx, mod, a, b, o)
+                await ctx.tick().repeat(a)
+
+            return [testbench]
+
+        @pytest.mark.parametrize("mod,clks", [(Adder(4), 1.0 / 12e6)])
+        def test_scenarios(sim, mod):
+            sim.run_parallel([scenario(mod, 1, 1, 2), scenario(mod, 2, 2, 4),
+                              scenario(mod, 3, 3, 6)], workers=2)
+            # Each scenario starts from time 0.
+            assert sim.metrics.edges["sync"] == 2 + 3 + 4
+
+        @pytest.mark.parametrize("mod,clks", [(Adder(4), 1.0 / 12e6)])
+        def test_failing(sim, mod):
+            pid = os.getpid()
+
+            async def same_process(ctx):
+                assert os.getpid() == pid
+
+            sim.run_parallel([scenario(mod, 1, 1, 2), scenario(mod, 7, 8, 16),
+                              [same_process]], ids=["ok", "bad", "pid"])
+    """
+    )
+
+    result = pytester.runpytest("-v", "--vcds")
+
+    assert result.ret == 1
+    result.stdout.fnmatch_lines_random([
+        "*::test_scenarios[[]*[]] PASSED*",
+        "*::test_failing[[]*[]] FAILED*",
+        "E*AssertionError: 2 of 3 scenarios failed:",
+        "E*[[]bad[]] Traceback*",
+        "E*assert 15 == 16",
+        "E*[[]pid[]] Traceback*",
+    ])
+    result.stdout.no_fnmatch_line("E*[[]ok[]]*")
+
+    for sid in ("0", "1", "2"):
+        assert file_exists(f"test_scenarios[[]*[]]-{sid}.vcd")
+    for sid in ("ok", "bad", "pid"):
+        assert file_exists(f"test_failing[[]*[]]-{sid}.vcd")
+    assert not file_exists("test_scenarios[[]*[]].vcd")
+
+
+def test_run_parallel_threads(pytester, file_exists):
+    """Test that scenarios run in turn when forking could deadlock."""
+    pytester.copy_example("test_inject.py")
+    pytester.makepyfile(
+        """
+        # amaranth: UnusedElaboratable=no
+        import os
+        import threading
+        import pytest
+        from test_inject import Adder, adder_vector
+
+        def scenario(mod, a, b, o):
+            async def testbench(ctx):
+                assert ctx.get(mod.o) == 0
+                await adder_vector(ctx, mod, a, b, o)
+                await ctx.tick().repeat(a)
+
+            return [testbench]
+
+        @pytest.fixture
+        def thread():
+            done = threading.Event()
+            thread = threading.Thread(target=done.wait)
+            thread.start()
+            yield
+            done.set()
+            thread.join()
+
+        @pytest.mark.parametrize("mod,clks", [(Adder(4), 1.0 / 12e6)])
+        def test_in_turn(sim, mod, thread):
+            pid = os.getpid()
+
+            async def same_process(ctx):
+                assert os.getpid() == pid
+
+            sim.run_parallel([scenario(mod, 1, 1, 2), scenario(mod, 7, 8, 16),
+                              scenario(mod, 3, 3, 6), [same_process]],
+                             ids=["a", "bad", "c", "pid"])
+    """
+    )
+
+    result = pytester.runpytest("-v", "--vcds")
+
+    assert result.ret == 1
+    result.stdout.fnmatch_lines_random([
+        "*::test_in_turn[[]*[]] FAILED*",
+        "E*AssertionError: 1 of 4 scenarios failed:",
+        "E*[[]bad[]] Traceback*",
+        "*can't fork while other threads are running*",
+    ])
+    result.stdout.no_fnmatch_line("E*[[]pid[]]*")
+    for sid in ("a", "bad", "c", "pid"):
+        assert file_exists(f"test_in_turn[[]*[]]-{sid}.vcd")
+    assert not file_exists("test_in_turn[[]*[]].vcd")
+
+
+def test_monitors(pytester):
+    """Test clocked assertions and their failure messages."""
+    pytester.copy_example("test_mul.py")
+    pytester.makepyfile(
+        """
+        # amaranth: UnusedElaboratable=no
+        import pytest
+        from amaranth import Elaboratable, Module, Signal
+        from test_mul import Mul
+
+        class Handshake(Elaboratable):
+            def __init__(self, latency):
+                self.latency = latency
+                self.valid = Signal()
+                self.ready = Signal()
+
+            def elaborate(self, plat):
+                m = Module()
+                delay = Signal(range(self.latency + 1))
+                with m.If(self.valid & ~self.ready):
+                    m.d.sync += delay.eq(delay + 1)
+                m.d.comb += self.ready.eq(delay == self.latency)
+                return m
+
+        async def stimulus(ctx, mod):
+            for (a, b) in [(1, 2), (3, 5), (15, 15), (0, 7)]:
+                ctx.set(mod.a, a)
+                ctx.set(mod.b, b)
+                await ctx.tick()
+            await ctx.tick()
+
+        @pytest.mark.parametrize("mod,clks", [(Mul(), 1.0 / 12e6)])
+        def test_delayed(sim, mod):
+            sim.assert_delayed(mod.o, mod.a * mod.b)
+            sim.assert_always(mod.o < 226)
+
+            async def tb(ctx):
+                await stimulus(ctx, mod)
+
+            sim.run(testbenches=[tb])
+
+        @pytest.mark.parametrize("mod,clks", [(Mul(), 1.0 / 12e6)])
+        def test_wrong_latency(sim, mod):
+            sim.assert_delayed(mod.o, mod.a * mod.b, cycles=2, name="mul")
+
+            async def tb(ctx):
+                await stimulus(ctx, mod)
+
+            sim.run(testbenches=[tb])
+
+        @pytest.mark.parametrize("mod,clks", [(Handshake(3), 1.0 / 12e6)])
+        @pytest.mark.parametrize("cycles", [3, 2])
+        def test_within(sim, mod, cycles):
+            sim.assert_within(mod.valid, mod.ready, cycles, name="handshake")
+
+            async def tb(ctx):
+                await ctx.tick().repeat(2)
+                ctx.set(mod.valid, 1)
+                await ctx.tick().repeat(5)
+
+            sim.run(testbenches=[tb])
+    """
+    )
+
+    result = pytester.runpytest("test_monitors.py", "-v")
+    result.assert_outcomes(passed=2, failed=2)
+    result.stdout.fnmatch_lines_random([
+        "*::test_delayed[[]*[]] PASSED*",
+        "*::test_within[[]3-*[]] PASSED*",
+        "E*AssertionError: monitor 'mul' failed at cycle 2 of domain 'sync' "
+        "(*fs): got 15, expected 2 from cycle 0 (o=0, a=1, b=2); now o=15, "
+        "a=15, b=15",
+        "E*AssertionError: monitor 'handshake' failed at cycle 4 of domain "
+        "'sync' (*fs): no response since cycle 2 (valid=1, ready=0); now "
+        "valid=1, ready=0",
+    ])
+
+
+def test_golden(pytester, file_exists):
+    """Test recording golden traces, and failing at the first divergence."""
+    design = """
+        # amaranth: UnusedElaboratable=no
+        import pytest
+        from amaranth import Elaboratable, Module, Signal
+
+        class Doubler(Elaboratable):
+            def __init__(self):
+                self.a = Signal(8)
+                self.b = Signal(8)
+
+            def elaborate(self, plat):
+                m = Module()
+                m.d.sync += self.a.eq(self.a + 1)
+                m.d.sync += self.b.eq(self.a * 2 {fix})
+                return m
+
+        @pytest.mark.sim_golden("b")
+        @pytest.mark.parametrize("mod,clks", [(Doubler(), 1e-6)])
+        def test_refactor(sim):
+            async def tb(ctx):
+                await ctx.tick().repeat(20)
+
+            sim.run(testbenches=[tb])
+    """
+
+    pytester.makepyfile(test_golden=design.format(fix=""))
+    result = pytester.runpytest("-v")
+    result.assert_outcomes(failed=1)
+    result.stdout.fnmatch_lines([
+        "E*AssertionError: no golden trace at *test_refactor[[]*[]]"
+        ".golden.gz; run with --sim-update-golden to record it",
+    ])
+
+    result = pytester.runpytest("-v", "--sim-update-golden")
+    result.assert_outcomes(passed=1)
+    assert file_exists("golden/test_golden/test_refactor[[]*[]].golden.gz")
+
+    result = pytester.runpytest("-v")
+    result.assert_outcomes(passed=1)
+
+    # A refactor that's wrong for a == 5 diverges at the sixth clock edge.
+    pytester.makepyfile(test_golden=design.format(fix="+ (self.a == 5)"))
+    result = pytester.runpytest("-v")
+    result.assert_outcomes(failed=1)
+    result.stdout.fnmatch_lines([
+        "E*AssertionError: golden trace *.golden.gz diverged at "
+        "5500000000 fs: b is 11, golden trace has 10",
+    ])
+
+
+def test_run_stream(pytester):
+    """Test streaming NumPy arrays and comparing against a golden model."""
+    pytest.importorskip("numpy")
+    pytester.copy_example("test_mul.py")
+    pytester.makepyfile(
+        """
+        # amaranth: UnusedElaboratable=no
+        import numpy as np
+        import pytest
+        from test_mul import Mul
+
+        a = np.arange(256) % 16
+        b = np.arange(256) // 16
+
+        @pytest.mark.parametrize("mod,clks", [(Mul(), 1.0 / 12e6)])
+        def test_golden(sim, mod):
+            (o,) = sim.run_stream([mod.o], inputs=[(mod.a, a), (mod.b, b)],
+                                  golden=lambda a, b: a * b)
+            assert o.dtype == np.uint64
+            assert list(o[:3]) == [0, 0, 0]
+            assert list(o[16:19]) == [0, 1, 2]
+
+        @pytest.mark.parametrize("mod,clks", [(Mul(), 1.0 / 12e6)])
+        def test_mismatch(sim, mod):
+            sim.run_stream([mod.o], inputs=[(mod.a, a), (mod.b, b)],
+                           golden=lambda a, b: a * b + (a == 3), mismatches=2)
+
+        @pytest.mark.parametrize("mod,clks", [(Mul(), 1.0 / 12e6)])
+        def test_record(sim, mod):
+            (o,) = sim.run_stream([mod.o], cycles=4)
+            assert list(o) == [0] * 4
+
+        @pytest.mark.parametrize("mod,clks", [(Mul(), 1.0 / 12e6)])
+        def test_too_short(sim, mod):
+            with pytest.raises(ValueError, match="have 256 elements, not 300"):
+                sim.run_stream([mod.o], inputs=[(mod.a, a)], cycles=300)
+    """
+    )
+
+    result = pytester.runpytest("-v")
+
+    assert result.ret == 1
+    result.stdout.fnmatch_lines_random([
+        "*::test_golden[[]*[]] PASSED*",
+        "*::test_mismatch[[]*[]] FAILED*",
+        "*::test_record[[]*[]] PASSED*",
+        "*::test_too_short[[]*[]] PASSED*",
+        "E*AssertionError: 16 of 256 cycles mismatched for o:",
+        "E*cycle 3: got 0, expected 1 (a=3, b=0)",
+        "E*cycle 19: got 3, expected 4 (a=3, b=1)",
+    ])
+    result.stdout.no_fnmatch_line("E*cycle 35:*")
+
+
+def test_run_mapped(pytester):
+    """Test replaying memory-mapped stimulus into a response file."""
+    # numpy can't be imported again once pytester unloaded it after another
+    # test, so only check that it's there; the test runs in a subprocess.
+    if importlib.util.find_spec("numpy") is None:
+        pytest.skip("numpy is not installed")
+    pytester.copy_example("test_mul.py")
+    pytester.makepyfile(
+        """
+        # amaranth: UnusedElaboratable=no
+        import numpy as np
+        import pytest
+        from test_mul import Mul
+
+        @pytest.mark.parametrize("mod,clks", [(Mul(), 1.0 / 12e6)])
+        def test_replay(sim, mod, tmp_path):
+            dtype = sim.record_dtype([mod.a, mod.b])
+            assert dtype == np.dtype([("a", "<u1"), ("b", "<u1")])
+
+            stim = np.memmap(tmp_path / "in.bin", dtype=dtype, mode="w+",
+                             shape=(1000,))
+            stim["a"] = np.arange(1000) % 16
+            stim["b"] = np.arange(1000) // 16 % 16
+            stim.flush()
+
+            # Several chunks, the last one partial.
+            resp = sim.run_mapped(inputs=[mod.a, mod.b],
+                                  stimulus=tmp_path / "in.bin",
+                                  outputs=[mod.o],
+                                  response=tmp_path / "out.bin", chunk=300)
+
+            assert len(resp) == 1000
+            o = np.fromfile(tmp_path / "out.bin", dtype=resp.dtype)["o"]
+            assert (o == stim["a"] * stim["b"]).all()
+
+        @pytest.mark.parametrize("mod,clks", [(Mul(), 1.0 / 12e6)])
+        def test_unpaired(sim, mod, tmp_path):
+            with pytest.raises(ValueError, match="outputs and response"):
+                sim.run_mapped(outputs=[mod.o], cycles=4)
+
+        @pytest.mark.parametrize("mod,clks", [(Mul(), 1.0 / 12e6)])
+        def test_empty(sim, mod, tmp_path):
+            (tmp_path / "in.bin").write_bytes(b"")
+            with pytest.raises(ValueError, match="in.bin has no records"):
+                sim.run_mapped(inputs=[mod.a, mod.b],
+                               stimulus=tmp_path / "in.bin")
+            with pytest.raises(ValueError, match="at least 1, not 0"):
+                sim.run_mapped(outputs=[mod.o],
+                               response=tmp_path / "out.bin", cycles=0)
+    """
+    )
+
+    result = pytester.runpytest_subprocess("test_run_mapped.py", "-v")
+
+    result.assert_outcomes(passed=3)
+
+
+def test_sim_group_by_design(pytester):
+    """Test that tests sharing mod and clks go to the same xdist worker."""
+    pytest.importorskip("xdist")
+    pytester.copy_example("test_inject.py")
+
+    result = pytester.runpytest("-v", "-n", "2", "--sim-group-by-design",
+                                "-k", "direct")
+
+    assert result.ret == 0
+    result.stdout.fnmatch_lines_random([
+        "*PASSED test_inject.py::test_inject_direct[[]12.00-adder0-0-0-0[]]"
+        "@adder-12.00*",
+        "*PASSED test_inject.py::test_inject_direct[[]12.00-adder1-0-0-0[]]"
+        "@adder1-12.00*",
+    ])
+
+    # Each design's tests, all three of them, ran on a single worker.
+    workers = {}
+    counts = {}
+    for line in result.outlines:
+        match = re.match(r"\[(gw\d+)\].*@(\S+)", line)
+        if match:
+            workers.setdefault(match[2], set()).add(match[1])
+            counts[match[2]] = counts.get(match[2], 0) + 1
+    assert counts == {"adder-12.00": 3, "adder1-12.00": 3}
+    assert all(len(s) == 1 for s in workers.values())
+
+    # Test files sharing a mod object share its group.
+    pytester.makepyfile(designs="""
+        from test_inject import Adder
+
+        shared = Adder(4)
+    """)
+    for name in ("test_one", "test_two"):
+        pytester.makepyfile(**{name: """
+            import pytest
+            from designs import shared
+
+            @pytest.mark.parametrize("mod,clks", [(shared, 1.0 / 12e6)])
+            @pytest.mark.parametrize("n", range(4))
+            def test_shared(sim, n):
+                pass
+        """})
+
+    result = pytester.runpytest("-v", "-n", "2", "--sim-group-by-design",
+                                "test_one.py", "test_two.py")
+
+    assert result.ret == 0
+    groups = [re.match(r"\[(gw\d+)\].*@(\S+)", line)
+              for line in result.outlines]
+    groups = [match.groups() for match in groups if match]
+    assert len(groups) == 8
+    assert len(set(groups)) == 1
+
+    result = pytester.runpytest("-n", "2", "--dist=loadscope",
+                                "--sim-group-by-design")
+    assert result.ret == 4
+    result.stderr.fnmatch_lines([
+        "*--sim-group-by-design needs --dist=loadgroup, not loadscope*",
+    ])
+
+
+def test_sim_disk_cache(pytester):
+    """Test that compiled designs are reused across sessions."""
+    pytester.makeini("""
+        [pytest]
+        sim_disk_cache = true
+    """)
+    pytester.copy_example("test_mul.py")
+    pytester.makepyfile(
+        """
+        # amaranth: UnusedElaboratable=no
+        import pytest
+        from test_mul import Mul, mul_tb
+
+        @pytest.mark.parametrize("mod,clks", [(Mul(), 1.0 / 12e6)])
+        def test_cached(sim, mul_tb):
+            sim.run(testbenches=[mul_tb])
+            cache = sim.compile_cache
+            print(f"hits={cache.hits} misses={cache.misses}")
+    """
+    )
+    cache_dir = pytester.path / ".pytest_cache" / "d" / "amaranth-sim-compiled"
+
+    result = pytester.runpytest("-s", "-k", "cached")
+    assert result.ret == 0
+    result.stdout.fnmatch_lines(["*hits=0 misses=[1-9]*"])
+    entries = sorted(cache_dir.iterdir())
+    assert entries
+
+    result = pytester.runpytest("-s", "-k", "cached")
+    assert result.ret == 0
+    result.stdout.fnmatch_lines(["*hits=[1-9]* misses=0*"])
+    assert sorted(cache_dir.iterdir()) == entries
+
+    result = pytester.runpytest("-s", "-k", "cached", "--sim-cache-clear")
+    assert result.ret == 0
+    result.stdout.fnmatch_lines(["*hits=0 misses=[1-9]*"])
+
+    # Everything is evicted when the cache may not use any space.
+    result = pytester.runpytest("-s", "-k", "cached", "-o",
+                                "sim_disk_cache_size=0")
+    assert result.ret == 0
+    assert not list(cache_dir.iterdir())
+
+
+def test_sim_backend(pytester):
+    """Test selecting simulation engines, and falling back to pysim."""
+    pytester.copy_example("test_mul.py")
+    pytester.makepyfile(
+        """
+        # amaranth: UnusedElaboratable=no
+        import pytest
+        from amaranth.sim._base import BaseEngine
+        from amaranth.sim.pysim import PySimEngine
+        from test_mul import Mul, mul_tb
+
+        class MyEngine(PySimEngine):
+            pass
+
+        class Unsupported(BaseEngine):
+            pass
+
+        class Delegating(BaseEngine):
+            # Only has the public engine interface, like an engine from
+            # another package would.
+            def __init__(self, design):
+                self.inner = PySimEngine(design)
+
+            def __getattribute__(self, name):
+                if name.startswith("_"):
+                    return object.__getattribute__(self, name)
+                inner = object.__getattribute__(self, "inner")
+                if name == "inner":
+                    return inner
+                if not hasattr(BaseEngine, name):
+                    raise AttributeError(name)
+                return getattr(inner, name)
+
+        @pytest.mark.sim_backend("test_sim_backend:Delegating")
+        @pytest.mark.parametrize("mod,clks", [(Mul(), 1.0 / 12e6)])
+        def test_delegating(sim, mod, mul_tb):
+            assert type(sim.sim._engine) is Delegating
+            sim.assert_delayed(mod.o, mod.a * mod.b)
+            sim.run(testbenches=[mul_tb])
+
+        @pytest.mark.sim_backend("test_sim_backend:Delegating")
+        @pytest.mark.parametrize("mod,clks", [(Mul(), 1.0 / 12e6)])
+        def test_delegating_vectors(sim, mod):
+            async def check(ctx, a, b):
+                ctx.set(mod.a, a)
+                ctx.set(mod.b, b)
+                await ctx.tick()
+                assert ctx.get(mod.o) == a * b + (a == 2)
+
+            sim.run_vectors("a,b", [(1, 2), (2, 3)], check)
+
+        @pytest.mark.sim_backend("test_sim_backend:Delegating")
+        @pytest.mark.parametrize("mod,clks", [(Mul(), 1.0 / 12e6)])
+        def test_delegating_benchmark(sim_benchmark, mul_tb):
+            assert type(sim_benchmark.sim._engine) is Delegating
+            result = sim_benchmark.run(testbenches=[mul_tb], rounds=3)
+            assert len(result.cycles_per_sec) == 3
+
+        @pytest.mark.sim_backend("test_sim_backend:MyEngine")
+        @pytest.mark.parametrize("mod,clks", [(Mul(), 1.0 / 12e6)])
+        def test_custom(sim, mul_tb):
+            assert type(sim.sim._engine) is MyEngine
+            sim.run(testbenches=[mul_tb])
+
+        @pytest.mark.sim_backend("cxxrtl")
+        @pytest.mark.parametrize("mod,clks", [(Mul(), 1.0 / 12e6)])
+        def test_missing(sim):
+            pass
+
+        @pytest.mark.sim_deadline(wall=10)
+        @pytest.mark.sim_backend("test_sim_backend:Unsupported")
+        @pytest.mark.parametrize("mod,clks", [(Mul(), 1.0 / 12e6)])
+        def test_fallback(sim, mul_tb):
+            assert type(sim.sim._engine) is PySimEngine
+            sim.run(testbenches=[mul_tb])
+
+        @pytest.mark.sim_backend("test_sim_backend:Mul")
+        @pytest.mark.parametrize("mod,clks", [(Mul(), 1.0 / 12e6)])
+        def test_bad(sim):
+            pass
+    """
+    )
+
+    result = pytester.runpytest("-v", "test_sim_backend.py")
+
+    result.assert_outcomes(passed=4, failed=1, errors=2)
+    result.stdout.fnmatch_lines_random([
+        "*::test_delegating[[]*[]] PASSED*",
+        "*::test_delegating_vectors[[]*[]] FAILED*",
+        "*::test_delegating_benchmark[[]*[]] PASSED*",
+        "E*AssertionError: 1 of 2 vectors failed:",
+        "*UsageError: no simulation engine named 'cxxrtl' is installed*",
+        "*sim_deadline require(s) pysim; falling back from sim_backend "
+        "'test_sim_backend:Unsupported'",
+        "*UsageError: sim_backend 'test_sim_backend:Mul' is not an amaranth "
+        "simulation engine",
+    ])
+
+    # A misspelled ini option doesn't quietly run everything on pysim.
+    result = pytester.runpytest("test_sim_backend.py", "-k", "test_custom",
+                                "-o", "sim_backend=cxxrt")
+    result.assert_outcomes(passed=1)
+    result = pytester.runpytest("test_mul.py", "-k", "test_basic", "-o",
+                                "sim_backend=cxxrt")
+    result.assert_outcomes(errors=1)
+    result.stdout.fnmatch_lines([
+        "*UsageError: no simulation engine named 'cxxrt' is installed*",
+    ])
+
+
+def test_sim_init(pytester):
+    """Test that tests start from a snapshot taken after an init testbench."""
+    pytester.makepyfile(
+        """
+        # amaranth: UnusedElaboratable=no
+        import pytest
+        from amaranth import Module, Signal
+        from amaranth.lib.memory import Memory
+
+        m = Module()
+        cfg = Signal(8)
+        cnt = Signal(8)
+        addr = Signal(2)
+        m.submodules.mem = mem = Memory(shape=8, depth=4, init=[])
+        wr = mem.write_port()
+        rd = mem.read_port(domain="comb")
+        m.d.comb += [wr.addr.eq(addr), rd.addr.eq(addr), wr.data.eq(cnt)]
+        m.d.sync += cnt.eq(cnt + 1)
+
+        boots = []
+
+        async def boot(ctx):
+            boots.append(None)
+            ctx.set(cfg, 42)
+            ctx.set(addr, 2)
+            ctx.set(wr.en, 1)
+            await ctx.tick().repeat(5)
+            ctx.set(wr.en, 0)
+
+        async def check(ctx):
+            # Where boot left off: 5 cycles in, with 4 written to mem[2].
+            assert ctx.get(cfg) == 42
+            assert ctx.get(cnt) == 5
+            assert ctx.get(rd.data) == 4
+            await ctx.tick()
+            assert ctx.get(cnt) == 6
+            assert ctx.get(rd.data) == 4
+
+        @pytest.mark.sim_init(testbench=boot)
+        @pytest.mark.parametrize("n", [0, 1, 2])
+        @pytest.mark.parametrize("mod,clks", [(m, 1e-6)])
+        def test_restored(sim, n):
+            sim.run(testbenches=[check])
+            assert sim.metrics.cycles == 1
+            assert sim.metrics.sim_time > 5_000_000_000
+
+        @pytest.mark.parametrize("mod,clks", [(m, 1e-6)])
+        def test_replayed(sim):
+            async def replay(ctx):
+                await boot(ctx)
+                await check(ctx)
+
+            sim.run(testbenches=[replay])
+
+        def test_booted_once():
+            assert len(boots) == 2
+    """
+    )
+
+    result = pytester.runpytest("-v", "--vcds")
+
+    result.assert_outcomes(passed=5)
+
+    # The trace starts from the restored state, 5 cycles in.
+    with open(pytester.path / "test_restored[module-1.00-1].vcd") as fp:
+        vcd = fp.read()
+    (dumpvars, changes) = vcd.split("$dumpvars")[1].split("$end", 1)
+    assert "b101 " in dumpvars
+    assert changes.split()[0] == "#5000000000"
+
+
 def test_sim_mod_fixture(pytester, file_exists):
     """Make sure that pytest accepts our fixture."""
     pytester.copy_example("test_mul.py")
@@ -82,6 +792,426 @@ def test_background_testbench(pytester, file_exists):
     assert file_exists("test_clock_switcher_background[[]comb*clocks*[]].gtkw")
 
 
+@pytest.mark.parametrize("vcds,ext", [
+    pytest.param([], ".vcd", id="vcd"),
+    pytest.param(["--vcds-format=gz"], ".vcd.gz", id="gz"),
+])
+def test_vcds_on_failure(pytester, file_exists, vcds, ext):
+    """Test that only failing tests keep their VCDs with --vcds-on-failure."""
+    pytester.copy_example("test_mul.py")
+
+    result = pytester.runpytest("-v", "-k", "test_alternate_width",
+                                "--vcds-on-failure", *vcds)
+
+    result.stdout.fnmatch_lines([
+        '*::test_alternate_width[[]*-fail[]] PASSED*',
+        '*::test_alternate_width[[]*-pass[]] PASSED*',
+    ])
+    assert result.ret == 0
+
+    # The failing testbench raised inside sim.run(); pytest.raises caught it
+    # afterwards.
+    assert file_exists(f"test_alternate_width[[]*-fail[]]{ext}")
+    assert file_exists("test_alternate_width[[]*-fail[]].gtkw")
+    assert not file_exists(f"test_alternate_width[[]*-pass[]]{ext}")
+    assert not file_exists("test_alternate_width[[]*-pass[]].gtkw")
+    assert not file_exists(".amaranth-sim-*")
+
+    gtkw = next(pytester.path.glob("*-fail[]].gtkw")).read_text()
+    assert f'[dumpfile] "test_alternate_width[1-2-mul-12.00-fail]{ext}"' \
+        in gtkw
+
+
+def test_vcds_bad_format(pytester):
+    """Test that unknown --vcds-format formats are rejected."""
+    result = pytester.runpytest("--vcds-format=xz")
+
+    assert result.ret == 4
+    result.stderr.fnmatch_lines(["*--vcds-format*invalid choice*xz*"])
+
+
+def test_vcds_before_path(pytester, file_exists):
+    """Test that --vcds doesn't take the path which follows it."""
+    pytester.copy_example("test_mul.py")
+
+    result = pytester.runpytest("-k", "test_basic", "--vcds", "test_mul.py")
+
+    assert result.ret == 0
+    assert file_exists("test_basic[[]*[]].vcd")
+
+
+def test_vcds_fst(pytester, file_exists):
+    """Test that --vcds-format=fst writes FST files and savefiles for them."""
+    pytest.importorskip("pylibfst")
+    pytester.copy_example("test_mul.py")
+
+    result = pytester.runpytest("-v", "-k", "test_basic",
+                                "--vcds-format=fst")
+
+    result.stdout.fnmatch_lines([
+        '*::test_basic[[]*[]] PASSED*',
+    ])
+    assert result.ret == 0
+
+    assert file_exists("test_basic[[]*[]].fst")
+    assert not file_exists("test_basic[[]*[]].vcd")
+    fst = next(pytester.path.glob("test_basic*.fst"))
+    with open(fst, "rb") as fp:
+        # Header block type.
+        assert fp.read(1) == b"\x00"
+
+    # Like amaranth's own .gtkw files, the savefile names its dump by
+    # absolute path.
+    gtkw = fst.with_suffix(".gtkw").read_text()
+    assert f'[dumpfile] "{os.path.abspath(fst)}"' in gtkw
+
+
+def test_vcds_fst_missing(pytester, monkeypatch):
+    """Test that --vcds-format=fst without pylibfst is a usage error."""
+    # A None entry makes importing pylibfst raise ImportError.
+    monkeypatch.setitem(sys.modules, "pylibfst", None)
+    pytester.copy_example("test_mul.py")
+
+    result = pytester.runpytest("-k", "test_basic", "--vcds-format=fst")
+
+    assert result.ret == 1
+    result.stdout.fnmatch_lines([
+        "*UsageError: --vcds-format=fst requires pylibfst*",
+    ])
+
+
+def test_vcd_index(pytester, file_exists):
+    """Test seeking into a VCD with its .vcd.idx index."""
+    pytester.makeini("""
+        [pytest]
+        vcd_index = 0.001
+    """)
+    pytester.makepyfile(
+        """
+        # amaranth: UnusedElaboratable=no
+        import pytest
+        from amaranth import Module, Signal
+
+        m = Module()
+        a = Signal(8)
+        b = Signal(8)
+
+        m.d.sync += a.eq(a + 1)
+        with m.If(a == 3):
+            m.d.sync += b.eq(42)
+
+        @pytest.mark.parametrize("mod,clks", [pytest.param(m, 1e-6, id="sync")])
+        def test_index(sim):
+            async def testbench(ctx):
+                await ctx.tick().repeat(500)
+
+            sim.run(testbenches=[testbench])
+    """  # noqa: E501
+    )
+
+    result = pytester.runpytest("-v", "--vcds")
+    assert result.ret == 0
+    assert file_exists("test_index[[]sync[]].vcd.idx")
+
+    def values_at(tokens, time):
+        values = {}
+        for t in tokens:
+            if t.kind == TokenKind.CHANGE_TIME and t.time_change > time:
+                break
+            if t.kind in (TokenKind.CHANGE_SCALAR, TokenKind.CHANGE_VECTOR):
+                values[t.data.id_code] = t.data.value
+        return values
+
+    with open("test_index[sync].vcd", "rb") as fp:
+        tokens = list(tokenize(fp))
+
+    idx = VCDIndex("test_index[sync].vcd")
+    assert len(idx.checkpoints) > 2
+    assert idx.end == 500_000_000_000
+
+    start = 321_500_000_000
+    out = io.StringIO()
+    idx.write_window(out, start, start + 10_000_000_000)
+    window = list(tokenize(io.BytesIO(out.getvalue().encode())))
+
+    times = [t.time_change for t in window
+             if t.kind == TokenKind.CHANGE_TIME]
+    assert times[0] == start
+    assert times[-1] <= start + 10_000_000_000
+    assert values_at(window, start) == values_at(tokens, start)
+
+
+@pytest.mark.parametrize("vcds,ext,opener", [
+    pytest.param("--vcds", ".vcd", open, id="vcd"),
+    pytest.param("--vcds-format=gz", ".vcd.gz", gzip.open, id="gz"),
+])
+def test_vcd_window(pytester, file_exists, vcds, ext, opener):
+    """Test that only the last few cycles are kept with vcd_window."""
+    pytester.makeini("""
+        [pytest]
+        vcd_window = 4 cycles
+    """)
+    pytester.makepyfile(
+        """
+        # amaranth: UnusedElaboratable=no
+        import pytest
+        from amaranth import Module, Signal
+
+        m = Module()
+        a = Signal(8)
+        b = Signal(8)
+
+        m.d.sync += a.eq(a + 1)
+        with m.If(a == 3):
+            m.d.sync += b.eq(42)
+
+        @pytest.mark.parametrize("mod,clks", [pytest.param(m, 1e-6, id="sync")])
+        def test_window(sim):
+            async def testbench(ctx):
+                await ctx.tick().repeat(100)
+
+            sim.run(testbenches=[testbench])
+
+        # A window in cycles doesn't apply without clocks.
+        @pytest.mark.parametrize("mod,clks", [pytest.param(Module(), None,
+                                                           id="comb")])
+        def test_comb(sim):
+            async def testbench(ctx):
+                await ctx.delay(1e-6)
+
+            sim.run(testbenches=[testbench])
+    """  # noqa: E501
+    )
+
+    result = pytester.runpytest("-v", vcds)
+    result.assert_outcomes(passed=2)
+
+    with opener(f"test_window[sync]{ext}", "rb") as fp:
+        tokens = list(tokenize(fp))
+
+    times = [t.time_change for t in tokens
+             if t.kind == TokenKind.CHANGE_TIME]
+    assert times[0] == 96_000_000_000
+    assert times[-1] == 100_000_000_000
+    assert len(times) == 9
+
+    # Initial values of the window must be correct, including values that
+    # last changed long before the window started.
+    initial = []
+    for t in tokens[[t.kind for t in tokens].index(TokenKind.DUMPVARS):]:
+        if t.kind == TokenKind.END:
+            break
+        if t.kind == TokenKind.CHANGE_VECTOR:
+            initial.append(t.vector_change.value)
+    assert initial == [96, 42]
+
+
+def test_sim_durations(pytester):
+    """Test the simulation durations section of the terminal summary."""
+    pytester.copy_example("test_mul.py")
+    pytester.copy_example("test_multiclk.py")
+
+    result = pytester.runpytest("--sim-durations=0", "--vcds")
+
+    assert result.ret == 0
+    result.stdout.fnmatch_lines([
+        "*= simulation durations =*",
+        "*elab(s)*kernel(s)*vcd(s)*sim(us)*cycles*cycles/s*test",
+    ])
+    result.stdout.re_match_lines_random([
+        r".* test_mul.py::test_basic\[.*\]$",
+        r".* test_multiclk.py::test_clock_switcher_background\[.*\]$",
+    ])
+    # Both clocks run for the whole 38us; the fast one is counted.
+    result.stdout.fnmatch_lines([
+        "* 38.040 * 476 * test_multiclk.py::test_clock_switcher_multi*"
+    ])
+
+
+def test_metrics_several_runs(pytester):
+    """Test that metrics add up over several runs of one test."""
+    pytester.copy_example("test_inject.py")
+    pytester.makepyfile(
+        """
+        # amaranth: UnusedElaboratable=no
+        import pytest
+        from test_inject import Adder
+
+        @pytest.mark.parametrize("mod,clks", [(Adder(8), 1.0 / 12e6)])
+        def test_runs(sim, mod):
+            async def testbench(ctx):
+                await ctx.tick().repeat(100)
+
+            sim.run_parallel([[testbench], [testbench]])
+            assert sim.metrics.cycles == 200
+            run = sim.metrics.run
+
+            sim.run(testbenches=[testbench])
+            assert sim.metrics.cycles == 300
+            assert sim.metrics.run > run
+            (run, vcd_files) = (sim.metrics.run, sim.metrics.vcd_files)
+
+            sim.sim.reset()
+            sim.run(testbenches=[testbench])
+            assert sim.metrics.cycles == 400
+            assert sim.metrics.run > run
+            assert sim.metrics.vcd_files > vcd_files
+            assert sim.metrics.kernel > 0
+    """
+    )
+
+    result = pytester.runpytest("test_metrics_several_runs.py", "--vcds",
+                                "--sim-durations=0")
+
+    assert result.ret == 0
+
+
+def test_sim_benchmark(pytester):
+    """Test that sim_benchmark runs each round from the initial state."""
+    pytester.copy_example("test_inject.py")
+    pytester.makepyfile(
+        """
+        # amaranth: UnusedElaboratable=no
+        import pytest
+        from test_inject import Adder
+
+        @pytest.mark.parametrize("mod,clks", [(Adder(8), 1.0 / 12e6)])
+        def test_bench(sim_benchmark, mod):
+            async def testbench(ctx):
+                assert ctx.get(mod.o) == 0
+                ctx.set(mod.a, 1)
+                await ctx.tick().repeat(100)
+                assert ctx.get(mod.o) == 1
+
+            result = sim_benchmark.run(testbenches=[testbench], rounds=3)
+            assert len(result.cycles_per_sec) == 3
+            assert 0 < result.min <= result.median
+            assert sim_benchmark.metrics.cycles == 100
+    """
+    )
+
+    result = pytester.runpytest("-k", "test_bench")
+
+    assert result.ret == 0
+    result.stdout.fnmatch_lines([
+        "*= simulation benchmarks (cycles/s) =*",
+        "*setup(s)*rounds*min*median*stddev*test",
+        "* 3 * test_sim_benchmark.py::test_bench[[]adder-12.00[]]",
+    ])
+
+
+def test_sim_profile(pytester, file_exists):
+    """Test that simulations are profiled with --sim-profile."""
+    pytester.copy_example("test_multiclk.py")
+
+    result = pytester.runpytest("-k", "switcher_background", "--sim-profile")
+
+    assert result.ret == 0
+    result.stdout.fnmatch_lines([
+        "*= simulation hotspots =*",
+        "test_multiclk.py::test_clock_switcher_background[[]*[]]",
+        "  testbench*tottime*cumtime",
+        "* driver (test_multiclk.py:*)",
+        "  kernel*tottime*cumtime",
+        "* (pysim.py:*)",
+    ])
+
+    prof = "test_clock_switcher_background[comb-clockswitcher].prof"
+    assert file_exists(prof.replace("[", "[[]"))
+    stats = pstats.Stats(str(pytester.path / prof))
+    assert any(func == "driver" for (_, _, func) in stats.stats)
+
+
+def test_in_amaranth():
+    """Test that only amaranth itself counts as the simulator's code."""
+    assert in_amaranth(os.path.join(_AMARANTH_DIR, "sim", "pysim.py"))
+    assert not in_amaranth(_AMARANTH_DIR + "_boards" + os.sep + "x.py")
+    assert not in_amaranth("<string>")
+
+
+def test_sim_deadline(pytester, file_exists):
+    """Test that simulations stop at the simulated time/wall-clock limits."""
+    pytester.makeini("""
+        [pytest]
+        sim_deadline = 10 cycles
+        extend_vcd_time = 500
+    """)
+    pytester.makepyfile(
+        """
+        # amaranth: UnusedElaboratable=no
+        import time
+        import pytest
+        from amaranth import Module, Signal
+
+        m = Module()
+        a = Signal(8)
+        m.d.sync += a.eq(a + 1)
+
+        async def forever(ctx):
+            while True:
+                await ctx.tick()
+
+        @pytest.mark.parametrize("mod,clks", [pytest.param(m, 1e-6, id="sync")])
+        def test_cycles(sim):
+            sim.run(testbenches=[forever])
+
+        @pytest.mark.sim_deadline(cycles=1000)
+        @pytest.mark.parametrize("mod,clks", [pytest.param(m, 1e-6, id="sync")])
+        def test_marker(sim):
+            async def testbench(ctx):
+                await ctx.tick().repeat(100)
+
+            sim.run(testbenches=[testbench])
+
+        @pytest.mark.sim_deadline(time=0, wall=0.1)
+        @pytest.mark.parametrize("mod,clks", [pytest.param(m, 1e-9, id="sync")])
+        def test_wall(sim):
+            sim.run(testbenches=[forever])
+
+        @pytest.mark.sim_deadline(time=0, wall=0.1)
+        @pytest.mark.parametrize("mod,clks", [pytest.param(m, 1e-6, id="sync")])
+        def test_wall_slow_steps(sim):
+            async def slow(ctx):
+                while True:
+                    time.sleep(0.02)
+                    await ctx.tick()
+
+            sim.run(testbenches=[slow])
+
+        # The sim_deadline ini option in cycles doesn't apply without clocks.
+        @pytest.mark.parametrize("mod,clks", [pytest.param(Module(), None,
+                                                           id="comb")])
+        def test_comb(sim):
+            async def testbench(ctx):
+                await ctx.delay(1e-3)
+
+            sim.run(testbenches=[testbench])
+    """  # noqa: E501
+    )
+
+    start = time.perf_counter()
+    result = pytester.runpytest("-v", "--vcds")
+    # Slow steps don't make the simulation overshoot its wall-clock limit.
+    assert time.perf_counter() - start < 2
+    assert result.ret == 1
+    result.stdout.fnmatch_lines_random([
+        "*::test_cycles[[]sync[]] FAILED*",
+        "*::test_marker[[]sync[]] PASSED*",
+        "*::test_wall[[]sync[]] FAILED*",
+        "*::test_wall_slow_steps[[]sync[]] FAILED*",
+        "*::test_comb[[]comb[]] PASSED*",
+        "*simulated time * fs exceeds deadline of 10000000000 fs",
+        "*wall-clock deadline of 0.1 s exceeded at * fs",
+        "*testbench forever (*test_sim_deadline.py:*) [[]critical[]]",
+    ])
+
+    # The failing VCD is still closed and extended.
+    with open(pytester.path / "test_cycles[sync].vcd") as fp:
+        lines = fp.read().splitlines()
+    assert lines[-1] == f"#{int(lines[-2][1:]) + 500}"
+    assert int(lines[-2][1:]) > 10_000_000_000
+
+
 def test_help_message(pytester):
     """Test that help message looks correct."""
     result = pytester.runpytest(
@@ -114,6 +1244,32 @@ def test_vcd_generation(pytester, file_exists):
 
     assert file_exists("test_basic[[]*[]].vcd")
     assert file_exists("test_basic[[]*[]].gtkw")
+    # The index is opt-in.
+    assert not file_exists("test_basic[[]*[]].vcd.idx")
+
+
+def test_gz_vcd_generation(pytester, file_exists):
+    """Make sure that gzipped VCD files get generated."""
+    pytester.copy_example("test_mul.py")
+
+    # run pytest with the following cmd args
+    result = pytester.runpytest("-v", "-k", "test_basic",
+                                "--vcds-format=gz")
+
+    # fnmatch_lines does an assertion internally
+    result.stdout.fnmatch_lines([
+        '*::test_basic[[]*[]] PASSED*',
+    ])
+
+    # make sure that we get a '0' exit code for the testsuite
+    assert result.ret == 0
+
+    assert not file_exists("test_basic[[]*[]].vcd")
+    assert file_exists("test_basic[[]*[]].vcd.gz")
+    assert file_exists("test_basic[[]*[]].gtkw")
+
+    gtkw = next(pytester.path.glob("test_basic[[]*[]].gtkw")).read_text()
+    assert ".vcd.gz" in gtkw
 
 
 def test_long_vcd_generation(pytester, file_exists):
@@ -247,6 +1403,330 @@ def test_collect(pytester, file_exists):
     assert not file_exists("*.gtkw")
 
 
+@pytest.mark.parametrize("chunk_size", [1, 3, 4096])
+@pytest.mark.parametrize("contents,ts", [
+    (b"", 0),
+    (b"$enddefinitions $end\n", 0),
+    (b"#7\n", 7),
+    (b"$end\n#0\n1!\n#1234\n0!\nb101 \"\n", 1234),
+    (b"#5\n" + b"0" * 10000 + b"\n1!\n", 5),
+    (b"#5\n#" + b"6" * 100 + b"\n1!\n", int("6" * 100)),
+])
+def test_last_vcd_timestamp(contents, ts, chunk_size):
+    """Test finding the last VCD timestamp by scanning from end of file."""
+    assert _last_vcd_timestamp(io.BytesIO(contents), chunk_size) == ts
+
+
+def test_fsm_states():
+    """Test finding the states of m.FSM() state signals, however wide."""
+    from amaranth import Module, Signal
+
+    m = Module()
+    with m.FSM() as fsm:
+        with m.State("IDLE"):
+            m.next = "BUSY"
+        with m.State("BUSY"):
+            m.next = "IDLE"
+    assert _fsm_states(fsm._data["signal"]) == ["IDLE", "BUSY"]
+
+    # Would take forever to decode every value.
+    wide = Signal(64, name="wide_state", decoder=lambda n: f"S/{n}")
+    assert _fsm_states(wide) is None
+
+
+def test_sim_coverage(pytester):
+    """Test toggle and FSM coverage, merged across tests and sessions."""
+    pytester.copy_example("test_inject.py")
+    pytester.makepyfile(
+        """
+        # amaranth: UnusedElaboratable=no
+        import pytest
+        from amaranth import Elaboratable, Module, Signal
+        from test_inject import Adder, adder_vector
+
+        class Blinker(Elaboratable):
+            def __init__(self):
+                self.go = Signal()
+                self.led = Signal()
+
+            def elaborate(self, plat):
+                m = Module()
+                with m.FSM():
+                    with m.State("IDLE"):
+                        with m.If(self.go):
+                            m.next = "ON"
+                    with m.State("ON"):
+                        m.d.sync += self.led.eq(1)
+                        m.next = "OFF"
+                    with m.State("OFF"):
+                        m.d.sync += self.led.eq(0)
+                        m.next = "IDLE"
+                return m
+
+        @pytest.mark.parametrize("mod,clks", [(Adder(4), 1.0 / 12e6)])
+        @pytest.mark.parametrize("a,b,o", [(1, 2, 3), (6, 8, 14)])
+        def test_adder(sim, mod, a, b, o):
+            async def testbench(ctx):
+                await adder_vector(ctx, mod, a, b, o)
+                await adder_vector(ctx, mod, 0, 0, 0)
+
+            sim.run(testbenches=[testbench])
+
+        @pytest.mark.parametrize("mod,clks", [(Blinker(), 1.0 / 12e6)])
+        def test_blinker(sim, mod, request):
+            async def testbench(ctx):
+                ctx.set(mod.go, request.config.getoption("go"))
+                await ctx.tick().repeat(3)
+
+            sim.run(testbenches=[testbench])
+    """
+    )
+    pytester.makeconftest(
+        """
+        def pytest_addoption(parser):
+            parser.addoption("--go", type=int, default=0)
+    """
+    )
+
+    result = pytester.runpytest("test_sim_coverage.py", "--sim-coverage")
+    result.assert_outcomes(passed=3)
+    result.stdout.fnmatch_lines_random([
+        "*simulation coverage*",
+        # 3 bits of a, 2 of b, 4 of o, and the clock.
+        "test_inject.Adder: 10/15 bits toggled",
+        "test_sim_coverage.Blinker: 1/6 bits toggled, 1/3 FSM states",
+        "coverage written to sim-coverage.json",
+    ])
+
+    report = json.loads((pytester.path / "sim-coverage.json").read_text())
+    adder = report["designs"]["test_inject.Adder"]["toggle"]
+    # 1 | 6 rose, and fell back to 0.
+    assert adder["top.a"] == {"width": 4, "rose": "0x7", "fell": "0x7"}
+    blinker = report["designs"]["test_sim_coverage.Blinker"]["fsm"]
+    assert blinker["top.fsm_state"] == {"states": ["IDLE", "ON", "OFF"],
+                                    "visited": "0x1"}
+
+    # A second session adds to the same file.
+    result = pytester.runpytest("test_sim_coverage.py", "--sim-coverage",
+                                "-k", "blinker", "--go=1")
+    result.assert_outcomes(passed=1, deselected=2)
+    result.stdout.fnmatch_lines_random([
+        "test_inject.Adder: 10/15 bits toggled",
+        # go is never cleared.
+        "test_sim_coverage.Blinker: 4/6 bits toggled, 3/3 FSM states",
+    ])
+
+
+def test_sim_shard(pytester):
+    """Test recording durations, and ordering and sharding tests by them."""
+    pytester.copy_example("test_mul.py")
+    durations = pytester.path / ".pytest_cache/v/amaranth-sim/durations"
+
+    # Durations are only recorded when they are used.
+    result = pytester.runpytest("-k", "test_basic")
+    assert result.ret == 0
+    assert not durations.exists()
+
+    result = pytester.runpytest("-k", "test_basic", "--sim-longest-first")
+    assert result.ret == 0
+    recorded = json.loads(durations.read_text())
+    entry = next(e for (nodeid, e) in recorded.items()
+                 if "test_basic" in nodeid)
+    assert entry["duration"] >= entry["elaborate"] + entry["run"] > 0
+
+    pytester.makepyfile(test_sched="""
+        def test_a(): pass
+        def test_b(): pass
+        def test_c(): pass
+        def test_d(): pass
+        def test_e(): pass
+    """)
+    fake = json.dumps({
+        f"test_sched.py::test_{name}": {"duration": duration}
+        for (name, duration) in zip("abcde", [1, 5, 3, 4, 2])})
+
+    # Each session records the real durations, so fake them every time.
+    durations.write_text(fake)
+    result = pytester.runpytest("test_sched.py", "-v", "--sim-longest-first")
+    result.stdout.fnmatch_lines([
+        "*::test_b PASSED*", "*::test_d PASSED*", "*::test_c PASSED*",
+        "*::test_e PASSED*", "*::test_a PASSED*",
+    ])
+
+    # Longest processing time first: b and d start the two shards, then c,
+    # e, and a each go to the shard with the lowest total.
+    durations.write_text(fake)
+    result = pytester.runpytest("test_sched.py", "-v", "--sim-shard=1/2",
+                                "--sim-longest-first")
+    result.assert_outcomes(passed=3, deselected=2)
+    result.stdout.fnmatch_lines([
+        "amaranth-sim: shard 1/2: 3 of 5 tests, estimated 8.0s of 15.0s",
+        "*::test_b PASSED*", "*::test_e PASSED*", "*::test_a PASSED*",
+    ])
+
+    durations.write_text(fake)
+    result = pytester.runpytest("test_sched.py", "-v", "--sim-shard=2/2")
+    result.assert_outcomes(passed=2, deselected=3)
+    result.stdout.fnmatch_lines(["*::test_c PASSED*", "*::test_d PASSED*"])
+
+    # Durations of removed tests and files are dropped, but not those of
+    # deselected tests, or of files that weren't collected.
+    durations.write_text(json.dumps({
+        **json.loads(fake),
+        "test_sched.py::test_gone": {"duration": 1},
+        "test_gone.py::test_a": {"duration": 1},
+        "test_mul.py::test_basic": {"duration": 1},
+    }))
+    result = pytester.runpytest("test_sched.py", "-k", "test_a",
+                                "--sim-longest-first")
+    result.assert_outcomes(passed=1, deselected=4)
+    recorded = json.loads(durations.read_text())
+    assert "test_sched.py::test_gone" not in recorded
+    assert "test_gone.py::test_a" not in recorded
+    assert "test_sched.py::test_b" in recorded
+    assert "test_mul.py::test_basic" in recorded
+
+    result = pytester.runpytest("--sim-shard=3/2")
+    assert result.ret == 4
+    result.stderr.fnmatch_lines(["*--sim-shard*between 1 and N*"])
+
+
+def test_design(pytester):
+    """Test that Designs are built on setup, shared, and released."""
+    pytester.copy_example("test_inject.py")
+    pytester.makepyfile(
+        """
+        # amaranth: UnusedElaboratable=no
+        import gc
+        import weakref
+        import pytest
+        from pytest_amaranth_sim import Design
+        from test_inject import Adder, adder_vector
+
+        built = []
+        refs = []
+
+        class Counted(Adder):
+            def __init__(self, width):
+                super().__init__(width)
+                built.append(width)
+                refs.append(weakref.ref(self))
+
+        @pytest.fixture
+        def tb(mod):
+            async def testbench(ctx):
+                await adder_vector(ctx, mod, 1, 2, 3)
+
+            return testbench
+
+        @pytest.mark.parametrize("mod", [Design(Counted, 4),
+                                         Design(Counted, 8),
+                                         Design(Counted, width=16)])
+        @pytest.mark.parametrize("clks", [1.0 / 12e6])
+        @pytest.mark.parametrize("n", [0, 1])
+        def test_first(sim, tb, mod, n):
+            assert isinstance(mod, Counted)
+            sim.run(testbenches=[tb])
+
+        @pytest.mark.parametrize("mod", [Design(Counted, 4)])
+        @pytest.mark.parametrize("clks", [1.0 / 12e6])
+        def test_second(sim, tb, mod):
+            assert isinstance(mod, Counted)
+            sim.run(testbenches=[tb])
+
+        def test_zz_built():
+            # The 4-bit designs of both tests were shared, and every design
+            # was released after its last test.
+            assert sorted(built) == [4, 8]
+            gc.collect()
+            assert all(r() is None for r in refs)
+    """
+    )
+
+    result = pytester.runpytest("test_design.py", "-v", "-k", "not counted2",
+                                "-o", "cache_simulators=true")
+    result.assert_outcomes(passed=6, deselected=2)
+    result.stdout.fnmatch_lines_random([
+        "*::test_first[[]0-12.00-counted0[]] PASSED*",
+        "*::test_first[[]1-12.00-counted1[]] PASSED*",
+        "*::test_second[[]12.00-counted[]] PASSED*",
+    ])
+
+
+def test_lazy_amaranth_import(pytester):
+    """Test that tests which don't simulate don't import amaranth."""
+    pytester.makepyfile(
+        """
+        import sys
+        import pytest
+
+        @pytest.mark.parametrize("mod,clks", [(1, 1.0 / 12e6)])
+        def test_plain(mod, clks):
+            assert not [m for m in sys.modules if m.startswith("amaranth")]
+    """
+    )
+
+    result = pytester.runpytest_subprocess("-v")
+    result.assert_outcomes(passed=1)
+    result.stdout.fnmatch_lines(["*::test_plain[[]1-12.00[]] PASSED*"])
+
+
+def test_cache_simulators(pytester):
+    """Test that simulators are reused between tests sharing mod/clks."""
+    pytester.makeini("""
+        [pytest]
+        cache_simulators = true
+    """)
+    pytester.copy_example("test_inject.py")
+    pytester.makepyfile(
+        """
+        # amaranth: UnusedElaboratable=no
+        import pytest
+        from pytest_amaranth_sim import Testbench
+        from test_inject import Adder
+
+        adders = [Adder(4), Adder(8)]
+        seen = {}
+
+        @pytest.mark.parametrize("mod", adders[:1])
+        @pytest.mark.parametrize("clks", [1.0 / 12e6])
+        def test_suspended(sim, mod):
+            # Leaves the background testbench suspended in tick().repeat(),
+            # which the next test using this simulator must clean up.
+            async def background(ctx):
+                while True:
+                    await ctx.tick().repeat(3)
+
+            async def testbench(ctx):
+                await ctx.tick().repeat(2)
+
+            sim.run(testbenches=[Testbench(background, background=True),
+                                 testbench])
+
+        @pytest.mark.parametrize("n", [0, 1, 2])
+        @pytest.mark.parametrize("mod", adders)
+        @pytest.mark.parametrize("clks", [1.0 / 12e6])
+        def test_reuse(sim, mod, n):
+            async def testbench(ctx):
+                # Every test must start from the initial state.
+                assert ctx.get(mod.o) == 0
+                ctx.set(mod.a, n + 1)
+                await ctx.tick().repeat(2)
+                assert ctx.get(mod.o) == n + 1
+
+            seen.setdefault(mod.width, set()).add(id(sim.sim))
+            sim.run(testbenches=[testbench])
+
+        def test_seen():
+            assert {w: len(s) for (w, s) in seen.items()} == {4: 1, 8: 1}
+    """
+    )
+
+    result = pytester.runpytest("-v")
+
+    result.assert_outcomes(passed=15, skipped=1)
+
+
 # Below this line, we _want_ these tests to fail!
 def test_comb_testbench_fail(pytester, file_exists):
     """Test combinational and sync testbenches without clks decorator."""
@@ -256,9 +1736,6 @@ def test_comb_testbench_fail(pytester, file_exists):
     # trigger an Amaranth error at pytest setup time; test_mul.py by itself
     # cannot catch this. Since test_mul is meant to be an example, create a
     # new file to test this case.
-    #
-    # TODO: when https://github.com/amaranth-lang/amaranth/issues/442 is
-    # solved, we can move test_comb_tb[*reg-mul*] to this file too.
     pytester.makepyfile(
         """
         # amaranth: UnusedElaboratable=no
@@ -282,7 +1759,7 @@ def test_comb_testbench_fail(pytester, file_exists):
     # fnmatch_lines does an assertion internally
     result.stdout.fnmatch_lines([
         "*::test_comb_tb[[]*clock-setup-error[]] ERROR*",
-        "*::test_comb_tb[[]*reg-mul[]] SKIPPED*",
+        "*::test_comb_tb[[]*reg-mul[]] PASSED*",
         "*::test_comb_tb[[]*mul-pass[]] PASSED*",
     ])
 
@@ -320,7 +1797,12 @@ def test_user_forgot_override_mod(pytester, file_exists):
     assert not file_exists("*.gtkw")
 
 
-def test_vcd_not_truncated(pytester, file_exists, monkeypatch):
+@pytest.mark.parametrize("vcds,ext,opener", [
+    pytest.param("--vcds", ".vcd", open, id="vcd"),
+    pytest.param("--vcds-format=gz", ".vcd.gz", gzip.open, id="gz"),
+])
+def test_vcd_not_truncated(pytester, file_exists, monkeypatch, vcds, ext,
+                           opener):
     """Test that VCD files are not truncated on assertion failure."""
     pytester.makeini("""
         [pytest]
@@ -358,17 +1840,17 @@ def test_vcd_not_truncated(pytester, file_exists, monkeypatch):
     """  # noqa: E501
     )
 
-    result = pytester.runpytest("-v", "--vcds", "-s")
+    result = pytester.runpytest("-v", vcds, "-s")
 
     assert result.ret == 1
 
-    assert file_exists("test_vcd_truncation[[]good-sync[]].vcd")
+    assert file_exists(f"test_vcd_truncation[[]good-sync[]]{ext}")
     assert file_exists("test_vcd_truncation[[]good-sync[]].gtkw")
-    assert file_exists("test_vcd_truncation[[]bad-sync[]].vcd")
+    assert file_exists(f"test_vcd_truncation[[]bad-sync[]]{ext}")
     assert file_exists("test_vcd_truncation[[]bad-sync[]].gtkw")
 
-    with open("test_vcd_truncation[good-sync].vcd", "rb") as gfp, \
-         open("test_vcd_truncation[bad-sync].vcd", "rb") as bfp:
+    with opener(f"test_vcd_truncation[good-sync]{ext}", "rb") as gfp, \
+         opener(f"test_vcd_truncation[bad-sync]{ext}", "rb") as bfp:
         good_tokens = tokenize(gfp)
         bad_tokens = tokenize(bfp)
 
@@ -394,3 +1876,55 @@ def test_vcd_not_truncated(pytester, file_exists, monkeypatch):
         assert gt.kind == bt.kind
         assert bt.kind == TokenKind.CHANGE_TIME
         assert bt.time_change == last_bt_ts + 1000
+
+
+def test_vcd_index_not_truncated(pytester, file_exists, monkeypatch):
+    """Test that failing VCDs with an index are extended using the index."""
+    pytester.makeini("""
+        [pytest]
+        extend_vcd_time = 1000
+        vcd_index = 16
+    """)
+    pytester.makepyfile(
+        """
+        # amaranth: UnusedElaboratable=no
+        import pytest
+        from amaranth import Module, Signal
+
+        m = Module()
+        a = Signal(4)
+
+        m.d.sync += a.eq(a + 1)
+
+        @pytest.mark.parametrize("mod,clks", [pytest.param(m, 1.0 / 12e6, id="sync")])
+        def test_index_truncation(sim):
+            async def testbench(ctx):
+                await ctx.tick().repeat(16)
+                assert False
+
+            sim.run(testbenches=[testbench])
+    """  # noqa: E501
+    )
+
+    def no_scan(fp, chunk_size=4096):
+        raise AssertionError("the VCD was scanned instead of its index")
+
+    monkeypatch.setattr("pytest_amaranth_sim.plugin._last_vcd_timestamp",
+                        no_scan)
+    result = pytester.runpytest("-v", "--vcds")
+
+    result.assert_outcomes(failed=1)
+    result.stdout.no_fnmatch_line("*scanned instead of its index*")
+    assert file_exists("test_index_truncation[[]sync[]].vcd.idx")
+
+    with open("test_index_truncation[sync].vcd", "rb") as fp:
+        contents = fp.read()
+    times = [t.time_change for t in tokenize(io.BytesIO(contents))
+             if t.kind == TokenKind.CHANGE_TIME]
+    # The VCD is extended past its last timestamp by a trailing timestamp.
+    assert times[-1] == times[-2] + 1000
+    assert contents.endswith(f"\n#{times[-1]}\n".encode())
+
+    # The index follows the extended VCD.
+    idx = VCDIndex("test_index_truncation[sync].vcd")
+    assert idx.end == times[-1]